@@ -3,5 +3,8 @@ Importe les routes définies dans views.py.
 Cette structure permet de séparer logique de l’application et exécution.'''
 
 from flask import Flask
+from app.response_layer import install_response_layer
 app= Flask(__name__)
-from app import views
\ No newline at end of file
+# Compression, ETag / 304 et fragments de templates pré-rendus (avant les hooks de views.py)
+response_layer = install_response_layer(app)
+from app import views
@@ -1,9 +1,15 @@
+import atexit
 import sqlite3
 from flask_bcrypt import Bcrypt
+from common.sqlite_pool import SQLitePool
 
 # Nom du fichier de la base de données SQLite
 DATABASE_NAME = 'users.db'
 
+# Pool de connexions réutilisées (WAL activé), fermé proprement à l'arrêt
+db_pool = SQLitePool(DATABASE_NAME)
+atexit.register(db_pool.close_all)
+
 # Initialisation de Bcrypt (doit être initialisé avec l'application Flask)
 # Dans ce module, on le définit comme None et on le passe par initialisation.
 bcrypt = None 
@@ -15,62 +21,49 @@ def init_db(app):
     bcrypt = Bcrypt(app)
     
     # 2. Créer la table si elle n'existe pas
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # La table 'users' stocke l'username et le HASH du mot de passe
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        # La table 'users' stocke l'username et le HASH du mot de passe
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL
+            )
+        ''')
+        conn.commit()
 
 def get_db_connection():
-    """Crée et retourne une connexion à la base de données."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    # Permet d'accéder aux colonnes par leur nom (comme un dictionnaire)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Emprunte une connexion au pool (à utiliser avec `with`).
+    Les lignes sont des sqlite3.Row : accès aux colonnes par leur nom."""
+    return db_pool.connection()
 
 # --- Fonctions CRUD pour les utilisateurs ---
 
 def add_user(username, password):
     """Ajoute un nouvel utilisateur avec mot de passe haché."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Hacher le mot de passe avant de l'enregistrer
     # Le .decode('utf-8') est nécessaire car generate_password_hash retourne des bytes
     hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
     
-    try:
-        cursor.execute(
-            "INSERT INTO users (username, password_hash) VALUES (?, ?)", 
-            (username, hashed_password)
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        # Erreur si l'utilisateur existe déjà (UNIQUE NOT NULL constraint)
-        return False
-    finally:
-        conn.close()
+    with get_db_connection() as conn:
+        try:
+            conn.execute(
+                "INSERT INTO users (username, password_hash) VALUES (?, ?)", 
+                (username, hashed_password)
+            )
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            # Erreur si l'utilisateur existe déjà (UNIQUE NOT NULL constraint)
+            return False
 
 def get_user_by_username(username):
     """Récupère un utilisateur (username et hash) par son nom."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT username, password_hash FROM users WHERE username = ?", 
-        (username,)
-    )
-    user = cursor.fetchone()
-    conn.close()
+    with get_db_connection() as conn:
+        user = conn.execute(
+            "SELECT username, password_hash FROM users WHERE username = ?", 
+            (username,)
+        ).fetchone()
     return user # Retourne un objet Row ou None
 
 def check_password(hashed_password, password):
@@ -0,0 +1,195 @@
+'''Couche de réponse du Front : compression négociée, revalidation et fragments pré-rendus.
+- gzip (ou brotli si le module `brotli` est installé) selon Accept-Encoding ; les corps compressés
+  sont gardés dans un petit cache LRU indexé par leur empreinte (une page identique n'est compressée qu'une fois),
+- pages HTML : ETag faible (empreinte du corps) et Cache-Control `private, no-cache` ; If-None-Match → 304
+  sans renvoyer ni compresser la page ; Last-Modified pour les pages entièrement statiques (login),
+- {% fragment "nom", clé %}...{% endfragment %} : bloc de template rendu une seule fois par valeur de clé
+  (ex. la liste des articles, par version du catalogue) ; seules les parties propres à l'utilisateur
+  sont rendues à chaque requête.'''
+
+# app/response_layer.py
+import datetime
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+try:
+    import brotli
+except ImportError:  # brotli optionnel : gzip seulement
+    brotli = None
+
+RESPONSE_LAYER_ENABLED = os.environ.get('FRONT_RESPONSE_LAYER', '1') != '0'    # 0 : pages servies comme avant
+COMPRESSION_ENABLED = os.environ.get('FRONT_COMPRESSION', '1') != '0'
+COMPRESSION_MIN_SIZE = int(os.environ.get('FRONT_COMPRESSION_MIN_SIZE', 512))     # octets
+GZIP_LEVEL = int(os.environ.get('FRONT_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('FRONT_BROTLI_QUALITY', 5))
+COMPRESSED_CACHE_SIZE = int(os.environ.get('FRONT_COMPRESSED_CACHE_SIZE', 256))   # corps compressés gardés
+FRAGMENT_CACHE_ENABLED = os.environ.get('FRONT_FRAGMENT_CACHE', '1') != '0'
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRONT_FRAGMENT_CACHE_SIZE', 64))
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/plain', 'text/css', 'application/json', 'application/javascript')
+
+
+def available_encodings():
+    """Encodages proposés, par ordre de préférence à qualité égale."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 : même entrée, mêmes octets (corps réutilisables d'une requête à l'autre)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class LRUCache:
+    """Dictionnaire borné thread-safe (éviction du moins récemment utilisé)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(self, key, create):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        # Calcul hors verrou : deux requêtes simultanées peuvent calculer la même valeur
+        value = create()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+class FragmentCacheExtension(Extension):
+    """{% fragment "nom", clé... %} ... {% endfragment %} : bloc rendu une fois par (nom, clé...)."""
+
+    tags = {'fragment'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=LRUCache(FRAGMENT_CACHE_SIZE), fragment_cache_enabled=FRAGMENT_CACHE_ENABLED)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endfragment',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(key)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        if not self.environment.fragment_cache_enabled:
+            return caller()
+        return self.environment.fragment_cache.get_or_create(tuple(key), caller)
+
+
+class ResponseLayer:
+    def __init__(self, app, enabled=RESPONSE_LAYER_ENABLED, compression=COMPRESSION_ENABLED):
+        self.app = app
+        self.enabled = enabled
+        self.compression = enabled and compression
+        self.compressed = LRUCache(COMPRESSED_CACHE_SIZE)
+        self.not_modified = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+        self._static_pages = {}
+
+    def render_static(self, template_name):
+        """Page sans partie variable : rendue une fois par version du fichier, avec Last-Modified."""
+        from flask import make_response, render_template
+        if not self.enabled:
+            return make_response(render_template(template_name))
+        path = os.path.join(self.app.root_path, self.app.template_folder, template_name)
+        mtime = int(os.stat(path).st_mtime)
+        cached = self._static_pages.get(template_name)
+        if cached is None or cached[0] != mtime:
+            cached = self._static_pages[template_name] = (mtime, render_template(template_name))
+        response = make_response(cached[1])
+        response.last_modified = datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc)
+        return response
+
+    def finalize(self, response):
+        """after_request : ETag / 304 puis compression (dernier hook exécuté)."""
+        from flask import request
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers):
+            return response
+
+        if self.compression:
+            response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        if response.mimetype == 'text/html' and request.method in ('GET', 'HEAD'):
+            response.set_etag(digest, weak=True)
+            response.headers.setdefault('Cache-Control', 'private, no-cache')
+            if self._is_fresh(request, response, digest):
+                with self._lock:
+                    self.not_modified += 1
+                response.status_code = 304
+                response.set_data(b'')
+                for header in ('Content-Type', 'Content-Length'):
+                    response.headers.pop(header, None)
+                return response
+
+        if not self.compression:
+            return response
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+            return response
+        data = self.compressed.get_or_create((digest, encoding), lambda: compress(body, encoding))
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        with self._lock:
+            self.bytes_in += len(body)
+            self.bytes_out += len(data)
+        return response
+
+    @staticmethod
+    def _is_fresh(request, response, digest):
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(digest)
+        # Last-Modified n'est posé que sur les pages entièrement statiques
+        since = request.if_modified_since
+        return since is not None and response.last_modified is not None and response.last_modified <= since
+
+    def stats(self):
+        with self._lock:
+            stats = {"enabled": self.enabled, "compression": self.compression, "not_modified": self.not_modified,
+                     "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+        stats["compressed_cache"] = self.compressed.stats()
+        stats["fragment_cache"] = dict(self.app.jinja_env.fragment_cache.stats(),
+                                       enabled=self.app.jinja_env.fragment_cache_enabled)
+        return stats
+
+
+def install_response_layer(app, enabled=RESPONSE_LAYER_ENABLED, compression=COMPRESSION_ENABLED):
+    """Branche la couche de réponse ; à appeler avant les autres hooks after_request
+    (Flask les exécute dans l'ordre inverse : celui-ci passe en dernier)."""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    layer = ResponseLayer(app, enabled=enabled, compression=compression)
+    if enabled:
+        app.after_request(layer.finalize)
+    else:
+        app.jinja_env.fragment_cache_enabled = False
+    app.extensions['response_layer'] = layer
+    return layer
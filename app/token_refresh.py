@@ -0,0 +1,149 @@
+'''Rafraîchissement anticipé des tokens d'accès du Front.
+- l'expiration (`exp`, `iat`) est lue localement dans le token (sans vérifier la signature :
+  elle ne sert qu'à choisir le moment du refresh, le Gateway reste seul juge),
+- dans la dernière fraction de sa durée de vie (REFRESH_AHEAD_RATIO), le token est encore utilisé et
+  un refresh part en tâche de fond ; le nouveau token est remis à la requête suivante de la session,
+- s'il expire dans moins de MIN_VALIDITY secondes (ou du quart de cette fenêtre pour un token très court),
+  le refresh est fait avant l'appel,
+- un seul refresh à la fois par session (clé = empreinte du refresh token) : les requêtes simultanées
+  attendent le même résultat au lieu d'appeler l'Auth Service chacune.
+Le 401 du Gateway reste possible (token révoqué, horloges décalées) mais devient un cas rare.'''
+
+# app/token_refresh.py
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+REFRESH_AHEAD_RATIO = float(os.environ.get('FRONT_TOKEN_REFRESH_AHEAD_RATIO', 0.2))
+MIN_VALIDITY = float(os.environ.get('FRONT_TOKEN_MIN_VALIDITY', 5))          # secondes
+REFRESH_WORKERS = int(os.environ.get('FRONT_TOKEN_REFRESH_WORKERS', 4))
+REFRESHED_CACHE_SIZE = int(os.environ.get('FRONT_TOKEN_REFRESHED_CACHE_SIZE', 10000))
+
+# Refresh token refusé par l'Auth Service (session révoquée ou expirée)
+REJECTED = object()
+
+
+def token_claims(token):
+    """Claims d'un JWT sans vérification de signature ; {} si le token est illisible."""
+    try:
+        payload = token.split('.')[1]
+        return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (AttributeError, IndexError, TypeError, ValueError):
+        return {}
+
+
+def refresh_key(refresh_token):
+    return hashlib.sha256(refresh_token.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TokenRefresher:
+    """refresh_fn(refresh_token) -> nouveau token d'accès, ou None si le refresh token est refusé
+    (une erreur réseau remonte en exception et n'est pas mémorisée)."""
+
+    def __init__(self, refresh_fn, ahead_ratio=REFRESH_AHEAD_RATIO, min_validity=MIN_VALIDITY,
+                 workers=REFRESH_WORKERS, cache_size=REFRESHED_CACHE_SIZE):
+        self.refresh_fn = refresh_fn
+        self.ahead_ratio = ahead_ratio
+        self.min_validity = min_validity
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='token-refresh')
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._refreshed = OrderedDict()   # clé -> dernier token obtenu (ou REJECTED)
+        self.background = 0
+        self.synchronous = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def _run(self, key, refresh_token, call):
+        try:
+            call.result = self.refresh_fn(refresh_token)
+        except Exception as e:  # tâche de fond : l'erreur est rendue aux requêtes qui attendent ce refresh
+            call.error = e
+        with self._lock:
+            self._inflight.pop(key, None)
+            if call.error is not None:
+                self.failures += 1
+            else:
+                self.rejected += call.result is None
+                self._refreshed[key] = call.result if call.result is not None else REJECTED
+                self._refreshed.move_to_end(key)
+                while len(self._refreshed) > self.cache_size:
+                    self._refreshed.popitem(last=False)
+        call.done.set()
+
+    def _join(self, key, refresh_token, background):
+        """Refresh en cours pour cette session, ou nouveau refresh (lancé en tâche de fond ou ici)."""
+        with self._lock:
+            call = self._inflight.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call
+            call = self._inflight[key] = _Call()
+            if background:
+                self.background += 1
+            else:
+                self.synchronous += 1
+        if background:
+            self._executor.submit(self._run, key, refresh_token, call)
+        else:
+            self._run(key, refresh_token, call)
+        return call
+
+    def refresh(self, refresh_token, timeout=None):
+        """Nouveau token d'accès (refresh partagé avec les requêtes simultanées), ou None si refusé.
+        Lève l'erreur réseau du refresh, ou TimeoutError si le refresh en cours n'aboutit pas à temps."""
+        key = refresh_key(refresh_token)
+        call = self._join(key, refresh_token, background=False)
+        if not call.done.wait(timeout):
+            raise TimeoutError("Refresh du token toujours en cours.")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def access_token(self, access_token, refresh_token, timeout=None):
+        """Token à utiliser pour un appel : le plus récent connu, rafraîchi si nécessaire.
+        None : session à reconnecter (refresh refusé alors que le token a expiré)."""
+        if not refresh_token:
+            return access_token
+        key = refresh_key(refresh_token)
+        with self._lock:
+            known = self._refreshed.get(key)
+        if known is not None and known is not REJECTED:
+            if token_claims(known).get('exp', 0) > token_claims(access_token).get('exp', 0):
+                access_token = known
+
+        claims = token_claims(access_token)
+        exp = claims.get('exp')
+        if exp is None:
+            return access_token
+        remaining = exp - time.time()
+        lifetime = exp - claims.get('iat', exp - remaining)
+        # Tokens très courts : le seuil reste nettement sous la fenêtre de refresh anticipé
+        if remaining <= min(self.min_validity, lifetime * self.ahead_ratio / 4):
+            if known is REJECTED:
+                return None
+            return self.refresh(refresh_token, timeout=timeout)
+        if remaining <= lifetime * self.ahead_ratio and known is not REJECTED:
+            # Déjà en cours pour cette session : rejoint le même refresh
+            self._join(key, refresh_token, background=True)
+        return access_token
+
+    def stats(self):
+        with self._lock:
+            return {"background": self.background, "synchronous": self.synchronous,
+                    "coalesced": self.coalesced, "failures": self.failures, "rejected": self.rejected,
+                    "in_flight": len(self._inflight), "cached": len(self._refreshed)}
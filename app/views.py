@@ -1,15 +1,85 @@
 # app/views.py
-from app import app
-from flask import render_template, request, redirect, url_for, session
-import requests
+import os
+from urllib.parse import quote
+from app import app, response_layer
+from flask import render_template, request, redirect, url_for, session, jsonify
+from common.upstream import configure_upstream, upstream_stats, UPSTREAM_ERRORS, LONG_POLL_POOL_SIZE
+from common.metrics import REGISTRY, instrument_flask
+from common.catalog import CatalogError, catalog_stats, get_catalog
+from app.token_refresh import TokenRefresher
+from common import deadline, tracing
 
 # ---------------------------
 # CONFIGURATION DES SERVICES
 # ---------------------------
-GATEWAY_URL = "http://localhost:5003/api/orders"
-AUTH_LOGIN_URL = "http://localhost:5002/auth/login"
-AUTH_REGISTER_URL = "http://localhost:5002/auth/register"
-AUTH_REFRESH_URL = "http://localhost:5002/auth/refresh"
+# Adresses modifiables par variables d'environnement (ex. pour les benchmarks)
+GATEWAY_URL = os.environ.get('GATEWAY_URL', "http://localhost:5003")
+AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', "http://localhost:5002")
+
+GATEWAY_ORDERS_PATH = "/api/orders"
+GATEWAY_ORDER_STATUS_PATH = "/api/orders/{order_id}/status"
+AUTH_LOGIN_PATH = "/auth/login"
+AUTH_REGISTER_PATH = "/auth/register"
+AUTH_REFRESH_PATH = "/auth/refresh"
+
+# Clients keep-alive partagés par toutes les requêtes du front
+auth_client = configure_upstream('auth', AUTH_SERVICE_URL)
+gateway_client = configure_upstream('gateway', GATEWAY_URL)
+# Suivi du paiement (long-poll) : pool à part, pour ne pas bloquer les autres appels au Gateway
+gateway_status_client = configure_upstream('gateway_status', GATEWAY_URL, pool_size=LONG_POLL_POOL_SIZE)
+# Attente maximale d'un appel de suivi (secondes) : la page d'achat rappelle tant que le paiement est en cours
+STATUS_POLL_WAIT = float(os.environ.get('FRONT_STATUS_POLL_WAIT', 5))
+
+# Latence par route et par appel (front -> gateway / auth) : GET /metrics
+instrument_flask(app, 'front')
+# X-Request-ID propagé, Server-Timing par saut, traces échantillonnées (TRACE_FILE)
+tracing.instrument_flask(app, 'front')
+# Délai maximal d'une page (secondes), transmis au Gateway et à l'Auth Service
+REQUEST_TIMEOUT = float(os.environ.get('FRONT_REQUEST_TIMEOUT', 15))
+deadline.instrument_flask(app, REQUEST_TIMEOUT)
+REGISTRY.register_stats('upstream', upstream_stats)
+REGISTRY.register_stats('front_catalog', catalog_stats)
+REGISTRY.register_stats('front_response', response_layer.stats)
+
+
+@app.context_processor
+def inject_catalog():
+    # Articles et prix affichés : même table que celle utilisée par le Orders Service
+    return {'catalog': get_catalog()}
+
+
+class RefreshUnavailable(Exception):
+    """L'Auth Service n'a pas pu traiter le refresh (5xx) : la session n'est pas en cause."""
+
+
+def call_auth_refresh(refresh_token):
+    """Nouveau token d'accès, ou None si le refresh token est refusé (session à reconnecter)."""
+    r = auth_client.post(AUTH_REFRESH_PATH, json={'refresh_token': refresh_token})
+    if r.status_code == 200:
+        return r.json().get('access_token')
+    if r.status_code < 500:
+        return None
+    raise RefreshUnavailable(f"Auth Service : {r.status_code}")
+
+
+# Refresh anticipé des tokens d'accès, un seul à la fois par session
+token_refresher = TokenRefresher(call_auth_refresh)
+REFRESH_ERRORS = UPSTREAM_ERRORS + (RefreshUnavailable, TimeoutError)
+REGISTRY.register_stats('front_token_refresh', token_refresher.stats)
+ORDER_UNAUTHORIZED = REGISTRY.counter(
+    'front_order_unauthorized_total', "Commandes refusées en 401 par le Gateway malgré le refresh anticipé.")
+
+
+def session_access_token():
+    """Token d'accès de la session, rafraîchi avant son expiration ; None si la session doit se reconnecter.
+    Lève REFRESH_ERRORS si un refresh indispensable n'a pas pu être fait."""
+    token = session.get('token')
+    fresh = token_refresher.access_token(token, session.get('refresh_token'), timeout=deadline.remaining())
+    if fresh is None:
+        session.pop('token', None)
+    elif fresh != token:
+        session['token'] = fresh
+    return fresh
 
 
 # Clé secrète Flask pour la session (stockage temporaire du token)
@@ -40,18 +110,18 @@ def login():
         # --- INSCRIPTION ---
         if action == 'register':
             try:
-                r = requests.post(AUTH_REGISTER_URL, json={'username': username, 'password': password})
+                r = auth_client.post(AUTH_REGISTER_PATH, json={'username': username, 'password': password})
                 if r.status_code == 201:
                     msg = "✅ Inscription réussie. Connectez-vous maintenant."
                     return render_template('login.html', error=msg)
                 else:
                     return render_template('login.html', error=r.json().get('message', 'Erreur d’inscription.'))
-            except requests.exceptions.ConnectionError:
+            except UPSTREAM_ERRORS:
                 return render_template('login.html', error="⚠️ Auth Service indisponible (port 5002).")
 
         # --- CONNEXION ---
         try:
-            r = requests.post(AUTH_LOGIN_URL, json={'username': username, 'password': password})
+            r = auth_client.post(AUTH_LOGIN_PATH, json={'username': username, 'password': password})
             if r.status_code == 200:
                 token = r.json().get('access_token')
                 session['token'] = token  # stocke le JWT dans la session Flask
@@ -60,11 +130,11 @@ def login():
                 return redirect(url_for('accueil', user=username))
             else:
                 return render_template('login.html', error="❌ Identifiants incorrects.")
-        except requests.exceptions.ConnectionError:
+        except UPSTREAM_ERRORS:
             return render_template('login.html', error="⚠️ Auth Service indisponible (port 5002).")
 
-    # --- GET : afficher la page ---
-    return render_template('login.html')
+    # --- GET : afficher la page (statique : rendue une fois, Last-Modified / 304) ---
+    return response_layer.render_static('login.html')
 
 
 # ==========================
@@ -77,6 +147,11 @@ def accueil():
     """
     user = request.args.get('user') or session.get('user')
     token = session.get('token')
+    if token:
+        try:
+            token = session_access_token()
+        except REFRESH_ERRORS:
+            pass  # la page reste affichable ; la commande retentera le refresh
 
     if not user or not token:
         return redirect(url_for('login'))
@@ -102,97 +177,152 @@ def submit_order(user):
     token = request.form.get('user_token') or session.get('token')
 
     # --- 1. Construire la liste des articles sélectionnés ---
-    articles = {
-        'Fraises (barquette de 250g)': 2.50,
-        'Haricots (kg)': 1.80,
-        'Laine': 4.00,
-        'Pêches (kg)': 3.00,
-        'Pastèques': 4.00,
-        'Paquet de pâtes': 1.20,
-        'Cookies': 2.00
-    }
-
-    items = []
-    for nom, prix in articles.items():
-        qte = int(request.form.get(nom, 0))
+    # Le Gateway ne reçoit que les identifiants et les quantités : les prix sont
+    # recalculés par le Orders Service à partir du même catalogue
+    catalog = get_catalog()
+    cart = []
+    for product in catalog.products:
+        try:
+            qte = int(request.form.get(product.id, 0))
+        except ValueError:
+            qte = 0
         if qte > 0:
-            items.append({
-                'article': nom,
-                'quantity': qte,
-                'unit_price': prix,
-                'total_price': round(prix * qte, 2)
-            })
-
-    if not items:
+            cart.append({'article_id': product.id, 'quantity': qte})
+
+    if not cart:
         return render_template('accueil.html', user=user, token=token,
                                error_message="Veuillez sélectionner au moins un article.")
+    try:
+        items, _ = catalog.price_cart(cart)
+    except CatalogError as e:
+        return render_template('accueil.html', user=user, token=token, error_message=str(e))
 
-    # --- 2. Appeler le Gateway ---
+    # --- 2. Token à jour (refresh anticipé), puis appel au Gateway ---
     try:
-        headers = {'Authorization': f'Bearer {token}'} if token else {}
-        response = requests.post(GATEWAY_URL, json={'items': items}, headers=headers)
+        if session.get('token'):
+            token = session_access_token()
+            if token is None:
+                return render_template('achat.html', user=user, status='error_auth')
+        response = post_order(token, cart)
+
+        if response.status_code == 401 and session.get('refresh_token'):
+            # Cas rare (token révoqué, horloges décalées) : un refresh forcé puis un seul nouvel essai
+            ORDER_UNAUTHORIZED.inc()
+            token = token_refresher.refresh(session['refresh_token'], timeout=deadline.remaining())
+            if token is None:
+                session.pop('token', None)
+                return render_template('achat.html', user=user, status='error_auth')
+            session['token'] = token
+            response = post_order(token, cart)
+    except REFRESH_ERRORS:
+        # Gateway ou Auth Service injoignable
+        return render_template('achat.html', user=user, status='error_service', order_details=items)
 
-        # --- 3. Analyse de la réponse ---
-        if response.status_code in (200, 201):
-            try:
-                data = response.json()
-                # Si c’est une liste, on prend le premier élément
-                if isinstance(data, list) and len(data) > 0:
-                    data = data[0]
-                elif not isinstance(data, dict):
-                    data = {}
-
-                status = data.get('status', 'ok')
-            except Exception as e:
-                print("Erreur de parsing JSON :", e)
-                status = "error_internal"
-
-            return render_template('achat.html', user=user, status=status, order_details=items)
-
-
-        elif response.status_code == 401:
-            # Tentative de refresh
-            refresh_token = session.get('refresh_token')
-            r = requests.post(AUTH_REFRESH_URL, json={'refresh_token': refresh_token})
-            
-            if r.status_code == 200:
-                # Remplacer le token et réessayer
-                new_token = r.json().get('access_token')
-                session['token'] = new_token
+    # --- 3. Analyse de la réponse (commande acceptée : paiement suivi par la page d'achat) ---
+    status = order_status(response)
+    order_id = response.json().get('order_id') if status == 'pending_payment' else None
+    return render_template('achat.html', user=user, status=status, order_id=order_id, order_details=items)
 
-                headers = {'Authorization': f'Bearer {new_token}'}
-                response = requests.post(GATEWAY_URL, json={'items': items}, headers=headers)
 
-                if response.status_code in (200, 201):
-                    try:
-                        data = response.json()
-                        if isinstance(data, list) and len(data) > 0:
-                            data = data[0]
-                        elif not isinstance(data, dict):
-                            data = {}
+def post_order(token, cart):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    # Adresse du visiteur : le Gateway limite le débit par IP (le Front est un proxy de confiance)
+    headers['X-Forwarded-For'] = request.remote_addr
+    return gateway_client.post(GATEWAY_ORDERS_PATH, json={'items': cart}, headers=headers)
 
-                        status = data.get('status', 'ok')
-                    except Exception as e:
-                        print("Erreur de parsing JSON après refresh :", e)
-                        status = "error_internal"
 
-                    return render_template('achat.html', user=user, status=status, order_details=items)
+# Statut de paiement d'une commande -> statut affiché sur la page d'achat
+PAYMENT_STATUSES = {'pending': 'pending_payment', 'paid': 'ok', 'failed': 'error'}
 
-            else:
-                return render_template('achat.html', user=user, status='error_auth')
+
+def order_status(response):
+    """Statut affiché sur la page d'achat pour la réponse du Gateway."""
+    if response.status_code == 401:
+        return 'error_auth'
+    if response.status_code == 429:
+        # Limitation de débit du Gateway
+        return 'error_rate_limit'
+    if response.status_code == 404:
+        # Commande inconnue (ou d'un autre utilisateur)
+        return 'unknown'
+    if response.status_code not in (200, 201, 202):
+        # Autre erreur (service down, etc.)
+        return 'error_service'
+    try:
+        data = response.json()
+    except ValueError as e:
+        print("Erreur de parsing JSON :", e)
+        return 'error_internal'
+    # Si c’est une liste, on prend le premier élément
+    if isinstance(data, list) and len(data) > 0:
+        data = data[0]
+    elif not isinstance(data, dict):
+        data = {}
+    status = data.get('status', 'ok')
+    return PAYMENT_STATUSES.get(status, status)
 
 
-        else:
-            # Autre erreur (service down, etc.)
-            return render_template('achat.html', user=user, status='error_service', order_details=items)
+# ==========================
+# 4️⃣ SUIVI DU PAIEMENT
+# ==========================
 
-    except requests.exceptions.ConnectionError:
-        # Si le Gateway ne répond pas
-        return render_template('achat.html', user=user, status='error_service', order_details=items)
+#la commande est acceptée tout de suite ('pending') puis payée par le Orders Service :
+#achat.html interroge /commande/<id>/statut jusqu'à la fin du paiement, puis affiche /commande/<id>
+
+@app.route('/commande/<order_id>')
+def order_page(order_id):
+    """
+    Statut actuel d'une commande (page d'achat, sans attendre).
+    """
+    user = session.get('user')
+    if not user or not session.get('token'):
+        return redirect(url_for('login'))
+    status, order = fetch_order_status(order_id, wait=0)
+    return render_template('achat.html', user=user, status=status, order_id=order_id,
+                           order_details=order.get('items') if order else None)
+
+
+@app.route('/commande/<order_id>/statut')
+def order_status_poll(order_id):
+    """
+    Statut pour le script de la page d'achat : attend au plus STATUS_POLL_WAIT secondes la fin du paiement.
+    """
+    if not session.get('token'):
+        return jsonify({"status": "error_auth"}), 401
+    status, _ = fetch_order_status(order_id, wait=STATUS_POLL_WAIT)
+    return jsonify({"status": status}), 200, {'Cache-Control': 'no-store'}
+
+
+def fetch_order_status(order_id, wait):
+    """(statut affiché, commande ou None) d'après GET /api/orders/<order_id>/status du Gateway."""
+    try:
+        token = session_access_token()
+        if token is None:
+            return 'error_auth', None
+        response = gateway_status_client.get(
+            GATEWAY_ORDER_STATUS_PATH.format(order_id=quote(order_id, safe='')), params={'wait': wait},
+            headers={'Authorization': f'Bearer {token}', 'X-Forwarded-For': request.remote_addr})
+    except REFRESH_ERRORS:
+        return 'error_service', None
+    status = order_status(response)
+    if response.status_code != 200 or status == 'error_internal':
+        return status, None
+    return status, response.json()
+
+
+# ==========================
+# 5️⃣ STATISTIQUES DES POOLS
+# ==========================
+@app.route('/front/stats')
+def front_stats():
+    """
+    Utilisation des pools de connexions vers l'Auth Service et le Gateway.
+    """
+    return jsonify({"upstreams": upstream_stats()})
 
 
 # ==========================
-# 4️⃣ ROUTE PAR DÉFAUT
+# 6️⃣ ROUTE PAR DÉFAUT
 # ==========================
 @app.route('/')
 def index():
@@ -1,79 +1,259 @@
 '''Ce fichier implémente un microservice d’authentification en Flask qui :
 - gère l’inscription (/auth/register),
 - gère la connexion et renvoie un JWT (/auth/login),
-- valide un JWT (/auth/validate),
+- valide un JWT (/auth/validate) ou plusieurs à la fois (/auth/validate/batch),
+- publie ses clés publiques (/auth/.well-known/jwks.json) quand les tokens d'accès sont signés
+  en EdDSA ou RS256 : le Gateway et le Orders Service les vérifient alors eux-mêmes,
 - stocke les utilisateurs dans une base SQLite (users.db) avec des hashs de mots de passe (bcrypt).'''
 
 # auth_service.py
 #Ce code implémente un service d'authentification utilisant Flask, JWT et SQLite.
+import atexit
+import hashlib
+import os
+import threading
+import time
+import uuid
 from datetime import datetime, timedelta, timezone
 from flask import Flask, request, jsonify
 import jwt
 import sqlite3
-from flask_bcrypt import Bcrypt
+from common.sqlite_pool import SQLitePool
+from common.password_hasher import PasswordHasherPool, HasherSaturated
+from common.metrics import REGISTRY, instrument_flask, timed, timed_section
+from common.jwt_keys import KeyRing
+from common import deadline, tracing
 
 # --- 1. Initialisation de l'API ---
 auth_app = Flask(__name__)
 auth_app.config['SECRET_KEY'] = 'SuperSecretKeyPourTP' # Clé secrète pour signer les JWT
-bcrypt = Bcrypt(auth_app) 
+# Latence par route, requêtes en cours et sections chronométrées : GET /metrics
+instrument_flask(auth_app, 'auth')
+# X-Request-ID propagé, Server-Timing par saut, traces échantillonnées (TRACE_FILE)
+tracing.instrument_flask(auth_app, 'auth')
+# Délai transmis par l'appelant (X-Request-Deadline-Ms) : 504 s'il est déjà épuisé
+deadline.instrument_flask(auth_app)
+
+# bcrypt tourne dans des processus dédiés : une rafale de logins ne bloque plus /auth/validate
+BCRYPT_ROUNDS = int(os.environ.get('AUTH_BCRYPT_ROUNDS', 12))
+# Plusieurs workers Auth (supervisor.py, SERVICE_WORKERS) se partagent les cœurs
+SERVICE_WORKERS = max(1, int(os.environ.get('SERVICE_WORKERS', 1)))
+BCRYPT_WORKERS = int(os.environ.get('AUTH_BCRYPT_WORKERS', max(1, (os.cpu_count() or 2) // SERVICE_WORKERS)))
+BCRYPT_MAX_PENDING = int(os.environ.get('AUTH_BCRYPT_MAX_PENDING', BCRYPT_WORKERS * 4))
+password_hasher = PasswordHasherPool(workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING,
+                                     rounds=BCRYPT_ROUNDS)
+atexit.register(password_hasher.close)
+REGISTRY.register_stats('auth_password_hasher', password_hasher.stats)
 
 # --- 2. Logique de Base de Données (Transfert de database.py) ---
 DATABASE_NAME = 'users.db'
+DB_POOL_SIZE = int(os.environ.get('AUTH_DB_POOL_SIZE', 8))
+
+# Connexions ouvertes une fois (WAL, cache de requêtes préparées) puis réutilisées
+db_pool = SQLitePool(DATABASE_NAME, max_connections=DB_POOL_SIZE)
+atexit.register(db_pool.close_all)
+
+# Requêtes fréquentes : texte constant => compilées une seule fois par connexion
+SQL_GET_USER = "SELECT username, password_hash FROM users WHERE username = ?"
+SQL_INSERT_USER = "INSERT INTO users (username, password_hash) VALUES (?, ?)"
+SQL_UPDATE_PASSWORD = "UPDATE users SET password_hash = ? WHERE username = ?"
+SQL_INSERT_REFRESH = "INSERT OR IGNORE INTO refresh_tokens (username, token_hash, expires_at) VALUES (?, ?, ?)"
+SQL_FIND_REFRESH = "SELECT 1 FROM refresh_tokens WHERE token_hash = ? AND username = ? AND expires_at > ?"
+SQL_DELETE_REFRESH = "DELETE FROM refresh_tokens WHERE token_hash = ?"
+# Garde les MAX_SESSIONS_PER_USER sessions les plus récentes (parcours de l'index username/expires_at)
+SQL_TRIM_SESSIONS = """
+    DELETE FROM refresh_tokens WHERE username = ? AND id NOT IN (
+        SELECT id FROM refresh_tokens WHERE username = ? ORDER BY expires_at DESC LIMIT ?
+    )"""
+SQL_PURGE_EXPIRED = """
+    DELETE FROM refresh_tokens WHERE id IN (
+        SELECT id FROM refresh_tokens WHERE expires_at <= ? LIMIT ?
+    )"""
+
+# --- Sessions (refresh tokens) ---
+REFRESH_TOKEN_DAYS = 7
+JWKS_MAX_AGE = int(os.environ.get('AUTH_JWKS_MAX_AGE', 60))   # secondes (Cache-Control du JWKS)
+ACCESS_TOKEN_MINUTES = float(os.environ.get('AUTH_ACCESS_TOKEN_MINUTES', 30))
+MAX_SESSIONS_PER_USER = int(os.environ.get('AUTH_MAX_SESSIONS_PER_USER', 10))
+PURGE_INTERVAL = float(os.environ.get('AUTH_PURGE_INTERVAL', 300))   # secondes
+PURGE_BATCH_SIZE = int(os.environ.get('AUTH_PURGE_BATCH_SIZE', 1000))
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Emprunte une connexion au pool : with get_db_connection() as conn: ..."""
+    return db_pool.connection()
 
 def init_db():
     """Crée la table des utilisateurs si elle n'existe pas."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL
+            )
+        ''')
+        migrate_legacy_refresh_tokens(conn)
+        # Seul un hash du refresh token est stocké ; expires_at est un timestamp UNIX
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS refresh_tokens (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL
+            username TEXT NOT NULL,
+            token_hash TEXT NOT NULL UNIQUE,
+            expires_at INTEGER NOT NULL
         )
-    ''')
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS refresh_tokens (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL,
-        token TEXT NOT NULL,
-        expires_at TEXT NOT NULL
-    )
-    ''')
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user ON refresh_tokens (username, expires_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expiry ON refresh_tokens (expires_at)")
 
+        conn.commit()
+        copy_legacy_refresh_tokens(conn)
+
+def token_digest(token):
+    """Empreinte SHA-256 d'un refresh token (le token lui-même n'est jamais stocké)."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def migrate_legacy_refresh_tokens(conn):
+    """Ancien schéma (token en clair, date en texte) : la table est mise de côté avant recréation."""
+    columns = [row['name'] for row in conn.execute("PRAGMA table_info(refresh_tokens)")]
+    if 'token' in columns:
+        conn.execute("ALTER TABLE refresh_tokens RENAME TO refresh_tokens_legacy")
+
+def copy_legacy_refresh_tokens(conn):
+    """Recopie les sessions encore valides de l'ancien schéma puis supprime l'ancienne table."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'refresh_tokens_legacy'").fetchone()
+    if not exists:
+        return
+    now = datetime.now(timezone.utc).timestamp()
+    rows = []
+    for row in conn.execute("SELECT username, token, expires_at FROM refresh_tokens_legacy"):
+        try:
+            expires_at = int(datetime.fromisoformat(row['expires_at']).timestamp())
+        except ValueError:
+            continue
+        if expires_at > now:
+            rows.append((row['username'], token_digest(row['token']), expires_at))
+    conn.executemany(SQL_INSERT_REFRESH, rows)
+    conn.execute("DROP TABLE refresh_tokens_legacy")
     conn.commit()
-    conn.close()
 
+@timed('db.store_refresh_token')
+def store_refresh_token(username, refresh_token, expires_at):
+    """Enregistre une session et ne garde que les plus récentes de l'utilisateur."""
+    with get_db_connection() as conn:
+        conn.execute(SQL_INSERT_REFRESH, (username, token_digest(refresh_token), int(expires_at.timestamp())))
+        conn.execute(SQL_TRIM_SESSIONS, (username, username, MAX_SESSIONS_PER_USER))
+        conn.commit()
+
+@timed('db.find_refresh_token')
+def is_refresh_token_active(username, refresh_token):
+    with get_db_connection() as conn:
+        now = int(datetime.now(timezone.utc).timestamp())
+        return conn.execute(SQL_FIND_REFRESH, (token_digest(refresh_token), username, now)).fetchone() is not None
+
+@timed('db.revoke_refresh_token')
+def revoke_refresh_token(refresh_token):
+    with get_db_connection() as conn:
+        conn.execute(SQL_DELETE_REFRESH, (token_digest(refresh_token),))
+        conn.commit()
+
+@timed('db.purge_refresh_tokens')
+def purge_expired_refresh_tokens():
+    """Supprime les sessions expirées par lots (le verrou d'écriture est relâché entre deux lots)."""
+    deleted = 0
+    now = int(datetime.now(timezone.utc).timestamp())
+    while True:
+        with get_db_connection() as conn:
+            count = conn.execute(SQL_PURGE_EXPIRED, (now, PURGE_BATCH_SIZE)).rowcount
+            conn.commit()
+        deleted += count
+        if count < PURGE_BATCH_SIZE:
+            return deleted
+
+def start_purge_thread():
+    def run():
+        while True:
+            try:
+                purge_expired_refresh_tokens()
+            except sqlite3.Error as e:
+                print(f"Erreur de purge des refresh tokens : {e}")
+            time.sleep(PURGE_INTERVAL)
+
+    threading.Thread(target=run, name='refresh-token-purge', daemon=True).start()
+
+@timed('db.get_user')
 def get_user_by_username(username):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT username, password_hash FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
-    conn.close()
-    return user 
+    with get_db_connection() as conn:
+        return conn.execute(SQL_GET_USER, (username,)).fetchone()
 
 def add_user(username, password):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    with timed_section('bcrypt.hash'):
+        hashed_password = password_hasher.hash(password)
+    with get_db_connection() as conn, timed_section('db.insert_user'):
+        try:
+            conn.execute(SQL_INSERT_USER, (username, hashed_password))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+@timed('bcrypt.verify')
+def check_password(hashed_password, password):
+    return password_hasher.verify(password, hashed_password)
+
+def rehash_if_outdated(username, hashed_password, password):
+    """Recalcule le hash au coût actuel si celui stocké est plus faible (après un login réussi)."""
+    if not password_hasher.needs_rehash(hashed_password):
+        return
     try:
-        cursor.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hashed_password))
+        new_hash = password_hasher.hash(password)
+    except HasherSaturated:
+        return  # ce sera fait à une prochaine connexion
+    with get_db_connection() as conn:
+        conn.execute(SQL_UPDATE_PASSWORD, (new_hash, username))
         conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
 
-def check_password(hashed_password, password):
-    return bcrypt.check_password_hash(hashed_password.encode('utf-8'), password)
-
-# 👈 APPEL CRUCIAL : Assure que la DB est prête avant de traiter les requêtes
-init_db() 
+def busy_response():
+    """Réponse rapide quand le pool bcrypt est saturé."""
+    return jsonify({"message": "Service d'authentification surchargé, réessayez."}), 503, {'Retry-After': '1'}
+
+# Processus qui ne traitent aucune requête :
+# - les processus bcrypt ('spawn') réimportent ce script sous le nom __mp_main__,
+# - avec debug=True, le parent du reloader Werkzeug (le service tourne dans l'enfant, WERKZEUG_RUN_MAIN).
+SERVING_PROCESS = not (__name__ == '__mp_main__'
+                       or (__name__ == '__main__' and 'WERKZEUG_RUN_MAIN' not in os.environ))
+
+# Tokens d'accès : HS256 (SECRET_KEY) par défaut, ou EdDSA / RS256 (AUTH_JWT_ALGORITHM) avec
+# des clés identifiées par un kid (AUTH_JWT_KEYS_DIR, créées au premier démarrage).
+# Les refresh tokens restent en HS256 : seul l'Auth Service les lit.
+signing_keys = None
+
+def encode_access_token(payload):
+    if signing_keys is not None and signing_keys.asymmetric:
+        kid, algorithm, private_key = signing_keys.signing_key()
+        return jwt.encode(payload, private_key, algorithm=algorithm, headers={'kid': kid})
+    return jwt.encode(payload, auth_app.config['SECRET_KEY'], algorithm='HS256')
+
+def decode_access_token(token):
+    """Payload d'un token d'accès (clé choisie par le kid, algorithme imposé par la clé)."""
+    kid = jwt.get_unverified_header(token).get('kid')
+    if kid is None:
+        return jwt.decode(token, auth_app.config['SECRET_KEY'], algorithms=['HS256'])
+    key = signing_keys.verification_key(kid) if signing_keys is not None else None
+    if key is None:
+        raise jwt.InvalidTokenError(f"Clé inconnue : {kid}")
+    algorithm, public_key = key
+    return jwt.decode(token, public_key, algorithms=[algorithm])
+
+if SERVING_PROCESS:
+    # 👈 APPEL CRUCIAL : Assure que la DB est prête avant de traiter les requêtes
+    init_db()
+    signing_keys = KeyRing()
+    REGISTRY.register_stats('auth_signing_keys', signing_keys.stats)
+    start_purge_thread()
+    # Processus bcrypt démarrés maintenant plutôt qu'au premier login
+    password_hasher.start()
 
 
 # --- 3. Routes de l'Auth Service ---
@@ -87,8 +267,16 @@ def register():
     
     if get_user_by_username(username):
         return jsonify({"message": "Ce nom d'utilisateur existe déjà."}), 409
+
+    try:
+        created = add_user(username, password)
+    except HasherSaturated:
+        return busy_response()
+    except ValueError:
+        # bcrypt refuse les mots de passe de plus de 72 octets
+        return jsonify({"message": "Mot de passe trop long."}), 400
         
-    if add_user(username, password):
+    if created:
         return jsonify({"message": "Inscription réussie."}), 201
     else:
         return jsonify({"message": "Erreur lors de la création du compte."}), 500
@@ -101,32 +289,36 @@ def login():
     password = data.get('password')
         
     user_record = get_user_by_username(username)
+
+    try:
+        password_ok = bool(user_record) and check_password(user_record['password_hash'], password)
+    except HasherSaturated:
+        return busy_response()
     
-    if user_record and check_password(user_record['password_hash'], password):
-        # Génération du Access Token (expire dans 1h)
+    if password_ok:
+        rehash_if_outdated(username, user_record['password_hash'], password)
+
+        # Génération du Access Token (expire dans ACCESS_TOKEN_MINUTES, 30 min par défaut)
         access_payload = {
             'user': username,
-            'exp': datetime.now(timezone.utc) + timedelta(minutes=30),
+            'exp': datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_MINUTES),
             'iat': datetime.now(timezone.utc)
         }
-        access_token = jwt.encode(access_payload, auth_app.config['SECRET_KEY'], algorithm='HS256')
+        access_token = encode_access_token(access_payload)
 
         # Génération du Refresh Token (expire dans 7 jours)
+        refresh_expires_at = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_DAYS)
         refresh_payload = {
             'user': username,
-            'exp': datetime.now(timezone.utc) + timedelta(days=7),
+            'exp': refresh_expires_at,
             'iat': datetime.now(timezone.utc),
+            'jti': uuid.uuid4().hex,  # deux connexions dans la même seconde donnent deux tokens distincts
             'type': 'refresh'
         }
         refresh_token = jwt.encode(refresh_payload, auth_app.config['SECRET_KEY'], algorithm='HS256')
 
-        # Sauvegarde du refresh token en base
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO refresh_tokens (username, token, expires_at) VALUES (?, ?, ?)",
-            (username, refresh_token, str(datetime.now(timezone.utc) + timedelta(days=7))))
-        conn.commit()
-        conn.close()
+        # Sauvegarde du refresh token en base (seulement son empreinte)
+        store_refresh_token(username, refresh_token, refresh_expires_at)
 
         return jsonify({
             'message': 'Connexion réussie',
@@ -138,6 +330,20 @@ def login():
 
 
 
+MAX_BATCH_TOKENS = 1000
+
+def check_access_token(token):
+    """Décode un JWT et retourne un résultat sérialisable :
+    {"status": "valid", "user", "exp"} | {"status": "expired" | "invalid", "message"}."""
+    try:
+        payload = decode_access_token(token)
+        return {"status": "valid", "user": payload['user'], "exp": payload.get('exp')}
+    except jwt.ExpiredSignatureError:
+        return {"status": "expired", "message": "Token expiré."}
+    except Exception:
+        return {"status": "invalid", "message": "Token invalide."}
+
+
 @auth_app.route('/auth/validate', methods=['POST'])
 def validate_token():
     """API pour valider un JWT (sera utilisée par l'API Gateway)."""
@@ -147,17 +353,39 @@ def validate_token():
     if not token:
         return jsonify({"message": "Token manquant."}), 400
     
-    try:
-        payload = jwt.decode(token, auth_app.config['SECRET_KEY'], algorithms=['HS256'])
+    result = check_access_token(token)
+    if result['status'] == 'valid':
         return jsonify({
             "message": "Token valide",
-            "user": payload['user'] 
+            "user": result['user'],
+            "exp": result['exp']  # permet au Gateway de cacher le résultat jusqu'à expiration
         }), 200
-    
-    except jwt.ExpiredSignatureError:
-        return jsonify({"message": "Token expiré."}), 401
-    except Exception:
-        return jsonify({"message": "Token invalide."}), 401
+    return jsonify({"message": result['message']}), 401
+
+
+@auth_app.route('/auth/validate/batch', methods=['POST'])
+def validate_tokens_batch():
+    """API pour valider plusieurs JWT en un seul aller-retour (utilisée par le Gateway).
+    Entrée : {"tokens": [...]} ; sortie : {"results": [...]} dans le même ordre."""
+    data = request.get_json(silent=True) or {}
+    tokens = data.get('tokens')
+
+    if not isinstance(tokens, list) or not tokens:
+        return jsonify({"message": "Liste de tokens manquante."}), 400
+    if len(tokens) > MAX_BATCH_TOKENS:
+        return jsonify({"message": f"Maximum {MAX_BATCH_TOKENS} tokens par lot."}), 413
+
+    results = [check_access_token(token) if isinstance(token, str) and token
+               else {"status": "invalid", "message": "Token manquant."}
+               for token in tokens]
+    return jsonify({"results": results}), 200
+
+
+@auth_app.route('/auth/.well-known/jwks.json', methods=['GET'])
+def jwks():
+    """Clés publiques de vérification des tokens d'accès (vide en HS256)."""
+    document = signing_keys.jwks() if signing_keys is not None else {"keys": []}
+    return jsonify(document), 200, {'Cache-Control': f'public, max-age={JWKS_MAX_AGE}'}
 
 
 @auth_app.route('/auth/refresh', methods=['POST'])
@@ -176,24 +404,17 @@ def refresh_token():
 
         username = payload['user']
 
-        # Vérif en base
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM refresh_tokens WHERE username = ? AND token = ?", 
-                       (username, refresh_token))
-        record = cursor.fetchone()
-        conn.close()
-
-        if not record:
+        # Vérif en base (recherche par empreinte, via l'index unique)
+        if not is_refresh_token_active(username, refresh_token):
             return jsonify({"message": "Refresh token non reconnu"}), 401
 
         # Génération d’un nouvel Access Token
         new_access_payload = {
             'user': username,
-            'exp': datetime.now(timezone.utc) + timedelta(minutes=30),
+            'exp': datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_MINUTES),
             'iat': datetime.now(timezone.utc)
         }
-        new_access_token = jwt.encode(new_access_payload, auth_app.config['SECRET_KEY'], algorithm='HS256')
+        new_access_token = encode_access_token(new_access_payload)
 
         return jsonify({"access_token": new_access_token}), 200
 
@@ -209,11 +430,8 @@ def logout():
     data = request.get_json()
     refresh_token = data.get('refresh_token')
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM refresh_tokens WHERE token = ?", (refresh_token,))
-    conn.commit()
-    conn.close()
+    if refresh_token:
+        revoke_refresh_token(refresh_token)
 
     return jsonify({"message": "Déconnecté avec succès"}), 200
 
@@ -0,0 +1,2 @@
+'''Banc de charge des quatre services (Auth, Orders, Gateway, Front).
+Lancement : python -m benchmarks.run --help'''
@@ -0,0 +1,42 @@
+'''Compare deux rapports de benchmarks.run (débit et latences, écart en %).
+Usage : python -m benchmarks.compare avant.json apres.json'''
+
+# benchmarks/compare.py
+import json
+import sys
+
+METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def delta(before, after):
+    if before in (None, 0) or after is None:
+        return ''
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        sys.exit(__doc__)
+    before, after = load(argv[0]), load(argv[1])
+
+    for workload, result in after["workloads"].items():
+        previous = before["workloads"].get(workload)
+        if previous is None:
+            continue
+        print(f"\n== {workload}")
+        for label, stats in result["endpoints"].items():
+            old = previous["endpoints"].get(label)
+            if old is None:
+                continue
+            print(f"  {label}")
+            for metric in METRICS:
+                print(f"    {metric:16} {old[metric]:>10} → {stats[metric]:<10} {delta(old[metric], stats[metric]):>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+'''Démarrage des services pour un benchmark :
+- ports éphémères (aucun conflit avec des services déjà lancés sur 5000-5003),
+- répertoire de travail temporaire : users.db et orders.log isolés à chaque exécution,
+- adresses inter-services passées par variables d'environnement.'''
+
+# benchmarks/harness.py
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# nom -> (module, attribut Flask)
+SERVICES = {
+    'auth': ('auth_service', 'auth_app'),
+    'orders': ('orders_service', 'orders_app'),
+    'gateway': ('gateway', 'gateway_app'),
+    'front': ('app', 'app'),
+}
+START_ORDER = ('auth', 'orders', 'gateway', 'front')
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ServiceError(Exception):
+    """Un service n'a pas démarré (voir son journal dans le répertoire de travail)."""
+
+
+class LocalCluster:
+    """Les quatre services dans des processus séparés ; à utiliser avec `with`."""
+
+    def __init__(self, gateway_mode='sync', env=None, keep_workdir=False, start_timeout=30.0):
+        self.gateway_mode = gateway_mode
+        self.extra_env = env or {}
+        self.keep_workdir = keep_workdir
+        self.start_timeout = start_timeout
+        self.workdir = None
+        self.ports = {}
+        self.processes = {}
+        self._logs = {}
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.ports[name]}"
+
+    def _environment(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+        env['PYTHONUNBUFFERED'] = '1'
+        env['AUTH_SERVICE_URL'] = self.url('auth')
+        env['ORDERS_SERVICE_URL'] = self.url('orders')
+        env['GATEWAY_URL'] = self.url('gateway')
+        # Charge synthétique d'un seul utilisateur : la limitation de débit fausserait les mesures
+        env['GATEWAY_RATE_LIMIT'] = '0'
+        env.update({key: str(value) for key, value in self.extra_env.items()})
+        return env
+
+    def start(self):
+        self.workdir = tempfile.mkdtemp(prefix='bench-')
+        self.ports = {name: free_port() for name in START_ORDER}
+        env = self._environment()
+        try:
+            for name in START_ORDER:
+                module, attribute = SERVICES[name]
+                if name == 'gateway' and self.gateway_mode == 'async':
+                    module = 'gateway_async'
+                log = open(os.path.join(self.workdir, f'service-{name}.log'), 'wb')
+                self._logs[name] = log
+                self.processes[name] = subprocess.Popen(
+                    [sys.executable, '-m', 'benchmarks.serve', module, attribute, str(self.ports[name])],
+                    cwd=self.workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+                self._wait_ready(name)
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def _wait_ready(self, name):
+        deadline = time.monotonic() + self.start_timeout
+        while time.monotonic() < deadline:
+            if self.processes[name].poll() is not None:
+                raise ServiceError(f"{name} s'est arrêté au démarrage :\n{self.read_log(name)}")
+            try:
+                with socket.create_connection(('127.0.0.1', self.ports[name]), timeout=0.2):
+                    return
+            except OSError:
+                time.sleep(0.05)
+        raise ServiceError(f"{name} ne répond pas après {self.start_timeout} s :\n{self.read_log(name)}")
+
+    def read_log(self, name):
+        path = os.path.join(self.workdir, f'service-{name}.log')
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', errors='replace')[-4000:]
+
+    def stop(self):
+        for name in reversed(START_ORDER):
+            process = self.processes.get(name)
+            if process is None or process.poll() is not None:
+                continue
+            # SIGINT : arrêt propre (handlers atexit : fsync du journal, arrêt du pool bcrypt)
+            process.send_signal(signal.SIGINT if os.name != 'nt' else signal.SIGTERM)
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        for log in self._logs.values():
+            log.close()
+        self.processes.clear()
+        self._logs.clear()
+        if self.workdir and not self.keep_workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,115 @@
+'''Coût des pages du Front avant / après la couche de réponse (app/response_layer.py).
+Pour chaque page : octets sur le fil (en-têtes + corps tel qu'envoyé) et temps CPU du processus
+Front par requête (process_cpu_seconds_total de /metrics, avant et après la série).
+« avant » = FRONT_RESPONSE_LAYER=0 (pages servies comme avant) ; « après » = réglages par défaut.
+
+Exemple :
+    python -m benchmarks.pages --requests 300 --output pages.json'''
+
+# benchmarks/pages.py
+import argparse
+import json
+import sys
+import time
+
+import requests
+
+from benchmarks.harness import LocalCluster
+from benchmarks.workloads import FRONT_FORM
+
+MODES = {
+    'before': {'FRONT_RESPONSE_LAYER': '0'},
+    'after': {},
+}
+ACCEPT_ENCODING = 'br, gzip, deflate'
+
+
+def front_cpu_seconds(session, front_url):
+    text = session.get(front_url + '/metrics', headers={'Accept-Encoding': 'identity'}).text
+    for line in text.splitlines():
+        if line.startswith('process_cpu_seconds_total '):
+            return float(line.split()[1])
+    raise RuntimeError("process_cpu_seconds_total absent de /metrics")
+
+
+def wire_bytes(response):
+    """Ligne de statut + en-têtes + corps non décodé (approximation des octets envoyés)."""
+    body = response.raw.read(decode_content=False)
+    headers = sum(len(name) + len(value) + 4 for name, value in response.raw.headers.items())
+    return len(f"HTTP/1.1 {response.status_code} {response.reason}\r\n") + headers + 2 + len(body)
+
+
+def measure(session, front_url, count, method, path, **kwargs):
+    statuses = {}
+    total_bytes = 0
+    encoding = None
+    cpu_before = front_cpu_seconds(session, front_url)
+    started = time.perf_counter()
+    for _ in range(count):
+        with session.request(method, front_url + path, stream=True, allow_redirects=False, **kwargs) as response:
+            total_bytes += wire_bytes(response)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            encoding = response.headers.get('Content-Encoding', 'identity')
+    elapsed = time.perf_counter() - started
+    cpu = front_cpu_seconds(session, front_url) - cpu_before
+    return {
+        "requests": count,
+        "statuses": statuses,
+        "content_encoding": encoding,
+        "bytes_per_request": round(total_bytes / count, 1),
+        "cpu_ms_per_request": round(cpu / count * 1000, 3),
+        "latency_ms": round(elapsed / count * 1000, 3),
+    }
+
+
+def run_mode(env, count):
+    with LocalCluster(env=env) as cluster:
+        front = cluster.url('front')
+        user, password = f"pages{int(time.time())}", 'pw-pages'
+        requests.post(cluster.url('auth') + '/auth/register', json={'username': user, 'password': password})
+        with requests.Session() as session:
+            session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+            session.post(front + '/login', data={'user': user, 'password': password, 'action': 'login'},
+                         allow_redirects=False)
+            results = {
+                "GET /login": measure(session, front, count, 'GET', '/login'),
+                "GET /accueil": measure(session, front, count, 'GET', '/accueil'),
+            }
+            etag = session.get(front + '/accueil').headers.get('ETag')
+            if etag:
+                results["GET /accueil (If-None-Match)"] = measure(
+                    session, front, count, 'GET', '/accueil', headers={'If-None-Match': etag})
+            results["POST /submit_order (achat)"] = measure(
+                session, front, count, 'POST', f'/submit_order/{user}', data=FRONT_FORM)
+        return results
+
+
+def print_report(report):
+    print(f"{'page':<32} {'octets avant':>13} {'octets après':>13} {'CPU avant (ms)':>15} {'CPU après (ms)':>15}")
+    for page, after in report['after'].items():
+        before = report['before'].get(page) or report['before'][page.split(' (')[0]]
+        print(f"{page:<32} {before['bytes_per_request']:>13} {after['bytes_per_request']:>13} "
+              f"{before['cpu_ms_per_request']:>15} {after['cpu_ms_per_request']:>15}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Octets et CPU par page du Front, avant / après.")
+    parser.add_argument('--requests', type=int, default=200, help="requêtes par page (200)")
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help="coût bcrypt de l'Auth Service (4)")
+    parser.add_argument('--output', help="fichier du rapport JSON")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for mode, env in MODES.items():
+        print(f"Mode {mode}...", file=sys.stderr)
+        report[mode] = run_mode(dict(env, AUTH_BCRYPT_ROUNDS=args.bcrypt_rounds), args.requests)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"Rapport écrit dans {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''Point d'entrée du banc de charge.
+Démarre les services sur des ports éphémères, rejoue les scénarios choisis et écrit
+un rapport JSON (débit et latences p50/p95/p99 par endpoint).
+
+Exemple :
+    python -m benchmarks.run --workloads validate,orders --duration 10 --output resultats.json'''
+
+# benchmarks/run.py
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from benchmarks.harness import LocalCluster, ROOT_DIR
+from benchmarks.workloads import WORKLOADS, BenchContext, Recorder
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de charge Auth / Orders / Gateway / Front.")
+    parser.add_argument('--workloads', default=','.join(WORKLOADS),
+                        help=f"scénarios séparés par des virgules ({', '.join(WORKLOADS)})")
+    parser.add_argument('--users', type=int, default=50, help="comptes de test (50)")
+    parser.add_argument('--concurrency', type=int, default=16, help="clients simultanés (16)")
+    parser.add_argument('--duration', type=float, default=10.0, help="durée de chaque scénario en secondes (10)")
+    parser.add_argument('--gateway-mode', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--bcrypt-rounds', type=int, default=None,
+                        help="coût bcrypt de l'Auth Service (défaut du service si absent)")
+    parser.add_argument('--access-token-ttl', type=float, default=None,
+                        help="durée de vie des tokens d'accès en secondes (petite valeur = refresh sur 401)")
+    parser.add_argument('--env', action='append', default=[], metavar='NOM=VALEUR',
+                        help="variable d'environnement passée aux services (répétable)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="fichier du rapport JSON (sinon sortie standard)")
+    parser.add_argument('--keep-workdir', action='store_true',
+                        help="garde le répertoire temporaire (bases, journaux des services)")
+    return parser.parse_args(argv)
+
+
+def service_env(args):
+    env = {}
+    if args.bcrypt_rounds is not None:
+        env['AUTH_BCRYPT_ROUNDS'] = args.bcrypt_rounds
+    if args.access_token_ttl is not None:
+        env['AUTH_ACCESS_TOKEN_MINUTES'] = args.access_token_ttl / 60
+    for item in args.env:
+        name, _, value = item.partition('=')
+        env[name] = value
+    return env
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [name.strip() for name in args.workloads.split(',') if name.strip()]
+    unknown = [name for name in names if name not in WORKLOADS]
+    if unknown:
+        sys.exit(f"Scénario(s) inconnu(s) : {', '.join(unknown)}")
+
+    env = service_env(args)
+    report = {
+        "meta": {
+            "started_at": datetime.datetime.now().isoformat(timespec='seconds'),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "gateway_mode": args.gateway_mode,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "service_env": {name: str(value) for name, value in env.items()},
+        },
+        "workloads": {},
+    }
+
+    with LocalCluster(gateway_mode=args.gateway_mode, env=env, keep_workdir=args.keep_workdir) as cluster:
+        ctx = BenchContext(cluster, users=args.users, concurrency=args.concurrency,
+                           duration=args.duration, seed=args.seed)
+        for name in names:
+            print(f"Scénario {name}...", file=sys.stderr)
+            recorder = Recorder()
+            elapsed = WORKLOADS[name](ctx, recorder)
+            report["workloads"][name] = {
+                "elapsed_s": round(elapsed, 3),
+                "endpoints": recorder.report(elapsed),
+            }
+        if args.keep_workdir:
+            report["meta"]["workdir"] = cluster.workdir
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"Rapport écrit dans {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+'''Lance une application Flask du projet sur un port donné, sans reloader ni debug.
+Usage (par benchmarks.harness) : python -m benchmarks.serve <module> <attribut> <port>'''
+
+# benchmarks/serve.py
+import importlib
+import logging
+import sys
+
+
+def main():
+    module_name, attribute, port = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    # Pas de ligne de log par requête : elle coûterait plus cher que certaines routes mesurées
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    if module_name == 'gateway_async':
+        import gateway_async
+        gateway_async.run(port=port)
+        return
+    app = getattr(importlib.import_module(module_name), attribute)
+    app.run(host='127.0.0.1', port=port, threaded=True, debug=False, use_reloader=False)
+
+
+# Garde indispensable : les processus bcrypt ('spawn') réimportent ce module
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+'''Scénarios de charge rejoués contre un LocalCluster.
+Chaque client est un thread avec sa propre session HTTP (keep-alive), en boucle fermée :
+il envoie la requête suivante dès qu'il a reçu la réponse à la précédente.'''
+
+# benchmarks/workloads.py
+import random
+import threading
+import time
+
+import requests
+
+# Panier type (identifiants du catalogue, comme le front)
+CART = [
+    {'article_id': 'cookies', 'quantity': 2},
+    {'article_id': 'laine', 'quantity': 1},
+]
+FRONT_FORM = {'cookies': '2', 'laine': '1'}
+
+REQUEST_TIMEOUT = 30
+
+
+def percentile(sorted_values, fraction):
+    """Percentile au rang le plus proche sur une liste déjà triée."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Latences et codes de retour par endpoint (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._statuses = {}
+        self._errors = {}
+
+    def call(self, label, session, method, url, **kwargs):
+        """Envoie la requête, enregistre sa latence ; retourne la réponse ou None (erreur réseau)."""
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record(label, time.perf_counter() - started, 'exception')
+            return None
+        self._record(label, time.perf_counter() - started, response.status_code)
+        return response
+
+    def record(self, label, seconds, status=200):
+        """Enregistre une durée mesurée par le scénario (plusieurs appels, ex. commande -> paiement)."""
+        self._record(label, seconds, status)
+
+    def _record(self, label, seconds, status):
+        with self._lock:
+            self._latencies.setdefault(label, []).append(seconds * 1000)
+            statuses = self._statuses.setdefault(label, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 'exception' or status >= 500:
+                self._errors[label] = self._errors.get(label, 0) + 1
+
+    def report(self, elapsed):
+        with self._lock:
+            endpoints = {}
+            for label, latencies in self._latencies.items():
+                latencies = sorted(latencies)
+                endpoints[label] = {
+                    "count": len(latencies),
+                    "errors": self._errors.get(label, 0),
+                    "statuses": dict(self._statuses[label]),
+                    "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+                    "mean_ms": round(sum(latencies) / len(latencies), 3),
+                    "p50_ms": round(percentile(latencies, 0.50), 3),
+                    "p95_ms": round(percentile(latencies, 0.95), 3),
+                    "p99_ms": round(percentile(latencies, 0.99), 3),
+                    "max_ms": round(latencies[-1], 3),
+                }
+            return endpoints
+
+
+class Account:
+    """Utilisateur de test et ses tokens (partagé entre clients : protégé par un verrou)."""
+
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+        self.access_token = None
+        self.refresh_token = None
+        self.lock = threading.Lock()
+
+
+class BenchContext:
+    def __init__(self, cluster, users, concurrency, duration, seed=0):
+        self.cluster = cluster
+        self.concurrency = concurrency
+        self.duration = duration
+        self.random = random.Random(seed)
+        run_id = f"{int(time.time())}{seed}"
+        self.accounts = [Account(f"bench{run_id}_{i}", f"pw-{i}") for i in range(users)]
+        self.logged_in = False
+
+    def auth(self, path):
+        return self.cluster.url('auth') + path
+
+    def gateway(self, path):
+        return self.cluster.url('gateway') + path
+
+    def front(self, path):
+        return self.cluster.url('front') + path
+
+
+def run_clients(concurrency, client, duration=None, jobs=None):
+    """Lance `concurrency` threads.
+    - jobs : liste de tâches partagée (chaque thread en prend une, jusqu'à épuisement),
+    - sinon : chaque thread rappelle client(session, index) jusqu'à la fin de `duration`.
+    Retourne la durée réelle (secondes)."""
+    lock = threading.Lock()
+    queue = list(jobs) if jobs is not None else None
+    deadline = time.monotonic() + duration if duration else None
+
+    def worker(index):
+        with requests.Session() as session:
+            while True:
+                if queue is not None:
+                    with lock:
+                        if not queue:
+                            return
+                        job = queue.pop()
+                    client(session, job)
+                else:
+                    if time.monotonic() >= deadline:
+                        return
+                    client(session, index)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+# --- Fonctions partagées par les scénarios ---
+
+def register_and_login(ctx, recorder, session, account):
+    recorder.call('POST /auth/register', session, 'POST', ctx.auth('/auth/register'),
+                  json={'username': account.username, 'password': account.password})
+    login(ctx, recorder, session, account)
+
+
+def login(ctx, recorder, session, account):
+    response = recorder.call('POST /auth/login', session, 'POST', ctx.auth('/auth/login'),
+                             json={'username': account.username, 'password': account.password})
+    if response is not None and response.status_code == 200:
+        data = response.json()
+        with account.lock:
+            account.access_token = data['access_token']
+            account.refresh_token = data['refresh_token']
+
+
+def refresh(ctx, recorder, session, account, stale_token):
+    """Rafraîchit le token d'accès (une seule fois si plusieurs clients le demandent)."""
+    with account.lock:
+        if account.access_token != stale_token:
+            return account.access_token  # déjà rafraîchi par un autre client
+        response = recorder.call('POST /auth/refresh', session, 'POST', ctx.auth('/auth/refresh'),
+                                 json={'refresh_token': account.refresh_token})
+        if response is not None and response.status_code == 200:
+            account.access_token = response.json()['access_token']
+        return account.access_token
+
+
+def with_refresh(ctx, recorder, session, account, label, method, url, **kwargs):
+    """Appel authentifié ; sur 401, rafraîchit le token puis réessaie une fois."""
+    extra_headers = kwargs.pop('headers', {})
+    token = account.access_token
+    response = recorder.call(label, session, method, url,
+                             headers={'Authorization': f'Bearer {token}', **extra_headers}, **kwargs)
+    if response is not None and response.status_code == 401:
+        token = refresh(ctx, recorder, session, account, token)
+        response = recorder.call(label, session, method, url,
+                                 headers={'Authorization': f'Bearer {token}', **extra_headers}, **kwargs)
+    return response
+
+
+def setup_account(ctx, session, account, attempts=30):
+    """Inscription puis connexion hors mesure ; un refus pour surcharge du pool bcrypt (503)
+    est réessayé après Retry-After, sinon le compte resterait sans token pour tout le scénario."""
+    unrecorded = Recorder()
+    for path in ('/auth/register', '/auth/login'):
+        for _ in range(attempts):
+            response = unrecorded.call(f'POST {path}', session, 'POST', ctx.auth(path),
+                                       json={'username': account.username, 'password': account.password})
+            if response is None or response.status_code != 503:
+                break
+            time.sleep(float(response.headers.get('Retry-After', 1)))
+    if response is not None and response.status_code == 200:
+        data = response.json()
+        with account.lock:
+            account.access_token = data['access_token']
+            account.refresh_token = data['refresh_token']
+
+
+def ensure_accounts(ctx):
+    """Inscrit et connecte les comptes de test s'ils ne l'ont pas été (hors mesure)."""
+    if ctx.logged_in:
+        return
+    run_clients(ctx.concurrency, lambda session, account: setup_account(ctx, session, account),
+                jobs=ctx.accounts)
+    ctx.logged_in = True
+
+
+# --- Scénarios ---
+
+def register_login_storm(ctx, recorder):
+    """Rafale d'inscriptions puis de connexions (coût bcrypt, écritures SQLite)."""
+    elapsed = run_clients(ctx.concurrency,
+                          lambda session, account: register_and_login(ctx, recorder, session, account),
+                          jobs=ctx.accounts)
+    ctx.logged_in = True
+    return elapsed
+
+
+def validate_heavy(ctx, recorder):
+    """Validation de tokens en continu, directement sur l'Auth Service."""
+    ensure_accounts(ctx)
+
+    def client(session, index):
+        account = ctx.random.choice(ctx.accounts)
+        token = account.access_token
+        response = recorder.call('POST /auth/validate', session, 'POST', ctx.auth('/auth/validate'),
+                                 json={'token': token})
+        if response is not None and response.status_code == 401:
+            refresh(ctx, recorder, session, account, token)
+
+    return run_clients(ctx.concurrency, client, duration=ctx.duration)
+
+
+def order_submission(ctx, recorder):
+    """Commandes via le Gateway, avec rafraîchissement du token sur 401."""
+    ensure_accounts(ctx)
+
+    def client(session, index):
+        account = ctx.accounts[index % len(ctx.accounts)]
+        with_refresh(ctx, recorder, session, account, 'POST /api/orders', 'POST',
+                     ctx.gateway('/api/orders'), json={'items': CART})
+
+    return run_clients(ctx.concurrency, client, duration=ctx.duration)
+
+
+def payment_pipeline(ctx, recorder, wait=5):
+    """Commande (202, paiement en cours) puis suivi de son statut en long-poll jusqu'au paiement ;
+    'order -> paid' / 'order -> failed' : délai entre l'envoi de la commande et son statut final."""
+    ensure_accounts(ctx)
+
+    def client(session, index):
+        account = ctx.accounts[index % len(ctx.accounts)]
+        started = time.perf_counter()
+        response = with_refresh(ctx, recorder, session, account, 'POST /api/orders', 'POST',
+                                ctx.gateway('/api/orders'), json={'items': CART})
+        if response is None or response.status_code != 202:
+            return
+        url = ctx.gateway(f"/api/orders/{response.json()['order_id']}/status")
+        while True:
+            response = with_refresh(ctx, recorder, session, account, 'GET /api/orders/<id>/status (long-poll)',
+                                    'GET', url, params={'wait': wait})
+            if response is None or response.status_code != 200:
+                return
+            status = response.json()['status']
+            if status != 'pending':
+                recorder.record(f'order -> {status}', time.perf_counter() - started)
+                return
+
+    return run_clients(ctx.concurrency, client, duration=ctx.duration)
+
+
+def history_reads(ctx, recorder, max_pages=5):
+    """Lecture paginée de l'historique, puis relecture conditionnelle de la première page."""
+    ensure_accounts(ctx)
+    etags = {}
+
+    def client(session, index):
+        account = ctx.random.choice(ctx.accounts)
+        url = ctx.gateway(f'/api/orders/{account.username}')
+        etag = etags.get(account.username)
+        if etag is not None and ctx.random.random() < 0.5:
+            with_refresh(ctx, recorder, session, account, 'GET /api/orders/<user> (If-None-Match)',
+                         'GET', url, params={'limit': 20}, headers={'If-None-Match': etag})
+            return
+        cursor = None
+        for _ in range(max_pages):
+            params = {'limit': 20}
+            if cursor:
+                params['cursor'] = cursor
+            response = with_refresh(ctx, recorder, session, account, 'GET /api/orders/<user>',
+                                    'GET', url, params=params)
+            if response is None or response.status_code != 200:
+                return
+            if cursor is None and 'ETag' in response.headers:
+                etags[account.username] = response.headers['ETag']
+            cursor = response.json().get('next_cursor')
+            if not cursor:
+                return
+
+    return run_clients(ctx.concurrency, client, duration=ctx.duration)
+
+
+def front_orders(ctx, recorder):
+    """Parcours complet par le front : connexion (formulaire) puis achat."""
+    ensure_accounts(ctx)
+
+    def client(session, index):
+        account = ctx.accounts[index % len(ctx.accounts)]
+        if 'session' not in session.cookies:
+            recorder.call('POST /login (front)', session, 'POST', ctx.front('/login'),
+                          data={'user': account.username, 'password': account.password, 'action': 'login'},
+                          allow_redirects=False)
+        recorder.call('POST /submit_order/<user> (front)', session, 'POST',
+                      ctx.front(f'/submit_order/{account.username}'), data=FRONT_FORM)
+
+    return run_clients(ctx.concurrency, client, duration=ctx.duration)
+
+
+WORKLOADS = {
+    'register_login': register_login_storm,
+    'validate': validate_heavy,
+    'orders': order_submission,
+    'payments': payment_pipeline,
+    'history': history_reads,
+    'front': front_orders,
+}
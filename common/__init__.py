@@ -0,0 +1,2 @@
+'''Briques partagées entre les microservices (Auth, Orders, Gateway) et le front Flask.
+Chaque module est indépendant et ne dépend pas des fichiers *_service.py.'''
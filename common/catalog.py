@@ -0,0 +1,168 @@
+'''Catalogue des articles : une seule table de prix, immuable et versionnée, partagée par
+le Front (page d'accueil, récapitulatif d'achat) et le Orders Service (prix calculés côté serveur).
+- le fichier (catalog.json) est lu une fois ; les prix sont des centimes entiers,
+- un panier est une liste {article_id, quantity} : le prix envoyé par le client n'est jamais utilisé,
+- le fichier est relu s'il change (date de modification contrôlée au plus toutes les
+  CATALOG_CHECK_INTERVAL secondes) ; la nouvelle table remplace l'ancienne d'un bloc et
+  les caches dérivés se basent sur `catalog.version`.'''
+
+# common/catalog.py
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+CATALOG_FILE = os.environ.get(
+    'CATALOG_FILE', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'catalog.json'))
+CATALOG_CHECK_INTERVAL = float(os.environ.get('CATALOG_CHECK_INTERVAL', 5))   # secondes
+MAX_QUANTITY = int(os.environ.get('CATALOG_MAX_QUANTITY', 1000))              # par ligne de panier
+
+Product = namedtuple('Product', ['id', 'name', 'price_cents'])
+
+
+class CatalogError(ValueError):
+    """Catalogue illisible ou panier invalide (article inconnu, quantité incorrecte)."""
+
+
+def cents_to_amount(cents):
+    return round(cents / 100, 2)
+
+
+class Catalog:
+    """Table de prix en lecture seule : { article_id -> Product }."""
+
+    def __init__(self, version, products):
+        self.version = str(version)
+        self.products = tuple(products)
+        self.by_id = MappingProxyType({product.id: product for product in self.products})
+        # Anciens paniers : article désigné par son nom
+        self._by_name = MappingProxyType({product.name: product for product in self.products})
+        if len(self.by_id) != len(self.products):
+            raise CatalogError("Identifiant d'article en double dans le catalogue.")
+
+    @classmethod
+    def from_dict(cls, data):
+        try:
+            products = [Product(str(entry['id']), str(entry['name']), int(entry['price_cents']))
+                        for entry in data['products']]
+            version = data['version']
+        except (KeyError, TypeError, ValueError) as e:
+            raise CatalogError(f"Catalogue mal formé : {e!r}") from None
+        if any(product.price_cents < 0 for product in products):
+            raise CatalogError("Prix négatif dans le catalogue.")
+        return cls(version, products)
+
+    def product(self, item):
+        """Article d'une ligne de panier ({article_id} ou ancien format {article: nom})."""
+        product = None
+        if 'article_id' in item:
+            product = self.by_id.get(item['article_id'])
+        elif 'article' in item:
+            product = self._by_name.get(item['article'])
+        if product is None:
+            raise CatalogError(f"Article inconnu : {item.get('article_id', item.get('article'))!r}")
+        return product
+
+    def price_cart(self, items):
+        """Lignes chiffrées et total d'un panier, en un seul passage (calcul en centimes entiers).
+        Lève CatalogError si le panier est vide ou mal formé."""
+        if not isinstance(items, list) or not items:
+            raise CatalogError("Panier vide.")
+        lines = []
+        total_cents = 0
+        for item in items:
+            if not isinstance(item, dict):
+                raise CatalogError("Ligne de panier invalide.")
+            product = self.product(item)
+            quantity = item.get('quantity')
+            if isinstance(quantity, bool) or not isinstance(quantity, int) or not 0 < quantity <= MAX_QUANTITY:
+                raise CatalogError(f"Quantité invalide pour {product.id} (1 à {MAX_QUANTITY}).")
+            line_cents = product.price_cents * quantity
+            total_cents += line_cents
+            lines.append({
+                "article_id": product.id,
+                "article": product.name,
+                "quantity": quantity,
+                "unit_price": cents_to_amount(product.price_cents),
+                "total_price": cents_to_amount(line_cents),
+            })
+        return lines, cents_to_amount(total_cents)
+
+
+def load_catalog(path=None):
+    with open(path or CATALOG_FILE, encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise CatalogError(f"Catalogue illisible : {e}") from None
+    return Catalog.from_dict(data)
+
+
+class CatalogLoader:
+    """Catalogue courant, relu quand le fichier change ; un fichier invalide laisse l'ancien en place."""
+
+    def __init__(self, path=None, check_interval=CATALOG_CHECK_INTERVAL):
+        self.path = path or CATALOG_FILE
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def get(self):
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return catalog
+        with self._lock:
+            if self._catalog is None or time.monotonic() - self._checked_at >= self.check_interval:
+                self._refresh()
+            return self._catalog
+
+    def _refresh(self):
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            if self._catalog is None:
+                raise
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            catalog = load_catalog(self.path)
+        except (OSError, CatalogError) as e:
+            if self._catalog is None:
+                raise
+            self.reload_errors += 1
+            print(f"Catalogue {self.path} non rechargé : {e}")
+            return
+        self._mtime = mtime
+        if self._catalog is None or catalog.version != self._catalog.version:
+            if self._catalog is not None:
+                self.reloads += 1
+            self._catalog = catalog
+
+    def stats(self):
+        catalog = self._catalog
+        return {
+            "version": catalog.version if catalog is not None else None,
+            "products": len(catalog.products) if catalog is not None else 0,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
+
+
+_loader = CatalogLoader()
+
+
+def get_catalog():
+    """Catalogue courant (partagé par tout le processus)."""
+    return _loader.get()
+
+
+def catalog_stats():
+    return _loader.stats()
@@ -0,0 +1,150 @@
+'''Disjoncteur (pybreaker) autour des appels vers un service interne.
+- fermé : les appels passent ; fail_max échecs consécutifs (erreur réseau, timeout, réponse 5xx) l'ouvrent ;
+  un 503 avec Retry-After (l'upstream refuse de la charge, il répond) n'est pas un échec,
+- ouvert : les appels échouent tout de suite (CircuitOpen, avec le délai avant le prochain essai),
+- semi-ouvert : après reset_timeout, UN seul appel d'essai passe ; les autres échouent tout de suite
+  jusqu'à son résultat (fermeture s'il réussit, réouverture sinon).
+Utilisable autour d'un appel bloquant comme d'un `await` (le verrou pybreaker n'est pas tenu pendant l'appel).'''
+
+# common/circuit_breaker.py
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import pybreaker
+
+from common.metrics import REGISTRY
+
+BREAKER_TRANSITIONS = REGISTRY.counter(
+    'circuit_breaker_transitions_total', "Changements d'état des disjoncteurs.", ('upstream', 'from_state', 'to_state'))
+BREAKER_REJECTIONS = REGISTRY.counter(
+    'circuit_breaker_rejections_total', "Appels refusés sans être envoyés (disjoncteur ouvert).", ('upstream',))
+BREAKER_STATE = REGISTRY.gauge(
+    'circuit_breaker_state', "État du disjoncteur (0 fermé, 1 semi-ouvert, 2 ouvert).", ('upstream',))
+
+STATE_VALUES = {pybreaker.STATE_CLOSED: 0, pybreaker.STATE_HALF_OPEN: 1, pybreaker.STATE_OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Appel refusé sans être envoyé : le service est considéré comme indisponible."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"Disjoncteur ouvert vers {upstream} (nouvel essai dans {retry_after} s).")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class UpstreamFailure(Exception):
+    """Réponse 5xx : comptée comme un échec par le disjoncteur, puis rendue à l'appelant."""
+
+    def __init__(self, response):
+        super().__init__(f"Réponse {getattr(response, 'status_code', getattr(response, 'status', '?'))}")
+        self.response = response
+
+
+class UpstreamShed(Exception):
+    """Réponse 503 avec Retry-After : l'upstream se protège de la surcharge. Rendue à l'appelant,
+    sans compter comme une panne (ni pour le disjoncteur, ni pour la limite de concurrence)."""
+
+    def __init__(self, response):
+        super().__init__("Réponse 503 (Retry-After)")
+        self.response = response
+
+
+def check_response(response, status):
+    """Lève UpstreamShed (503 + Retry-After) ou UpstreamFailure (autre 5xx) ; ne fait rien sinon."""
+    if status == 503 and 'Retry-After' in response.headers:
+        raise UpstreamShed(response)
+    if status >= 500:
+        raise UpstreamFailure(response)
+
+
+class _Listener(pybreaker.CircuitBreakerListener):
+    def __init__(self, owner):
+        self.owner = owner
+
+    def state_change(self, cb, old_state, new_state):
+        self.owner._on_state_change(old_state.name if old_state is not None else None, new_state.name)
+
+
+class UpstreamBreaker:
+    """Disjoncteur d'un upstream ; `failures` = types d'exception comptés comme des pannes."""
+
+    def __init__(self, name, failures, fail_max=5, reset_timeout=10.0):
+        self.name = name
+        self.failures = tuple(failures) + (UpstreamFailure,)
+        self.reset_timeout = reset_timeout
+        # Toute autre exception (annulation, erreur de l'appelant) n'est pas une panne de l'upstream ;
+        # l'échec qui ouvre le circuit remonte tel quel (throw_new_error_on_trip=False)
+        self.breaker = pybreaker.CircuitBreaker(
+            fail_max=fail_max, reset_timeout=reset_timeout, name=name,
+            exclude=[lambda e: not isinstance(e, self.failures)], listeners=[_Listener(self)],
+            throw_new_error_on_trip=False)
+        self._lock = threading.Lock()
+        self._probing = False
+        self._opened_at = None
+        self.rejected = 0
+        self.opened = 0
+        BREAKER_STATE.set(0, upstream=name)
+
+    def _on_state_change(self, old_state, new_state):
+        with self._lock:
+            if new_state == pybreaker.STATE_OPEN:
+                self._opened_at = time.monotonic()
+                self.opened += 1
+        BREAKER_TRANSITIONS.inc(upstream=self.name, from_state=old_state or 'none', to_state=new_state)
+        BREAKER_STATE.set(STATE_VALUES.get(new_state, 0), upstream=self.name)
+
+    @property
+    def state(self):
+        return self.breaker.current_state
+
+    def retry_after(self):
+        """Secondes avant le prochain appel d'essai (au moins 1)."""
+        with self._lock:
+            opened_at = self._opened_at
+        if opened_at is None:
+            return 1
+        return max(1, math.ceil(self.reset_timeout - (time.monotonic() - opened_at)))
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        BREAKER_REJECTIONS.inc(upstream=self.name)
+        return CircuitOpen(self.name, self.retry_after())
+
+    @contextmanager
+    def guard(self):
+        """with breaker.guard(): appel  — lève CircuitOpen si l'appel n'est pas autorisé."""
+        probe = False
+        if self.breaker.current_state != pybreaker.STATE_CLOSED:
+            # Ouvert ou semi-ouvert : un seul appel d'essai à la fois
+            with self._lock:
+                if self._probing:
+                    probe = None
+                else:
+                    self._probing = probe = True
+            if probe is None:
+                raise self._reject()
+        try:
+            with self.breaker.calling():
+                yield
+        except pybreaker.CircuitBreakerError:
+            # Circuit ouvert et délai pas écoulé : l'appel n'a pas été fait
+            raise self._reject() from None
+        finally:
+            if probe:
+                with self._lock:
+                    self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.breaker.current_state,
+                "fail_max": self.breaker.fail_max,
+                "reset_timeout": self.reset_timeout,
+                "consecutive_failures": self.breaker.fail_counter,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,255 @@
+'''Limite adaptative d'appels simultanés vers un upstream (AIMD sur la latence observée).
+- référence : la latence minimale observée (upstream sans file d'attente), réévaluée toutes les
+  MIN_LATENCY_WINDOW secondes pour suivre un upstream devenu durablement plus lent,
+- la limite monte de 1/limite par appel réussi tant que la latence reste proche de la référence et que
+  la limite est réellement utilisée,
+- elle est multipliée par BACKOFF quand la latence dépasse `tolerance` × la référence, ou quand l'appel
+  échoue (timeout, connexion, 5xx ; pas un 503 avec Retry-After, ni un délai épuisé avant l'envoi) ;
+  au plus une baisse par aller-retour (les appels partis avant la dernière baisse ne la redéclenchent pas),
+- au-delà de la limite, la requête attend dans une file courte (`queue_size` places, au plus
+  `queue_timeout` secondes et jamais au-delà du délai de la requête) ; file pleine ou attente
+  dépassée : Overloaded tout de suite (503 + Retry-After), sans rien envoyer à l'upstream.
+Sous surcharge, l'upstream reçoit ce qu'il traite sans file interne : son débit reste proche de sa
+capacité et la latence des requêtes acceptées reste bornée, au lieu de s'effondrer pour tout le monde.'''
+
+# common/concurrency_limiter.py
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from common import deadline
+from common.metrics import REGISTRY
+
+DEFAULT_LIMIT_MIN = 1
+DEFAULT_QUEUE_TIMEOUT = 0.25     # secondes
+DEFAULT_LATENCY_TOLERANCE = 2.0
+BACKOFF = 0.9
+MIN_LATENCY_WINDOW = 10.0        # secondes : durée de validité de la latence de référence
+LATENCY_SMOOTHING = 0.05         # poids d'un appel dans la latence moyenne (statistiques)
+WARMUP_SAMPLES = 10              # appels observés avant la première baisse
+MIN_LATENCY_SLACK = 0.002        # écart absolu toléré (secondes) : bruit des latences sub-milliseconde
+
+LIMIT_GAUGE = REGISTRY.gauge(
+    'concurrency_limit', "Limite adaptative d'appels simultanés vers l'upstream.", ('upstream',))
+SHED = REGISTRY.counter(
+    'concurrency_limit_shed_total', "Requêtes refusées sans appel (file pleine ou attente trop longue).",
+    ('upstream', 'reason'))
+
+
+class Overloaded(Exception):
+    """Requête refusée par la limite de concurrence : l'upstream est saturé."""
+
+    def __init__(self, upstream, reason, retry_after=1):
+        super().__init__(f"{upstream} saturé ({reason}).")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdaptiveLimit:
+    """Calcul de la limite (sans verrou : appelé sous celui du limiteur)."""
+
+    def __init__(self, min_limit=DEFAULT_LIMIT_MIN, max_limit=10, initial=None,
+                 tolerance=DEFAULT_LATENCY_TOLERANCE, backoff=BACKOFF):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(initial if initial is not None else max(self.min_limit, self.max_limit // 2))
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.min_latency = None      # référence : latence sans file d'attente
+        self._window_min = float('inf')
+        self._window_started = None
+        self.average = None
+        self.samples = 0
+        self.decreased_at = float('-inf')
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def value(self):
+        return max(self.min_limit, min(self.max_limit, int(self.limit)))
+
+    def update(self, started, latency, in_flight, dropped, now):
+        """started : instant d'entrée de l'appel, in_flight : appels en cours à ce moment (lui compris)."""
+        self.samples += 1
+        self.average = latency if self.average is None else (
+            self.average + (latency - self.average) * LATENCY_SMOOTHING)
+        self._track_min_latency(latency, now)
+        slow = latency > max(self.min_latency * self.tolerance, self.min_latency + MIN_LATENCY_SLACK)
+        if (dropped or slow) and self.samples > WARMUP_SAMPLES:
+            if started >= self.decreased_at:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.decreased_at = now
+                self.decreases += 1
+        elif not dropped and not slow and in_flight * 2 >= self.value:
+            # Limite utilisée au moins à moitié : on sonde un cran plus haut
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.increases += 1
+
+    def _track_min_latency(self, latency, now):
+        if self._window_started is None:
+            self._window_started = now
+        self._window_min = min(self._window_min, latency)
+        self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+        if now - self._window_started >= MIN_LATENCY_WINDOW:
+            # Nouvelle référence : le minimum de la fenêtre écoulée (l'ancien a pu devenir inatteignable)
+            self.min_latency = self._window_min
+            self._window_min = float('inf')
+            self._window_started = now
+
+
+class _BaseLimiter:
+    def __init__(self, name, limit, queue_size, queue_timeout, failures, clock):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.failures = tuple(failures)
+        self.clock = clock
+        self.in_flight = 0
+        self.waiting = 0
+        self.accepted = 0
+        self.queued = 0
+        self.shed = {'queue_full': 0, 'queue_timeout': 0}
+        LIMIT_GAUGE.set(limit.value, upstream=name)
+
+    def _queue_wait(self):
+        """Attente maximale dans la file : queue_timeout, raccourci au temps restant de la requête."""
+        left = deadline.remaining()
+        return self.queue_timeout if left is None else max(0.0, min(self.queue_timeout, left))
+
+    def _shed(self, reason):
+        self.shed[reason] += 1
+        SHED.inc(upstream=self.name, reason=reason)
+        return Overloaded(self.name, reason)
+
+    def _record(self, started, in_flight, error):
+        """Fin d'un appel ; error : exception levée pendant l'appel (None si réussi).
+        Les exceptions hors `failures` (disjoncteur ouvert...) ne disent rien de la latence."""
+        if error is not None and not isinstance(error, self.failures):
+            return
+        now = self.clock()
+        self.limit.update(started, now - started, in_flight, error is not None, now)
+        LIMIT_GAUGE.set(self.limit.value, upstream=self.name)
+
+    def _stats(self):
+        return {
+            "limit": self.limit.value,
+            "min_limit": self.limit.min_limit,
+            "max_limit": self.limit.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "queue_size": self.queue_size,
+            "queue_timeout": self.queue_timeout,
+            "min_latency_ms": round(self.limit.min_latency * 1000, 2) if self.limit.min_latency is not None else None,
+            "avg_latency_ms": round(self.limit.average * 1000, 2) if self.limit.average is not None else None,
+            "accepted": self.accepted,
+            "queued": self.queued,
+            "shed": dict(self.shed),
+            "increases": self.limit.increases,
+            "decreases": self.limit.decreases,
+        }
+
+
+class ConcurrencyLimiter(_BaseLimiter):
+    """Version threads (Gateway synchrone, common.upstream.UpstreamClient)."""
+
+    def __init__(self, name, limit, queue_size=10, queue_timeout=DEFAULT_QUEUE_TIMEOUT, failures=(),
+                 clock=time.monotonic):
+        super().__init__(name, limit, queue_size, queue_timeout, failures, clock)
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Occupe une place le temps de l'appel ; Overloaded si la file est pleine ou l'attente trop longue."""
+        with self._cond:
+            if self.in_flight >= self.limit.value or self.waiting:
+                if self.waiting >= self.queue_size:
+                    raise self._shed('queue_full')
+                self.waiting += 1
+                self.queued += 1
+                try:
+                    if not self._cond.wait_for(lambda: self.in_flight < self.limit.value, self._queue_wait()):
+                        raise self._shed('queue_timeout')
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.accepted += 1
+            in_flight = self.in_flight
+        started = self.clock()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._record(started, in_flight, error)
+                # La limite a pu monter : autant de places libres que de requêtes réveillées
+                self._cond.notify(max(1, self.limit.value - self.in_flight))
+
+    def stats(self):
+        with self._cond:
+            return self._stats()
+
+
+class AsyncConcurrencyLimiter(_BaseLimiter):
+    """Version asyncio (gateway_async.py) : pas de verrou, tout se passe dans l'event loop ;
+    une place libérée passe directement à la plus ancienne requête en attente."""
+
+    def __init__(self, name, limit, queue_size=10, queue_timeout=DEFAULT_QUEUE_TIMEOUT, failures=(),
+                 clock=time.monotonic):
+        super().__init__(name, limit, queue_size, queue_timeout, failures, clock)
+        self._waiters = deque()
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.in_flight >= self.limit.value or self._waiters:
+            if len(self._waiters) >= self.queue_size:
+                raise self._shed('queue_full')
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self.waiting = len(self._waiters)
+            self.queued += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self._queue_wait())
+            except BaseException as e:
+                if waiter.done():
+                    self._release_slot()   # place reçue trop tard (délai, annulation) : transmise au suivant
+                else:
+                    waiter.cancel()
+                    self._waiters.remove(waiter)
+                self.waiting = len(self._waiters)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._shed('queue_timeout') from None
+                raise
+        else:
+            self.in_flight += 1
+        self.accepted += 1
+        in_flight = self.in_flight
+        started = self.clock()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._record(started, in_flight, error)
+            self._release_slot()
+
+    def _release_slot(self):
+        """Libère une place, ou la transmet aux requêtes en attente (la limite a pu monter)."""
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < self.limit.value:
+            waiter = self._waiters.popleft()
+            self.in_flight += 1
+            waiter.set_result(True)
+        self.waiting = len(self._waiters)
+
+    def stats(self):
+        return self._stats()
@@ -0,0 +1,87 @@
+'''Délai maximal d'une requête, transmis d'un service à l'autre.
+Le premier service fixe le budget ; chaque appel interne porte le temps restant
+(X-Request-Deadline-Ms) et ne peut pas attendre plus longtemps. Un service qui reçoit
+une requête dont le budget est déjà épuisé répond 504 sans rien faire.'''
+
+# common/deadline.py
+import contextvars
+import time
+
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Plus de temps pour appeler un autre service."""
+
+
+def parse_budget(value, default=None):
+    """Budget en secondes : min(en-tête reçu, défaut du service) ; None = pas de limite."""
+    try:
+        received = float(value) / 1000 if value is not None else None
+    except ValueError:
+        received = None
+    if received is None:
+        return default
+    return received if default is None else min(received, default)
+
+
+def start(budget):
+    """Ouvre le délai de la requête en cours (budget en secondes, ou None)."""
+    return _deadline.set(time.monotonic() + budget if budget is not None else None)
+
+
+def end(token):
+    _deadline.reset(token)
+
+
+def remaining():
+    """Secondes restantes pour la requête en cours (None : pas de délai)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def bound_timeout(timeout):
+    """Timeout d'un appel interne, raccourci au temps restant ; DeadlineExceeded s'il ne reste rien."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Délai de la requête dépassé.")
+    if timeout is None:
+        return left
+    if isinstance(timeout, tuple):
+        return tuple(min(part, left) for part in timeout)
+    return min(timeout, left)
+
+
+def outgoing_headers(headers=None):
+    """En-têtes d'un appel interne, complétés du temps restant (ms)."""
+    headers = dict(headers or {})
+    left = remaining()
+    if left is not None:
+        headers[DEADLINE_HEADER] = str(max(0, int(left * 1000)))
+    return headers
+
+
+def instrument_flask(app, budget=None):
+    """Délai de chaque requête : `budget` secondes (ou None), réduit par l'en-tête reçu ; 504 s'il est épuisé."""
+    from flask import g, jsonify, request
+
+    @app.before_request
+    def _deadline_start():
+        seconds = parse_budget(request.headers.get(DEADLINE_HEADER), budget)
+        g._deadline_token = start(seconds)
+        if seconds is not None and seconds <= 0:
+            return jsonify({"message": "Délai de la requête dépassé.", "status": "error_timeout"}), 504
+
+    @app.teardown_request
+    def _deadline_end(exc):
+        token = g.pop('_deadline_token', None)
+        if token is not None:
+            end(token)
+
+    return app
@@ -0,0 +1,203 @@
+'''Écriture différée groupée ("group commit") des commandes.
+Les requêtes déposent leurs commandes dans une file bornée ; un unique thread
+écrivain regroupe ce qui est en attente et l'écrit en une fois avec un seul fsync.
+Chaque requête n'est libérée qu'une fois son lot durable.'''
+
+# common/group_commit.py
+import queue
+import threading
+import time
+from common.metrics import SECTION_DURATION
+
+
+class WriteQueueFull(Exception):
+    """La file d'écriture est pleine : le service est surchargé."""
+
+
+class WriteTimeout(Exception):
+    """Écriture non confirmée dans le délai.
+    may_be_written=False : retirée de la file avant écriture, rien n'a été écrit.
+    may_be_written=True : le lot était déjà en cours d'écriture, le résultat est inconnu."""
+
+    def __init__(self, message, may_be_written):
+        super().__init__(message)
+        self.may_be_written = may_be_written
+
+
+class _Pending:
+    __slots__ = ('entries', 'done', 'seqs', 'error', 'claimed', 'cancelled')
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.done = threading.Event()
+        self.seqs = None
+        self.error = None
+        self.claimed = False     # pris dans un lot par l'écrivain
+        self.cancelled = False   # abandonné par l'appelant avant d'être pris
+
+
+class GroupCommitWriter:
+    """Thread écrivain unique devant un OrderStore.
+    - max_batch : nombre maximal de commandes par écriture,
+    - max_delay : attente maximale (secondes) pour compléter un lot après la première commande.
+    Plus max_delay est grand, plus les lots sont gros (débit) et plus la latence augmente."""
+
+    def __init__(self, store, max_batch=256, max_delay=0.002, queue_size=10000, enqueue_timeout=0.5,
+                 commit_timeout=10.0):
+        self.store = store
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.enqueue_timeout = enqueue_timeout
+        self.commit_timeout = commit_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stats_lock = threading.Lock()
+        self._claim_lock = threading.Lock()
+        self._stopped = False
+
+        # Métriques
+        self.batches = 0
+        self.orders_written = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.max_queue_depth = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.write_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name='order-group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, entries, timeout=None):
+        """Dépose une liste de (user, order) et attend qu'elle soit durable.
+        Retourne les numéros de séquence ; lève WriteQueueFull si la file est saturée
+        et WriteTimeout si l'écriture n'est pas confirmée en commit_timeout secondes
+        (ou `timeout` s'il est plus court, ex. le temps restant de la requête)."""
+        wait = self.commit_timeout if timeout is None else max(0.0, min(timeout, self.commit_timeout))
+        if self._stopped:
+            raise RuntimeError("Écrivain arrêté.")
+        pending = _Pending(entries)
+        try:
+            self._queue.put(pending, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise WriteQueueFull("File d'écriture des commandes saturée.")
+
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            with self._stats_lock:
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+
+        if not pending.done.wait(wait):
+            with self._claim_lock:
+                # Encore en file : l'écrivain l'ignorera, rien ne sera écrit
+                pending.cancelled = not pending.claimed
+            with self._stats_lock:
+                self.timeouts += 1
+            if pending.cancelled:
+                raise WriteTimeout("Écriture des commandes trop lente.", may_be_written=False)
+            raise WriteTimeout("Écriture des commandes non confirmée.", may_be_written=True)
+        if pending.error is not None:
+            raise pending.error
+        return pending.seqs
+
+    def _collect(self, first):
+        """Complète le lot jusqu'à max_batch commandes ou max_delay secondes."""
+        batch = [first]
+        count = len(first.entries)
+        stop = False
+        deadline = time.monotonic() + self.max_delay
+        while count < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                # Arrêt demandé : on termine ce lot puis on s'arrête
+                stop = True
+                break
+            batch.append(item)
+            count += len(item.entries)
+        return batch, count, stop
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, count, stop = self._collect(first)
+            with self._claim_lock:
+                batch = [pending for pending in batch if not pending.cancelled]
+                for pending in batch:
+                    pending.claimed = True
+            if not batch:
+                continue
+            count = sum(len(pending.entries) for pending in batch)
+
+            entries = [entry for pending in batch for entry in pending.entries]
+            started = time.perf_counter()
+            try:
+                seqs = self.store.append_many(entries, sync=True)
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+                    pending.done.set()
+                continue
+            elapsed = time.perf_counter() - started
+            SECTION_DURATION.observe(elapsed, section='store.append_many')
+
+            position = 0
+            for pending in batch:
+                pending.seqs = seqs[position:position + len(pending.entries)]
+                position += len(pending.entries)
+                pending.done.set()
+
+            with self._stats_lock:
+                self.batches += 1
+                self.orders_written += count
+                self.last_batch_size = count
+                self.max_batch_size = max(self.max_batch_size, count)
+                self.write_seconds += elapsed
+
+        # Commandes déposées après la demande d'arrêt : refusées
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if pending is not None:
+                pending.error = RuntimeError("Écrivain arrêté.")
+                pending.done.set()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_delay_ms": self.max_delay * 1000,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "max_queue_depth": self.max_queue_depth,
+                "batches": self.batches,
+                "orders_written": self.orders_written,
+                "avg_batch_size": round(self.orders_written / self.batches, 2) if self.batches else 0.0,
+                "last_batch_size": self.last_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "avg_write_ms": round(self.write_seconds * 1000 / self.batches, 3) if self.batches else 0.0,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+
+    def close(self):
+        """Écrit ce qui reste en file puis arrête le thread écrivain."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,47 @@
+'''Filtrage des en-têtes HTTP lors du relais d'une requête ou d'une réponse par le Gateway.
+Les en-têtes "hop-by-hop" (RFC 9110 §7.6.1) ne concernent qu'une seule connexion :
+les recopier tels quels casse la réponse (ex : Transfer-Encoding: chunked sur un
+corps déjà décodé, Content-Length d'un corps décompressé).'''
+
+# common/http_headers.py
+
+HOP_BY_HOP_HEADERS = frozenset((
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade',
+))
+
+# En-tête posé par le Gateway pour transmettre l'utilisateur authentifié au Orders Service
+AUTHENTICATED_USER_HEADER = 'X-Authenticated-User'
+
+
+def _connection_tokens(headers):
+    """En-têtes supplémentaires déclarés hop-by-hop via `Connection: a, b`."""
+    tokens = set()
+    for name, value in headers:
+        if name.lower() == 'connection':
+            tokens.update(token.strip().lower() for token in value.split(','))
+    return tokens
+
+
+def filter_headers(headers, drop=()):
+    """Retourne la liste (nom, valeur) sans les en-têtes hop-by-hop ni ceux de `drop`."""
+    headers = list(headers)
+    excluded = HOP_BY_HOP_HEADERS | _connection_tokens(headers) | {name.lower() for name in drop}
+    return [(name, value) for name, value in headers if name.lower() not in excluded]
+
+
+def filter_buffered_response_headers(headers):
+    """Pour un corps déjà lu et décodé par `requests` (response.content) :
+    la longueur et l'encodage d'origine ne correspondent plus, Flask les recalcule."""
+    return filter_headers(headers, drop=('content-length', 'content-encoding'))
+
+
+def client_ip(remote_addr, forwarded_for=None, trusted_proxies=()):
+    """Adresse du client : derrière un proxy de confiance (ex. le Front), la dernière adresse de
+    X-Forwarded-For qui n'est pas elle-même un proxy de confiance ; sinon l'adresse de la connexion."""
+    if not forwarded_for or remote_addr not in trusted_proxies:
+        return remote_addr
+    for address in reversed([part.strip() for part in forwarded_for.split(',')]):
+        if address and address not in trusted_proxies:
+            return address
+    return remote_addr
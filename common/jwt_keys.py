@@ -0,0 +1,373 @@
+'''Clés de signature des JWT (EdDSA ou RS256) identifiées par un `kid`, et vérification locale.
+- Auth Service : KeyRing lit les clés privées de JWT_KEYS_DIR (un fichier PEM par clé, nom = kid),
+  publie les clés publiques (JWKS) et signe avec la plus récente. Rotation : une nouvelle clé est
+  ajoutée (python -m common.jwt_keys rotate), le répertoire est relu toutes les
+  JWT_KEYS_CHECK_INTERVAL secondes ; la clé est publiée tout de suite mais ne sert à signer
+  qu'après JWT_KEY_ACTIVATION_DELAY secondes (les vérificateurs l'ont alors déjà, ou la
+  téléchargent au premier token qui la cite) ; les anciennes clés restent publiées tant qu'elles
+  sont gardées.
+- Gateway / Orders Service : JWKSVerifier garde le JWKS en cache (rechargé en tâche de fond toutes
+  les JWKS_REFRESH_INTERVAL secondes) et vérifie les tokens sans appeler l'Auth Service. Un kid
+  inconnu déclenche un rechargement immédiat (au plus un toutes les JWKS_MIN_REFRESH_INTERVAL
+  secondes) ; s'il reste inconnu, la décision revient à l'Auth Service (None).
+Chaque clé n'accepte que son propre algorithme : un token HS256 ne peut pas se faire passer pour
+un token signé par une clé publique.'''
+
+# common/jwt_keys.py
+import argparse
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.request
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+JWT_ALGORITHM = os.environ.get('AUTH_JWT_ALGORITHM', 'HS256')      # HS256 | EdDSA | RS256
+JWT_KEYS_DIR = os.environ.get('AUTH_JWT_KEYS_DIR', 'jwt_keys')
+JWT_KEYS_KEEP = int(os.environ.get('AUTH_JWT_KEYS_KEEP', 3))
+JWT_KEYS_CHECK_INTERVAL = float(os.environ.get('AUTH_JWT_KEYS_CHECK_INTERVAL', 5))   # secondes
+JWT_KEY_ACTIVATION_DELAY = float(os.environ.get('AUTH_JWT_KEY_ACTIVATION_DELAY', 15))  # secondes
+JWKS_REFRESH_INTERVAL = float(os.environ.get('JWKS_REFRESH_INTERVAL', 300))           # secondes
+JWKS_MIN_REFRESH_INTERVAL = float(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 5))     # secondes
+JWKS_TIMEOUT = float(os.environ.get('JWKS_TIMEOUT', 2))                               # secondes
+
+ASYMMETRIC_ALGORITHMS = ('EdDSA', 'RS256')
+RSA_KEY_SIZE = 2048
+
+
+class KeysUnavailable(Exception):
+    """Le JWKS n'a pas pu être téléchargé et aucune clé n'est en cache."""
+
+
+def key_algorithm(private_key):
+    if isinstance(private_key, ed25519.Ed25519PrivateKey):
+        return 'EdDSA'
+    if isinstance(private_key, rsa.RSAPrivateKey):
+        return 'RS256'
+    raise ValueError(f"Type de clé non pris en charge : {type(private_key).__name__}")
+
+
+def public_jwk(kid, algorithm, public_key):
+    implementation = jwt.algorithms.get_default_algorithms()[algorithm]
+    jwk = implementation.to_jwk(public_key, as_dict=True)
+    jwk.update(kid=kid, alg=algorithm, use='sig')
+    return jwk
+
+
+def generate_key(directory, algorithm):
+    """Crée une clé privée (PEM, lisible par le seul propriétaire) et retourne son kid.
+    Le kid commence par la date de création : l'ordre des noms est l'ordre des clés."""
+    if algorithm == 'EdDSA':
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    elif algorithm == 'RS256':
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=RSA_KEY_SIZE)
+    else:
+        raise ValueError(f"Algorithme asymétrique attendu ({', '.join(ASYMMETRIC_ALGORITHMS)}) : {algorithm}")
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    os.makedirs(directory, exist_ok=True)
+    now_ns = time.time_ns()
+    kid = (time.strftime('%Y%m%d%H%M%S', time.gmtime(now_ns // 10**9))
+           + f'{now_ns % 10**9:09d}-{secrets.token_hex(4)}')
+    tmp_path = os.path.join(directory, f'.{kid}.tmp')
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pem)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(directory, f'{kid}.pem'))
+    return kid
+
+
+def key_ids(directory):
+    """kid des clés du répertoire, de la plus ancienne à la plus récente."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-4] for name in names if name.endswith('.pem') and not name.startswith('.'))
+
+
+def prune_keys(directory, keep=JWT_KEYS_KEEP):
+    """Supprime les clés au-delà des `keep` plus récentes ; retourne les kid supprimés."""
+    removed = key_ids(directory)[:-keep] if keep > 0 else []
+    for kid in removed:
+        os.remove(os.path.join(directory, f'{kid}.pem'))
+    return removed
+
+
+class _DirectoryLock:
+    """Verrou exclusif entre processus (plusieurs workers Auth créent la première clé une seule fois)."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(os.path.join(directory, '.lock'), 'a')
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()  # libère le verrou
+
+
+class KeyRing:
+    """Clés privées de l'Auth Service : { kid -> (algorithme, clé privée, date de création) },
+    relues si le répertoire change."""
+
+    def __init__(self, directory=JWT_KEYS_DIR, algorithm=JWT_ALGORITHM, check_interval=JWT_KEYS_CHECK_INTERVAL,
+                 activation_delay=JWT_KEY_ACTIVATION_DELAY):
+        self.directory = directory
+        self.algorithm = algorithm
+        self.check_interval = check_interval
+        self.activation_delay = activation_delay
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._jwks = {"keys": []}
+        self._loaded_ids = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        if algorithm in ASYMMETRIC_ALGORITHMS:
+            with _DirectoryLock(directory):
+                if not any(self._algorithm_of(kid) == algorithm for kid in key_ids(directory)):
+                    generate_key(directory, algorithm)
+        self._reload(force=True)
+
+    @property
+    def asymmetric(self):
+        return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+    def _algorithm_of(self, kid):
+        try:
+            return key_algorithm(self._read(kid))
+        except (OSError, ValueError):
+            return None
+
+    def _read(self, kid):
+        with open(os.path.join(self.directory, f'{kid}.pem'), 'rb') as f:
+            return serialization.load_pem_private_key(f.read(), password=None)
+
+    def _created_at(self, kid):
+        return os.stat(os.path.join(self.directory, f'{kid}.pem')).st_mtime
+
+    def _reload(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+        ids = key_ids(self.directory)
+        if ids == self._loaded_ids:
+            return
+        keys = {}
+        for kid in ids:
+            try:
+                private_key = self._read(kid)
+                keys[kid] = (key_algorithm(private_key), private_key, self._created_at(kid))
+            except (OSError, ValueError) as e:
+                print(f"Clé JWT ignorée ({kid}) : {e}")
+        jwks = {"keys": [public_jwk(kid, algorithm, key.public_key()) for kid, (algorithm, key, _) in keys.items()]}
+        with self._lock:
+            self._keys = keys
+            self._jwks = jwks
+            self._loaded_ids = ids
+            self.reloads += 1
+
+    def signing_key(self):
+        """(kid, algorithme, clé privée) de la clé active la plus récente de l'algorithme configuré
+        (la plus ancienne si aucune n'est encore active, ex. premier démarrage)."""
+        self._reload()
+        active_before = time.time() - self.activation_delay
+        with self._lock:
+            candidates = [(kid, entry) for kid, entry in sorted(self._keys.items(), reverse=True)
+                          if entry[0] == self.algorithm]
+        if not candidates:
+            raise KeysUnavailable(f"Aucune clé {self.algorithm} dans {self.directory}.")
+        for kid, (algorithm, private_key, created_at) in candidates:
+            if created_at <= active_before:
+                return kid, algorithm, private_key
+        kid, (algorithm, private_key, _) = candidates[-1]
+        return kid, algorithm, private_key
+
+    def verification_key(self, kid):
+        """(algorithme, clé publique) du kid, ou None ; un kid inconnu force une relecture du répertoire
+        (un autre worker vient peut-être de créer la clé)."""
+        self._reload()
+        with self._lock:
+            entry = self._keys.get(kid)
+        if entry is None:
+            self._reload(force=True)
+            with self._lock:
+                entry = self._keys.get(kid)
+        if entry is None:
+            return None
+        algorithm, private_key, _ = entry
+        return algorithm, private_key.public_key()
+
+    def jwks(self):
+        self._reload()
+        with self._lock:
+            return self._jwks
+
+    def stats(self):
+        with self._lock:
+            return {"algorithm": self.algorithm, "keys": len(self._keys), "reloads": self.reloads}
+
+
+def decode_with_key(token, algorithm, key):
+    """Même format de résultat que check_access_token de l'Auth Service."""
+    try:
+        payload = jwt.decode(token, key, algorithms=[algorithm])
+        return {"status": "valid", "user": payload['user'], "exp": payload.get('exp')}
+    except jwt.ExpiredSignatureError:
+        return {"status": "expired", "message": "Token expiré."}
+    except (jwt.PyJWTError, KeyError):
+        return {"status": "invalid", "message": "Token invalide."}
+
+
+def fetch_jwks(url, timeout=JWKS_TIMEOUT):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+class JWKSVerifier:
+    """Vérification locale des tokens signés par une clé publiée dans le JWKS de l'Auth Service.
+    fetch() -> document JWKS ({"keys": [...]}) ; par défaut un GET de `url`."""
+
+    def __init__(self, url=None, fetch=None, refresh_interval=JWKS_REFRESH_INTERVAL,
+                 min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL):
+        self.fetch = fetch or (lambda: fetch_jwks(url))
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._keys = {}             # kid -> (algorithme, clé publique)
+        self._fetched_at = None     # monotonic du dernier téléchargement réussi
+        self._attempted_at = None   # monotonic de la dernière tentative
+        self._background = False
+        self.verified = 0
+        self.fallbacks = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def refresh(self, min_age=None):
+        """Télécharge le JWKS ; les clés en cache restent utilisées si le téléchargement échoue.
+        min_age : rien n'est fait si une tentative a eu lieu il y a moins de min_age secondes
+        (les requêtes arrivées pendant un téléchargement n'en relancent pas un autre)."""
+        with self._refresh_lock:
+            with self._lock:
+                now = time.monotonic()
+                if min_age is not None and self._attempted_at is not None and now - self._attempted_at < min_age:
+                    return False
+                self._attempted_at = now
+            try:
+                document = self.fetch()
+                keys = {}
+                for jwk in document.get('keys', ()):
+                    if jwk.get('alg') in ASYMMETRIC_ALGORITHMS and jwk.get('kid'):
+                        keys[jwk['kid']] = (jwk['alg'], jwt.PyJWK(jwk, jwk['alg']).key)
+            except Exception as e:  # réseau, JSON ou clé illisible : même traitement
+                with self._lock:
+                    self.refresh_errors += 1
+                print(f"Téléchargement du JWKS impossible : {e}")
+                return False
+            with self._lock:
+                self._keys = keys
+                self._fetched_at = time.monotonic()
+                self.refreshes += 1
+            return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._background:
+                return
+            self._background = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._background = False
+
+        threading.Thread(target=run, name='jwks-refresh', daemon=True).start()
+
+    def _lookup(self, kid, fetch):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._keys.get(kid)
+            stale = self._fetched_at is None or now - self._fetched_at >= self.refresh_interval
+            may_retry = self._attempted_at is None or now - self._attempted_at >= self.min_refresh_interval
+        if entry is not None:
+            if stale and may_retry:
+                self._refresh_in_background()
+            return entry
+        if not may_retry:
+            return None
+        if not fetch:
+            raise KeysUnavailable(f"Clé {kid} absente du cache.")
+        self.refresh(min_age=self.min_refresh_interval)
+        with self._lock:
+            return self._keys.get(kid)
+
+    def check(self, token, fetch=True):
+        """{"status": "valid" | "expired" | "invalid", ...}, ou None si la décision revient à
+        l'Auth Service (token sans kid, ex. HS256 ; kid inconnu ; JWKS indisponible).
+        fetch=False : lève KeysUnavailable au lieu de télécharger le JWKS (boucle asyncio)."""
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError:
+            return {"status": "invalid", "message": "Token invalide."}
+        kid = header.get('kid')
+        if not isinstance(kid, str) or header.get('alg') not in ASYMMETRIC_ALGORITHMS:
+            self._count_fallback()
+            return None
+        entry = self._lookup(kid, fetch)
+        if entry is None:
+            self._count_fallback()
+            return None
+        with self._lock:
+            self.verified += 1
+        return decode_with_key(token, *entry)
+
+    def _count_fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self):
+        with self._lock:
+            age = None if self._fetched_at is None else round(time.monotonic() - self._fetched_at, 1)
+            return {"keys": len(self._keys), "verified": self.verified, "fallbacks": self.fallbacks,
+                    "refreshes": self.refreshes, "refresh_errors": self.refresh_errors, "age_seconds": age}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rotation des clés de signature des JWT (Auth Service).")
+    parser.add_argument('command', choices=['rotate', 'list'])
+    parser.add_argument('--dir', default=JWT_KEYS_DIR, help=f"répertoire des clés ({JWT_KEYS_DIR})")
+    parser.add_argument('--alg', default=JWT_ALGORITHM if JWT_ALGORITHM in ASYMMETRIC_ALGORITHMS else 'EdDSA',
+                        choices=ASYMMETRIC_ALGORITHMS)
+    parser.add_argument('--keep', type=int, default=JWT_KEYS_KEEP,
+                        help=f"clés gardées après la rotation ({JWT_KEYS_KEEP})")
+    args = parser.parse_args(argv)
+    if args.command == 'rotate':
+        with _DirectoryLock(args.dir):
+            kid = generate_key(args.dir, args.alg)
+            removed = prune_keys(args.dir, max(args.keep, 1))
+        print(f"Nouvelle clé {args.alg} : {kid}" + (f" ; supprimée(s) : {', '.join(removed)}" if removed else ""))
+    for kid in key_ids(args.dir):
+        print(kid)
+
+
+if __name__ == '__main__':
+    main()
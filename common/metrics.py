@@ -0,0 +1,282 @@
+'''Métriques au format texte Prometheus (exposées sur /metrics par chaque service).
+- compteurs, jauges et histogrammes à buckets fixes, avec étiquettes,
+- instrumentation Flask : latence par route, requêtes en cours,
+- sections internes chronométrées (bcrypt, requêtes SQLite, écriture du journal...),
+- statistiques existantes (dict de stats()) exportées telles quelles en jauges.
+Une observation = un verrou + une recherche dichotomique : assez léger pour rester actif en production.'''
+
+# common/metrics.py
+import bisect
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from common.tracing import record_span
+
+# Secondes : de 0,5 ms (cache, SQLite) à 10 s (timeouts)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} : étiquettes attendues {self.labelnames}, reçues {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [compte par bucket (non cumulé)..., +Inf], somme
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Ensemble des métriques d'un processus (get-or-create par nom)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._stats_sources = {}
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Métrique {name} déjà déclarée autrement.")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_stats(self, prefix, stats_fn):
+        """Exporte les valeurs numériques de stats_fn() (dict, éventuellement imbriqué)
+        en jauges `<prefix>_<clé>` lues au moment du scrape."""
+        with self._lock:
+            self._stats_sources[prefix] = stats_fn
+
+    def _render_stats(self):
+        lines = []
+        with self._lock:
+            sources = sorted(self._stats_sources.items())
+        for prefix, stats_fn in sources:
+            try:
+                stats = stats_fn()
+            except Exception:
+                continue  # une source en erreur ne doit pas casser tout le scrape
+            for name, value in _flatten(prefix, stats):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return lines
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        lines.extend(self._render_stats())
+        # Temps CPU du processus (utilisateur + système) : coût CPU par requête entre deux scrapes
+        lines.append("# HELP process_cpu_seconds_total Temps CPU consommé par le processus.")
+        lines.append("# TYPE process_cpu_seconds_total counter")
+        lines.append(f"process_cpu_seconds_total {_format_value(time.process_time())}")
+        return '\n'.join(lines) + '\n'
+
+
+def _flatten(prefix, value):
+    if isinstance(value, bool):
+        yield prefix, int(value)
+    elif isinstance(value, (int, float)):
+        yield prefix, value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            name = ''.join(c if c.isalnum() else '_' for c in str(key))
+            yield from _flatten(f"{prefix}_{name}", item)
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', "Requêtes HTTP traitées.", ('service', 'method', 'route', 'status'))
+HTTP_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds', "Durée de traitement des requêtes HTTP.", ('service', 'method', 'route'))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'http_requests_in_flight', "Requêtes HTTP en cours de traitement.", ('service',))
+UPSTREAM_DURATION = REGISTRY.histogram(
+    'upstream_request_duration_seconds', "Durée des appels vers les autres services.",
+    ('upstream', 'method', 'outcome'))
+SECTION_DURATION = REGISTRY.histogram(
+    'section_duration_seconds', "Durée des sections internes chronométrées.", ('section',))
+
+
+@contextmanager
+def timed_section(section):
+    """with timed_section('db.get_user'): ...  (aussi ajouté comme span à la trace de la requête)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SECTION_DURATION.observe(elapsed, section=section)
+        record_span(section, started, elapsed)
+
+
+def timed(section):
+    """Décorateur : chronomètre chaque appel de la fonction dans la section `section`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed_section(section):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_upstream(upstream, method, outcome, seconds):
+    UPSTREAM_DURATION.observe(seconds, upstream=upstream, method=method, outcome=outcome)
+
+
+def instrument_flask(app, service):
+    """Latence par route + requêtes en cours pour une application Flask, et route GET /metrics."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(service=service)
+
+    @app.after_request
+    def _metrics_record(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            # Règle de routage (/orders/<user>/history) et non l'URL : nombre de séries borné
+            route = request.url_rule.rule if request.url_rule is not None else 'non_route'
+            HTTP_DURATION.observe(time.perf_counter() - started,
+                                  service=service, method=request.method, route=route)
+            HTTP_REQUESTS.inc(service=service, method=request.method, route=route,
+                              status=response.status_code)
+            HTTP_IN_FLIGHT.dec(service=service)
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown(exc):
+        # Requête interrompue avant after_request : la jauge doit redescendre quand même
+        if g.pop('_metrics_started', None) is not None:
+            HTTP_IN_FLIGHT.dec(service=service)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    return app
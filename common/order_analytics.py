@@ -0,0 +1,296 @@
+'''Statistiques des commandes tenues à jour à chaque écriture (agrégats matérialisés).
+- par utilisateur : commandes, articles, chiffre d'affaires,
+- par article : commandes, quantité vendue, chiffre d'affaires,
+- par jour ('AAAA-MM-JJ') : commandes, articles, chiffre d'affaires,
+Les montants sont des centimes entiers (pas d'erreur d'arrondi cumulée). Chaque lot écrit dans
+le journal est ajouté aux compteurs (coût proportionnel au lot, jamais au volume total) ; une
+lecture ne fait que copier des compteurs.
+Les agrégats sont sauvegardés (snapshot) avec le numéro de séquence du journal qu'ils couvrent :
+au démarrage, seules les commandes écrites après ce numéro sont rejouées.
+Une commande est comptée une fois, sur sa version écrite avec un statut comptable (sans statut,
+ou hors NOT_COUNTED_STATUSES) : une commande comptée ne doit plus être réécrite.
+
+Vérification (le service peut tourner) et reconstruction (service arrêté) :
+    python -m common.order_analytics [--log orders.log] [--snapshot orders_stats.json] [--write]'''
+
+# common/order_analytics.py
+import argparse
+import json
+import os
+import sys
+import threading
+
+from common.order_store import read_log
+
+ORDERS_LOG_FILE = 'orders.log'
+SNAPSHOT_FILE = os.environ.get('ORDERS_STATS_SNAPSHOT_FILE', 'orders_stats.json')
+SNAPSHOT_INTERVAL = float(os.environ.get('ORDERS_STATS_SNAPSHOT_INTERVAL', 30))   # secondes
+SNAPSHOT_FORMAT = 1
+
+# Commandes écrites mais pas (encore) payées : comptées plus tard, sur leur version payée
+NOT_COUNTED_STATUSES = frozenset(('pending', 'failed', 'rejected'))
+
+
+def to_cents(amount):
+    try:
+        return int(round(float(amount) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+
+def order_lines(order):
+    """(article, quantité, centimes) de chaque ligne ; article = article_id, ou nom pour les anciennes commandes."""
+    lines = []
+    for item in order.get('items') or ():
+        if not isinstance(item, dict):
+            continue
+        article = str(item.get('article_id') or item.get('article') or 'inconnu')
+        try:
+            quantity = int(item.get('quantity') or 0)
+        except (TypeError, ValueError):
+            quantity = 0
+        lines.append((article, quantity, to_cents(item.get('total_price', 0))))
+    return lines
+
+
+def is_counted(order):
+    return order.get('status') not in NOT_COUNTED_STATUSES
+
+
+def _counters():
+    return {"orders": 0, "items": 0, "revenue_cents": 0}
+
+
+def _add(counters, orders, items, revenue_cents):
+    counters["orders"] += orders
+    counters["items"] += items
+    counters["revenue_cents"] += revenue_cents
+
+
+class OrderAnalytics:
+    """Agrégats des commandes jusqu'à la séquence `seq` du journal."""
+
+    def __init__(self, seq=0, totals=None, users=None, articles=None, days=None):
+        self._lock = threading.Lock()
+        self.seq = seq
+        self.totals = totals or _counters()
+        self.users = users or {}
+        self.articles = articles or {}
+        self.days = days or {}
+        self._saved_seq = seq
+        self._summary = None       # (seq, résumé) : recalculé au plus une fois par écriture
+        self._stop = threading.Event()
+        self._snapshotter = None
+
+    # --- Mise à jour ---
+
+    def _apply(self, seq, user, order):
+        # Appelée avec self._lock pris
+        if seq <= self.seq:
+            return  # déjà compté (rejeu après un snapshot)
+        self.seq = seq
+        if not is_counted(order):
+            return
+        lines = order_lines(order)
+        items = sum(quantity for _, quantity, _ in lines)
+        revenue = to_cents(order['total']) if 'total' in order else sum(cents for _, _, cents in lines)
+        day = str(order.get('date') or '')[:10] or 'inconnu'
+        _add(self.totals, 1, items, revenue)
+        _add(self.users.setdefault(user, _counters()), 1, items, revenue)
+        _add(self.days.setdefault(day, _counters()), 1, items, revenue)
+        for index, (article, quantity, cents) in enumerate(lines):
+            # Un article présent sur plusieurs lignes ne compte qu'une commande
+            first = all(other != article for other, _, _ in lines[:index])
+            _add(self.articles.setdefault(article, _counters()), int(first), quantity, cents)
+
+    def apply(self, seq, user, order):
+        with self._lock:
+            self._apply(seq, user, order)
+
+    def apply_records(self, records):
+        """Abonné du journal (OrderStore.subscribe) : records = [{seq, user, order}] par seq croissante."""
+        with self._lock:
+            for record in records:
+                self._apply(int(record['seq']), record['user'], record['order'])
+
+    # --- Lecture (O(1) : aucune commande n'est relue) ---
+
+    def user_stats(self, user):
+        with self._lock:
+            return dict(self.users.get(user) or _counters())
+
+    def article_stats(self, article):
+        with self._lock:
+            return dict(self.articles.get(article) or _counters())
+
+    def day_stats(self, day):
+        with self._lock:
+            return dict(self.days.get(day) or _counters())
+
+    def summary(self):
+        """Totaux, détail par article et par jour, nombre d'utilisateurs (partagé : ne pas modifier)."""
+        with self._lock:
+            if self._summary is None or self._summary[0] != self.seq:
+                self._summary = (self.seq, {
+                    "seq": self.seq,
+                    "totals": dict(self.totals),
+                    "users": len(self.users),
+                    "articles": {article: dict(c) for article, c in self.articles.items()},
+                    "days": {day: dict(c) for day, c in sorted(self.days.items())},
+                })
+            return self._summary[1]
+
+    def stats(self):
+        with self._lock:
+            return dict(self.totals, seq=self.seq, saved_seq=self._saved_seq,
+                        users=len(self.users), articles=len(self.articles), days=len(self.days))
+
+    # --- Snapshot ---
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "format": SNAPSHOT_FORMAT,
+                "seq": self.seq,
+                "totals": dict(self.totals),
+                "users": {user: dict(c) for user, c in self.users.items()},
+                "articles": {article: dict(c) for article, c in self.articles.items()},
+                "days": {day: dict(c) for day, c in self.days.items()},
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict) or data.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError("Format de snapshot inconnu.")
+        return cls(int(data['seq']), dict(data['totals']), dict(data['users']),
+                   dict(data['articles']), dict(data['days']))
+
+    def save(self, path=SNAPSHOT_FILE):
+        """Écrit le snapshot (fichier temporaire + os.replace : jamais de snapshot à moitié écrit)."""
+        data = self.to_dict()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._saved_seq = data['seq']
+
+    @classmethod
+    def load(cls, path=SNAPSHOT_FILE):
+        """Agrégats du snapshot, ou None s'il est absent ou illisible (tout sera recalculé)."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Snapshot des statistiques ignoré ({path}) : {e}")
+            return None
+
+    def start_background_snapshots(self, path=SNAPSHOT_FILE, interval=SNAPSHOT_INTERVAL):
+        """Sauvegarde périodique, seulement si des commandes ont été écrites depuis la dernière."""
+        def run():
+            while not self._stop.wait(interval):
+                self.save_if_changed(path)
+
+        self._snapshotter = threading.Thread(target=run, name='order-stats-snapshot', daemon=True)
+        self._snapshotter.start()
+
+    def save_if_changed(self, path=SNAPSHOT_FILE):
+        with self._lock:
+            changed = self.seq != self._saved_seq
+        if changed:
+            try:
+                self.save(path)
+            except OSError as e:
+                print(f"Erreur de sauvegarde des statistiques des commandes : {e}")
+
+    def close(self, path=SNAPSHOT_FILE):
+        self._stop.set()
+        self.save_if_changed(path)
+
+
+def open_analytics(store, path=SNAPSHOT_FILE):
+    """Agrégats du snapshot complétés par les commandes écrites depuis, puis tenus à jour
+    à chaque lot écrit dans `store`. Recalculés depuis le journal si le snapshot manque
+    ou s'il est en avance sur le journal (journal remplacé ou restauré)."""
+    analytics = OrderAnalytics.load(path)
+    if analytics is None or analytics.seq > store.stats()['last_seq']:
+        analytics = OrderAnalytics()
+    store.subscribe(analytics.apply_records, after_seq=analytics.seq)
+    return analytics
+
+
+def rebuild(log_path, upto_seq=None):
+    """Agrégats recalculés depuis le journal brut (dernière version de chaque commande),
+    en s'arrêtant à upto_seq pour les comparer à un snapshot."""
+    latest = {}
+    last_seq = 0
+    for record in read_log(log_path):
+        seq = int(record['seq'])
+        if upto_seq is not None and seq > upto_seq:
+            continue
+        last_seq = max(last_seq, seq)
+        key = (record['user'], record['order'].get('order_id'))
+        if key not in latest or int(latest[key]['seq']) < seq:
+            latest[key] = record
+    analytics = OrderAnalytics()
+    analytics.apply_records(sorted(latest.values(), key=lambda record: int(record['seq'])))
+    analytics.seq = last_seq if upto_seq is None else upto_seq
+    return analytics
+
+
+def differences(expected, actual):
+    """Écarts entre deux agrégats (liste vide s'ils sont identiques)."""
+    expected, actual = expected.to_dict(), actual.to_dict()
+    found = []
+    for section in ('totals', 'users', 'articles', 'days'):
+        if section == 'totals':
+            pairs = [('', expected[section], actual[section])]
+        else:
+            keys = sorted(set(expected[section]) | set(actual[section]))
+            pairs = [(key, expected[section].get(key), actual[section].get(key)) for key in keys]
+        for key, want, got in pairs:
+            if want != got:
+                label = f"{section} {key}" if key else section
+                found.append(f"{label}: recalculé={want} snapshot={got}")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcule les statistiques des commandes depuis le journal "
+                                                 "et les compare au snapshot.")
+    parser.add_argument('--log', default=ORDERS_LOG_FILE, help=f"journal des commandes ({ORDERS_LOG_FILE})")
+    parser.add_argument('--snapshot', default=SNAPSHOT_FILE, help=f"snapshot des statistiques ({SNAPSHOT_FILE})")
+    parser.add_argument('--write', action='store_true',
+                        help="remplace le snapshot par le recalcul complet (Orders Service arrêté)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.log):
+        sys.exit(f"Journal des commandes introuvable : {args.log}")
+    if args.write:
+        rebuilt = rebuild(args.log)
+        rebuilt.save(args.snapshot)
+        print(f"Snapshot réécrit jusqu'à la séquence {rebuilt.seq} : {json.dumps(rebuilt.totals)}")
+        return
+
+    snapshot = OrderAnalytics.load(args.snapshot)
+    if snapshot is None:
+        rebuilt = rebuild(args.log)
+        print(f"Pas de snapshot ; recalcul jusqu'à la séquence {rebuilt.seq} : {json.dumps(rebuilt.totals)}")
+        return
+    # Le service a pu écrire après le snapshot : comparaison à la même séquence
+    rebuilt = rebuild(args.log, upto_seq=snapshot.seq)
+    found = differences(rebuilt, snapshot)
+    if found:
+        print(f"{len(found)} écart(s) à la séquence {snapshot.seq} :")
+        for line in found:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"Snapshot conforme au journal (séquence {snapshot.seq}) : {json.dumps(snapshot.totals)}")
+
+
+if __name__ == '__main__':
+    main()
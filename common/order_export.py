@@ -0,0 +1,114 @@
+'''Export des commandes en flux (NDJSON ou CSV) pour les rapprochements.
+- les commandes sont lues ligne à ligne dans le journal (OrderStore.scan) et envoyées par
+  blocs d'environ CHUNK_SIZE octets : la mémoire ne dépend pas du nombre de commandes,
+- NDJSON : la ligne du journal telle quelle ({seq, user, order}), sans la réencoder,
+- CSV : une ligne par article commandé (colonnes CSV_COLUMNS),
+- chaque commande porte sa `seq` : un export interrompu reprend après la dernière seq reçue
+  (after_seq), sur la même plage (until_seq).'''
+
+# common/order_export.py
+import csv
+import io
+import os
+
+from common.order_store import record_seq
+
+CHUNK_SIZE = int(os.environ.get('ORDERS_EXPORT_CHUNK_SIZE', 64 * 1024))
+
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+CSV_COLUMNS = ['seq', 'user', 'order_id', 'date', 'order_total', 'catalog_version',
+               'article_id', 'article', 'quantity', 'unit_price', 'total_price']
+
+# Fin de fichier relue pour reprendre un export (une commande y tient largement)
+RESUME_TAIL_BYTES = 1024 * 1024
+
+
+def in_date_range(order, date_from=None, date_to=None):
+    """Bornes incluses, 'AAAA-MM-JJ' ou 'AAAA-MM-JJ HH:MM:SS' (comparaison de chaînes, comme l'historique)."""
+    date = str(order.get('date') or '')
+    if date_from and date < date_from:
+        return False
+    if date_to and date > date_to + '\uffff':
+        return False
+    return True
+
+
+def csv_rows(record):
+    order = record['order']
+    common = [record['seq'], record['user'], order.get('order_id'), order.get('date'),
+              order.get('total'), order.get('catalog_version', '')]
+    items = [item for item in order.get('items') or () if isinstance(item, dict)] or [{}]
+    for item in items:
+        yield common + [item.get('article_id', ''), item.get('article', ''), item.get('quantity', ''),
+                        item.get('unit_price', ''), item.get('total_price', '')]
+
+
+def export_chunks(scanned, fmt='ndjson', date_from=None, date_to=None, header=True, chunk_size=CHUNK_SIZE):
+    """Blocs d'octets de l'export ; scanned = (ligne brute, enregistrement) dans l'ordre des seq.
+    header=False : pas d'en-tête CSV (reprise à la suite d'un fichier existant)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu : {fmt} ({', '.join(FORMATS)}).")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    chunk = []
+    size = 0
+    if fmt == 'csv' and header:
+        writer.writerow(CSV_COLUMNS)
+    for line, record in scanned:
+        if not in_date_range(record['order'], date_from, date_to):
+            continue
+        if fmt == 'csv':
+            writer.writerows(csv_rows(record))
+            line = buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    if fmt == 'csv' and buffer.tell():
+        chunk.append(buffer.getvalue().encode('utf-8'))
+    if chunk:
+        yield b''.join(chunk)
+
+
+def resume_point(path, fmt='ndjson'):
+    """Prépare un fichier d'export interrompu pour la reprise : retire la fin incomplète et
+    retourne la seq après laquelle reprendre (0 si rien d'exploitable).
+    En CSV, les lignes de la dernière commande sont retirées (elle a pu être coupée) puis redemandées."""
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+    with open(path, 'r+b') as f:
+        start = max(0, size - RESUME_TAIL_BYTES)
+        f.seek(start)
+        tail = f.read()
+        if start:
+            # Première ligne peut-être entamée : ignorée
+            skipped = tail.find(b'\n') + 1
+            start += skipped
+            tail = tail[skipped:]
+        lines = tail.split(b'\n')
+        lines.pop()  # après le dernier saut de ligne : vide ou incomplet
+        seqs = [_line_seq(line, fmt) for line in lines]
+        keep = len(lines)
+        if fmt == 'csv':
+            last = seqs[-1] if seqs else None
+            while keep and last is not None and seqs[keep - 1] == last:
+                keep -= 1
+        end = start + sum(len(line) + 1 for line in lines[:keep])
+        f.truncate(end)
+    resumed = [seq for seq in seqs[:keep] if seq is not None]
+    return resumed[-1] if resumed else 0
+
+
+def _line_seq(line, fmt):
+    if fmt != 'csv':
+        return record_seq(line)
+    try:
+        return int(line.split(b',', 1)[0])
+    except ValueError:
+        return None  # en-tête ou ligne illisible
@@ -0,0 +1,460 @@
+'''Moteur de stockage des commandes du Orders Service.
+- journal append-only : une commande = une ligne JSON ajoutée en fin de fichier,
+- index en mémoire par utilisateur, trié par date (reconstruit au démarrage en relisant le journal),
+- verrou exclusif sur le journal : un seul processus écrit dedans,
+- compaction en tâche de fond pour supprimer les versions remplacées,
+- import unique de l'ancien orders.json,
+- abonnés prévenus de chaque lot écrit (agrégats tenus à jour sans relire le journal).'''
+
+# common/order_store.py
+import bisect
+import json
+import os
+import threading
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+# Position d'une commande dans le journal
+IndexEntry = namedtuple('IndexEntry', ['user', 'seq', 'offset', 'length', 'date'])
+
+
+def encode_record(seq, user, order):
+    """Une ligne du journal (JSON compact terminé par un saut de ligne)."""
+    line = json.dumps({"seq": seq, "user": user, "order": order},
+                      ensure_ascii=False, separators=(',', ':'))
+    return (line + '\n').encode('utf-8')
+
+
+def read_log(log_path):
+    """Enregistrements valides d'un journal ({seq, user, order}), dans l'ordre du fichier.
+    Lecture seule, sans verrou : utilisable pendant que le service écrit (la ligne en cours
+    d'écriture, incomplète, est ignorée)."""
+    with open(log_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and isinstance(record.get('order'), dict) and 'seq' in record:
+                yield record
+
+
+def record_seq(line):
+    """Séquence d'une ligne du journal lue sans décoder le JSON (None si la ligne n'a pas la forme attendue)."""
+    if not line.startswith(b'{"seq":'):
+        return None
+    try:
+        return int(line[7:line.find(b',', 7)])
+    except ValueError:
+        return None
+
+
+class StoreLocked(Exception):
+    """Le journal est déjà ouvert par un autre processus."""
+
+
+class OrderStore:
+    """Journal des commandes + index { (user, order_id) -> IndexEntry } et
+    { user -> [(date, order_id)] trié }. Un order_id n'est unique que pour un
+    utilisateur donné (ancien orders.json)."""
+
+    def __init__(self, log_path, compact_min_bytes=1024 * 1024, compact_garbage_ratio=0.3):
+        self.log_path = log_path
+        self.compact_min_bytes = compact_min_bytes
+        self.compact_garbage_ratio = compact_garbage_ratio
+
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._orders = {}
+        self._by_user = {}
+        self._user_versions = {}  # user -> seq de sa dernière écriture (ETag de l'historique)
+        self._seq = 0
+        self._size = 0
+        self._garbage_bytes = 0
+        self._compactions = 0
+        self._listeners = []
+        self._stop = threading.Event()
+        self._compactor = None
+
+        self._acquire_process_lock()
+        self._open()
+        self._rebuild_index()
+
+    # --- Ouverture / reconstruction ---
+
+    def _open(self):
+        self._file = open(self.log_path, 'ab')
+        self._reader = open(self.log_path, 'rb')
+
+    def _close_files(self):
+        self._file.close()
+        self._reader.close()
+
+    def _acquire_process_lock(self):
+        """Verrou exclusif sur un fichier .lock voisin (le journal lui-même est remplacé
+        à chaque compaction). Deux processus qui écrivent le même journal le corrompent."""
+        self._lock_file = open(self.log_path + '.lock', 'a')
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise StoreLocked(f"{self.log_path} est déjà utilisé par un autre processus.")
+
+    def _rebuild_index(self):
+        """Relit le journal complet et reconstruit l'index en mémoire."""
+        offset = 0
+        valid_end = 0
+        with open(self.log_path, 'rb') as f:
+            for line in f:
+                length = len(line)
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("ligne incomplète")
+                    record = json.loads(line)
+                    if not isinstance(record, dict) or not isinstance(record.get('order'), dict):
+                        raise ValueError("enregistrement invalide")
+                    self._index(record, offset, length)
+                    valid_end = offset + length
+                except (ValueError, KeyError, TypeError):
+                    # Ligne corrompue : ignorée (et comptée comme à compacter)
+                    self._garbage_bytes += length
+                offset += length
+
+        if valid_end < offset:
+            # Écriture interrompue en fin de fichier (crash) : on tronque
+            print(f"{self.log_path} : fin de journal incomplète tronquée ({offset - valid_end} octets).")
+            self._garbage_bytes -= offset - valid_end
+            self._file.truncate(valid_end)
+            offset = valid_end
+        self._size = offset
+
+    def _index(self, record, offset, length):
+        # Appelée avec self._lock pris (ou pendant la construction)
+        order = record['order']
+        order_id = order['order_id']
+        user = record['user']
+        seq = int(record['seq'])
+        date = str(order.get('date') or '')
+        key = (user, order_id)
+        user_orders = self._by_user.setdefault(user, [])
+        previous = self._orders.get(key)
+        if previous is not None:
+            # Nouvelle version de la commande : l'ancienne ligne devient inutile
+            self._garbage_bytes += previous.length
+            if previous.date != date:
+                del user_orders[bisect.bisect_left(user_orders, (previous.date, order_id))]
+                bisect.insort(user_orders, (date, order_id))
+        else:
+            bisect.insort(user_orders, (date, order_id))
+        self._orders[key] = IndexEntry(user, seq, offset, length, date)
+        self._user_versions[user] = max(self._user_versions.get(user, 0), seq)
+        self._seq = max(self._seq, seq)
+
+    # --- Écriture ---
+
+    def append(self, user, order):
+        """Ajoute une commande au journal et retourne son numéro de séquence."""
+        return self.append_many([(user, order)])[0]
+
+    def append_many(self, entries, sync=False):
+        """Ajoute plusieurs (user, order) en une seule écriture.
+        Avec sync=True, un seul fsync rend tout le lot durable avant de rendre la main."""
+        with self._lock:
+            # Tout est vérifié et encodé avant d'écrire : une commande invalide
+            # (sans order_id, non sérialisable...) rejette le lot sans rien toucher
+            records = []
+            chunks = []
+            seq = self._seq
+            for user, order in entries:
+                if not isinstance(order, dict) or 'order_id' not in order:
+                    raise ValueError("Commande sans order_id.")
+                seq += 1
+                record = {"seq": seq, "user": user, "order": order}
+                records.append(record)
+                chunks.append(encode_record(seq, user, order))
+
+            try:
+                self._file.write(b''.join(chunks))
+                self._file.flush()
+            except OSError:
+                # Écriture partielle : on revient à la dernière fin de ligne valide
+                self._file.truncate(self._size)
+                raise
+
+            offset = self._size
+            try:
+                for record, chunk in zip(records, chunks):
+                    self._index(record, offset, len(chunk))
+                    offset += len(chunk)
+            finally:
+                # Les octets sont sur disque : la taille et la séquence doivent en tenir compte
+                self._size += sum(len(chunk) for chunk in chunks)
+                self._seq = max(self._seq, seq)
+            self._notify(records)
+            seqs = [record['seq'] for record in records]
+            # dup : le descripteur reste valide même si une compaction rouvre le journal
+            fd = os.dup(self._file.fileno()) if sync else None
+
+        if fd is not None:
+            # fsync hors verrou : les lectures ne sont pas bloquées pendant l'écriture disque
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        return seqs
+
+    def _notify(self, records):
+        # Appelée avec self._lock pris : les abonnés voient les lots dans l'ordre des seq
+        for listener in self._listeners:
+            try:
+                listener(records)
+            except Exception as e:  # les commandes sont déjà écrites : l'abonné ne doit pas les faire échouer
+                print(f"Erreur d'un abonné du journal des commandes : {e}")
+
+    def subscribe(self, listener, after_seq=0):
+        """Abonne listener(records) aux prochains lots écrits, après lui avoir passé les versions
+        courantes écrites après after_seq (sans trou ni doublon : tout se fait sous le verrou)."""
+        with self._lock:
+            listener(self.records_after(after_seq))
+            self._listeners.append(listener)
+
+    def import_legacy(self, orders_by_user):
+        """Importe le contenu de l'ancien orders.json ({ user: [commandes] }).
+        Pour un même utilisateur, seule la première commande d'un order_id est gardée ;
+        les entrées sans order_id sont ignorées."""
+        entries = []
+        seen = set()
+        with self._lock:
+            for user, orders in orders_by_user.items():
+                for order in orders:
+                    if not isinstance(order, dict) or 'order_id' not in order:
+                        continue
+                    key = (user, order['order_id'])
+                    if key in seen or key in self._orders:
+                        continue
+                    seen.add(key)
+                    entries.append((user, order))
+        if entries:
+            self.append_many(entries, sync=True)
+        return len(entries)
+
+    # --- Lecture ---
+
+    def _read(self, entry):
+        # Appelée avec self._lock pris (le lecteur partagé n'est pas thread-safe)
+        self._reader.seek(entry.offset)
+        return json.loads(self._reader.read(entry.length))['order']
+
+    def get_order(self, user, order_id):
+        """Retourne la commande `order_id` de `user`, ou None."""
+        with self._lock:
+            entry = self._orders.get((user, order_id))
+            if entry is None:
+                return None
+            return self._read(entry)
+
+    def get_user_orders(self, user):
+        """Commandes d'un utilisateur, de la plus ancienne à la plus récente."""
+        with self._lock:
+            return [self._read(self._orders[(user, order_id)]) for _, order_id in self._by_user.get(user, ())]
+
+    def history(self, user, limit, before=None, date_from=None, date_to=None):
+        """Page d'historique, de la plus récente à la plus ancienne.
+        - before : clé (date, order_id) de la dernière commande de la page précédente,
+        - date_from / date_to : bornes incluses ('AAAA-MM-JJ' ou 'AAAA-MM-JJ HH:MM:SS').
+        Retourne (commandes, clé de la dernière commande ou None s'il n'y a plus rien)."""
+        with self._lock:
+            keys = self._by_user.get(user, [])
+            # Dates au format 'AAAA-MM-JJ HH:MM:SS' : l'ordre des chaînes est l'ordre chronologique
+            low = bisect.bisect_left(keys, (date_from,)) if date_from else 0
+            high = bisect.bisect_right(keys, (date_to + '\uffff',)) if date_to else len(keys)
+            if before is not None:
+                high = min(high, bisect.bisect_left(keys, tuple(before)))
+            start = max(low, high - limit)
+            page = keys[start:high][::-1]
+            orders = [self._read(self._orders[(user, order_id)]) for _, order_id in page]
+            next_key = page[-1] if page and start > low else None
+            return orders, next_key
+
+    def user_version(self, user):
+        """Numéro de séquence de la dernière écriture de l'utilisateur (0 si aucune)."""
+        with self._lock:
+            return self._user_versions.get(user, 0)
+
+    def records_after(self, seq):
+        """Versions courantes des commandes écrites après seq, par seq croissante
+        (une version remplacée depuis n'est pas rendue)."""
+        with self._lock:
+            entries = sorted((entry for entry in self._orders.values() if entry.seq > seq),
+                             key=lambda entry: entry.seq)
+            return [{"seq": entry.seq, "user": entry.user, "order": self._read(entry)} for entry in entries]
+
+    def current_seq(self, user, order_id):
+        """Séquence de la version courante d'une commande (None si elle n'existe pas)."""
+        with self._lock:
+            entry = self._orders.get((user, order_id))
+            return entry.seq if entry is not None else None
+
+    def scan(self, after_seq=0, until_seq=None, user=None):
+        """Parcours du journal par seq croissante : (ligne brute, enregistrement) des commandes
+        écrites après after_seq (jusqu'à until_seq inclus). Mémoire constante : le fichier est lu
+        ligne à ligne par un descripteur propre (une compaction pendant le parcours ne le gêne pas).
+        Une version remplacée est ignorée, sauf si la remplaçante est postérieure à until_seq."""
+        # Motif de l'utilisateur tel qu'encode_record l'écrit : filtre sans décoder les autres lignes
+        user_marker = (',"user":' + json.dumps(user, ensure_ascii=False) + ',').encode('utf-8') if user else None
+        with self._lock:
+            end = self._size
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._offset_after(f, end, after_seq))
+            while f.tell() < end:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                seq = record_seq(line)
+                if seq is not None and seq <= after_seq:
+                    continue
+                if seq is not None and until_seq is not None and seq > until_seq:
+                    break
+                if user_marker is not None and user_marker not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    seq = int(record['seq'])
+                    current = self.current_seq(record['user'], record['order']['order_id'])
+                except (ValueError, KeyError, TypeError):
+                    continue  # ligne corrompue
+                if seq <= after_seq or (until_seq is not None and seq > until_seq):
+                    continue
+                if current == seq or (current is not None and until_seq is not None and current > until_seq):
+                    yield line, record
+
+    @staticmethod
+    def _offset_after(f, size, after_seq, linear_below=64 * 1024):
+        """Début d'une ligne telle que toutes les lignes précédentes ont une seq <= after_seq
+        (recherche dichotomique : les seq croissent avec la position dans le journal)."""
+        low, high = 0, size
+        while after_seq > 0 and high - low > linear_below:
+            middle = (low + high) // 2
+            f.seek(middle)
+            f.readline()  # fin de la ligne entamée
+            start = f.tell()
+            seq = record_seq(f.readline()) if start < high else None
+            if seq is None:
+                break  # ligne illisible : la fin du parcours se fait ligne à ligne
+            if seq <= after_seq:
+                low = start
+            else:
+                high = start
+        return low
+
+    def users(self):
+        with self._lock:
+            return list(self._by_user)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "orders": len(self._orders),
+                "users": len(self._by_user),
+                "log_bytes": self._size,
+                "garbage_bytes": self._garbage_bytes,
+                "compactions": self._compactions,
+                "last_seq": self._seq,
+            }
+
+    # --- Compaction ---
+
+    def needs_compaction(self):
+        with self._lock:
+            return (self._garbage_bytes >= self.compact_min_bytes
+                    and self._garbage_bytes >= self._size * self.compact_garbage_ratio)
+
+    def compact(self):
+        """Réécrit le journal sans les lignes remplacées ou corrompues.
+        Les écritures restent possibles pendant la copie : seules les lignes
+        ajoutées entre-temps sont recopiées sous verrou à la fin."""
+        with self._compaction_lock:
+            tmp_path = self.log_path + '.compact'
+
+            # 1. Photo des entrées vivantes
+            with self._lock:
+                snapshot = sorted(self._orders.items(), key=lambda item: item[1].offset)
+                snapshot_end = self._size
+
+            # 2. Copie hors verrou (le journal n'est jamais modifié avant snapshot_end)
+            new_offsets = {}
+            new_size = 0
+            with open(self.log_path, 'rb') as src, open(tmp_path, 'wb') as out:
+                for key, entry in snapshot:
+                    src.seek(entry.offset)
+                    out.write(src.read(entry.length))
+                    new_offsets[key] = new_size
+                    new_size += entry.length
+
+                # 3. Sous verrou : recopie de la fin ajoutée pendant la copie, puis bascule
+                with self._lock:
+                    src.seek(snapshot_end)
+                    tail = src.read(self._size - snapshot_end)
+                    src.close()
+                    out.write(tail)
+                    out.flush()
+                    os.fsync(out.fileno())
+                    out.close()
+
+                    orders = {}
+                    for key, entry in self._orders.items():
+                        if entry.offset >= snapshot_end:
+                            offset = entry.offset - snapshot_end + new_size
+                        else:
+                            offset = new_offsets[key]
+                        orders[key] = entry._replace(offset=offset)
+
+                    self._close_files()
+                    os.replace(tmp_path, self.log_path)
+                    self._fsync_dir()
+                    self._open()
+                    self._orders = orders
+                    self._size = new_size + len(tail)
+                    # Versions remplacées pendant la copie : seule place encore perdue
+                    self._garbage_bytes = self._size - sum(entry.length for entry in orders.values())
+                    self._compactions += 1
+
+    def _fsync_dir(self):
+        directory = os.path.dirname(os.path.abspath(self.log_path))
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return  # Windows : pas de fsync de répertoire
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def start_background_compaction(self, interval=60.0):
+        """Lance un thread qui compacte le journal quand assez de place est perdue."""
+        def run():
+            while not self._stop.wait(interval):
+                if self.needs_compaction():
+                    try:
+                        self.compact()
+                    except OSError as e:
+                        print(f"Erreur de compaction du journal des commandes : {e}")
+
+        self._compactor = threading.Thread(target=run, name='order-log-compactor', daemon=True)
+        self._compactor.start()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._close_files()
+            self._lock_file.close()  # libère le verrou inter-processus
@@ -0,0 +1,152 @@
+'''Hachage et vérification bcrypt dans un pool de processus dédié.
+bcrypt est volontairement lent (~250 ms à coût 12) : exécuté dans les threads Flask,
+une rafale de /auth/login bloque aussi /auth/validate et /auth/refresh.
+Ici le calcul part dans des processus séparés, avec une file d'attente bornée :
+au-delà, on refuse tout de suite (HasherSaturated) plutôt que d'empiler les requêtes.
+Les processus sont créés en mode 'spawn' : un fork d'un serveur multi-thread peut
+hériter d'un verrou pris par un autre thread et bloquer indéfiniment.'''
+
+# common/password_hasher.py
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+
+class HasherSaturated(Exception):
+    """Trop de calculs bcrypt en attente : réessayer plus tard."""
+
+
+# --- Fonctions exécutées dans les processus du pool (doivent rester au niveau module) ---
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _ready():
+    return os.getpid()
+
+
+def _verify_password(password, password_hash):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        # Hash illisible ou mot de passe trop long pour bcrypt (> 72 octets)
+        return False
+
+
+def hash_cost(password_hash):
+    """Coût (log2 des tours) d'un hash bcrypt "$2b$12$...", ou None."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasherPool:
+    """Pool de processus bcrypt : `workers` calculs simultanés + `max_pending` en attente.
+    Un calcul abandonné par l'appelant (timeout) garde sa place jusqu'à ce que le
+    processus l'ait réellement terminé : la borne porte sur le travail en cours."""
+
+    def __init__(self, workers=None, max_pending=None, rounds=12, timeout=10.0, start_method='spawn'):
+        self.workers = workers or os.cpu_count() or 2
+        self.max_pending = max_pending if max_pending is not None else self.workers * 4
+        self.rounds = rounds
+        self.timeout = timeout
+        self._mp_context = multiprocessing.get_context(start_method)
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._mp_context)
+            return self._executor
+
+    def start(self):
+        """Démarre tous les processus maintenant (au lancement du service) plutôt qu'au
+        premier login : le coût du démarrage n'est pas payé par une requête."""
+        executor = self._get_executor()
+        for future in [executor.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def _reset_executor(self, broken):
+        """Remplace un pool cassé (processus tué, OOM...) ; le suivant est créé à la demande."""
+        with self._lock:
+            if self._executor is not broken:
+                return  # déjà remplacé par un autre thread
+            self._executor = None
+            self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, future=None):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherSaturated("Pool bcrypt saturé.")
+        with self._lock:
+            self.in_flight += 1
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._release()
+            self._reset_executor(executor)
+            raise HasherSaturated("Pool bcrypt indisponible, redémarrage en cours.")
+        # La place est rendue quand le processus a fini, même si l'appelant a abandonné
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise HasherSaturated("Calcul bcrypt trop long.")
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            raise HasherSaturated("Pool bcrypt indisponible, redémarrage en cours.")
+
+    def hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def verify(self, password, password_hash):
+        return self._run(_verify_password, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        """Vrai si le hash a été calculé avec un coût inférieur au coût configuré."""
+        cost = hash_cost(password_hash)
+        return cost is not None and cost < self.rounds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "rounds": self.rounds,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+            }
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,390 @@
+'''Paiement des commandes hors de la requête HTTP.
+- POST /orders écrit la commande avec le statut 'pending' (durable : group commit) et répond 202 ;
+  le journal des commandes sert de file durable : une commande 'pending' y attend son paiement,
+- PAYMENT_WORKERS threads la présentent au prestataire puis écrivent sa nouvelle version dans le
+  journal : 'paid', ou 'failed' (paiement refusé, ou prestataire indisponible PAYMENT_MAX_ATTEMPTS fois),
+- prestataire indisponible, ou écriture du résultat impossible : nouvel essai après un délai
+  exponentiel avec gigue (PAYMENT_RETRY_BASE_MS doublé à chaque essai, au plus PAYMENT_RETRY_MAX_MS),
+- la clé d'idempotence (utilisateur + order_id) est transmise au prestataire : une commande
+  présentée une deuxième fois (redémarrage, résultat non écrit) n'est pas débitée deux fois,
+- le processeur est abonné au journal (OrderStore.subscribe) : il voit chaque commande 'pending'
+  dès son écriture, et chaque résultat, dans l'ordre des seq ; au démarrage, les commandes écrites
+  après le point de reprise sauvegardé (plus ancienne commande encore en attente) sont relues,
+- GET /orders/<id>/status?wait=N attend (long-poll) que la commande quitte 'pending'.'''
+
+# common/payments.py
+import datetime
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from common.metrics import REGISTRY
+
+PAYMENT_WORKERS = int(os.environ.get('PAYMENT_WORKERS', 16))   # threads : ils attendent surtout le prestataire
+PAYMENT_MAX_ATTEMPTS = int(os.environ.get('PAYMENT_MAX_ATTEMPTS', 5))
+PAYMENT_RETRY_BASE = float(os.environ.get('PAYMENT_RETRY_BASE_MS', 200)) / 1000
+PAYMENT_RETRY_MAX = float(os.environ.get('PAYMENT_RETRY_MAX_MS', 10000)) / 1000
+# Au-delà, les nouvelles commandes sont refusées (503) : le retard de paiement reste borné
+PAYMENT_MAX_PENDING = int(os.environ.get('PAYMENT_MAX_PENDING', 10000))
+CHECKPOINT_FILE = os.environ.get('PAYMENT_CHECKPOINT_FILE', 'payments_checkpoint.json')
+CHECKPOINT_INTERVAL = float(os.environ.get('PAYMENT_CHECKPOINT_INTERVAL', 30))   # secondes
+CHECKPOINT_FORMAT = 1
+
+# --- Prestataire simulé (benchmarks : latence et taux d'échec réglables) ---
+PROVIDER_LATENCY = float(os.environ.get('PAYMENT_PROVIDER_LATENCY_MS', 200)) / 1000
+PROVIDER_JITTER = float(os.environ.get('PAYMENT_PROVIDER_JITTER_MS', 50)) / 1000
+PROVIDER_DECLINE_RATE = float(os.environ.get('PAYMENT_PROVIDER_DECLINE_RATE', 0.2))   # paiements refusés
+PROVIDER_ERROR_RATE = float(os.environ.get('PAYMENT_PROVIDER_ERROR_RATE', 0.05))     # indisponibilités
+PROVIDER_MAX_KEYS = 100000
+
+PENDING = 'pending'
+PAID = 'paid'
+FAILED = 'failed'
+
+PAYMENTS = REGISTRY.counter(
+    'payments_total', "Paiements terminés, par issue (paid, declined, abandoned).", ('outcome',))
+PAYMENT_RETRIES = REGISTRY.counter(
+    'payment_retries_total', "Paiements reportés (prestataire indisponible, résultat non écrit).", ('reason',))
+PAYMENT_PENDING = REGISTRY.gauge('payments_pending', "Commandes en attente de paiement.")
+PROVIDER_SECONDS = REGISTRY.histogram('payment_provider_seconds', "Durée d'un appel au prestataire de paiement.")
+
+
+class PaymentUnavailable(Exception):
+    """Le prestataire n'a pas répondu : rien n'a été décidé, l'appel peut être refait."""
+
+
+def payment_key(user, order_id):
+    """Clé d'idempotence transmise au prestataire."""
+    return f"{user}/{order_id}"
+
+
+class PaymentProvider:
+    """Prestataire de paiement simulé : `latency` ± `jitter` secondes par appel, une indisponibilité
+    passagère avec la probabilité `error_rate`, un refus avec la probabilité `decline_rate`.
+    La décision est retenue par clé d'idempotence : un même paiement n'est décidé (et débité) qu'une fois."""
+
+    def __init__(self, latency=PROVIDER_LATENCY, jitter=PROVIDER_JITTER, decline_rate=PROVIDER_DECLINE_RATE,
+                 error_rate=PROVIDER_ERROR_RATE, seed=None, max_keys=PROVIDER_MAX_KEYS, sleep=time.sleep):
+        self.latency = latency
+        self.jitter = jitter
+        self.decline_rate = decline_rate
+        self.error_rate = error_rate
+        self.max_keys = max_keys
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._decisions = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.charges = 0
+        self.declines = 0
+        self.errors = 0
+
+    def charge(self, key, amount):
+        """True si le paiement est accepté, False s'il est refusé ; lève PaymentUnavailable."""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            unavailable = self._random.random() < self.error_rate
+        if delay:
+            self.sleep(delay)
+        with self._lock:
+            if unavailable:
+                self.errors += 1
+                raise PaymentUnavailable("Prestataire de paiement indisponible.")
+            accepted = self._decisions.get(key)
+            if accepted is None:
+                accepted = self._random.random() >= self.decline_rate
+                self._decisions[key] = accepted
+                if accepted:
+                    self.charges += 1
+                else:
+                    self.declines += 1
+                while len(self._decisions) > self.max_keys:
+                    self._decisions.popitem(last=False)
+            else:
+                self._decisions.move_to_end(key)
+            return accepted
+
+    def stats(self):
+        with self._lock:
+            return {"latency_ms": self.latency * 1000, "jitter_ms": self.jitter * 1000,
+                    "decline_rate": self.decline_rate, "error_rate": self.error_rate,
+                    "calls": self.calls, "charges": self.charges, "declines": self.declines,
+                    "errors": self.errors}
+
+
+class PaymentProcessor:
+    """File des paiements { (user, order_id) -> seq de la version 'pending' } et threads de paiement.
+    apply_records est appelée sous le verrou du journal : elle ne fait que tenir la file à jour."""
+
+    def __init__(self, store, writer, provider=None, workers=PAYMENT_WORKERS, max_attempts=PAYMENT_MAX_ATTEMPTS,
+                 retry_base=PAYMENT_RETRY_BASE, retry_max=PAYMENT_RETRY_MAX, max_pending=PAYMENT_MAX_PENDING,
+                 seq=0, clock=time.monotonic, seed=None):
+        self.store = store
+        self.writer = writer
+        self.provider = provider or PaymentProvider()
+        self.workers = workers
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_pending = max_pending
+        self.clock = clock
+        self.seq = seq                  # dernière seq du journal vue par le processeur
+        self._random = random.Random(seed)
+        self._cond = threading.Condition()
+        self._queue = []                # tas (échéance, n°, clé) : une entrée au plus par commande
+        self._order = itertools.count()
+        self._pending = {}              # clé -> seq de la version 'pending'
+        self._attempts = {}             # clé -> appels au prestataire sans réponse
+        self._events = {}               # clé -> Event des requêtes en long-poll
+        self._stop = False
+        self._threads = []
+        self._checkpointer = None
+        self._saved_seq = None
+        self.outcomes = {"paid": 0, "declined": 0, "abandoned": 0}
+        self.retries = {"provider": 0, "write": 0}
+
+    # --- Abonnement au journal ---
+
+    def apply_records(self, records):
+        """Commande 'pending' : mise en file ; autre version d'une commande en file : elle en sort."""
+        with self._cond:
+            added = 0
+            for record in records:
+                order = record['order']
+                key = (record['user'], order.get('order_id'))
+                if order.get('status') == PENDING:
+                    if key not in self._pending:
+                        self._pending[key] = record['seq']
+                        self._schedule(key, 0.0)
+                        added += 1
+                elif key in self._pending:
+                    self._resolved(key)
+                self.seq = max(self.seq, record['seq'])
+            PAYMENT_PENDING.set(len(self._pending))
+            if added:
+                self._cond.notify(added)
+
+    def _schedule(self, key, delay):
+        heapq.heappush(self._queue, (self.clock() + delay, next(self._order), key))
+
+    def _resolved(self, key):
+        del self._pending[key]
+        self._attempts.pop(key, None)
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def admit(self, count=1):
+        """False si `count` commandes de plus dépasseraient PAYMENT_MAX_PENDING."""
+        with self._cond:
+            return len(self._pending) + count <= self.max_pending
+
+    # --- Threads de paiement ---
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'payment-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _run(self):
+        while True:
+            with self._cond:
+                key = self._next_due()
+            if key is None:
+                return
+            try:
+                self._process(key)
+            except Exception as e:
+                print(f"Erreur de paiement de la commande {key[1]} : {e}")
+                self._retry(key, 'write')
+
+    def _next_due(self):
+        # Appelée avec self._cond pris : attend la prochaine échéance (None à l'arrêt)
+        while not self._stop:
+            wait = None
+            if self._queue:
+                due, _, key = self._queue[0]
+                wait = due - self.clock()
+                if wait <= 0:
+                    heapq.heappop(self._queue)
+                    if key in self._pending:
+                        return key
+                    continue    # payée entre-temps (autre processus, rejeu)
+            self._cond.wait(wait)
+        return None
+
+    def _process(self, key):
+        user, order_id = key
+        order = self.store.get_order(user, order_id)
+        if order is None:
+            with self._cond:
+                if key in self._pending:
+                    self._resolved(key)     # commande disparue (journal remplacé) : rien à payer
+            return
+        if order.get('status') != PENDING:
+            return                          # déjà réglée : apply_records l'a sortie de la file
+        with self._cond:
+            attempt = self._attempts.get(key, 0) + 1
+        started = time.perf_counter()
+        try:
+            accepted = self.provider.charge(payment_key(user, order_id), order.get('total'))
+        except PaymentUnavailable:
+            if attempt < self.max_attempts:
+                with self._cond:
+                    self._attempts[key] = attempt
+                self._retry(key, 'provider', attempt)
+                return
+            outcome, status, message = 'abandoned', FAILED, "Prestataire de paiement indisponible."
+        else:
+            outcome, status, message = (('paid', PAID, "Paiement accepté.") if accepted
+                                        else ('declined', FAILED, "Paiement refusé."))
+        finally:
+            PROVIDER_SECONDS.observe(time.perf_counter() - started)
+
+        settled = dict(order, status=status, payment={
+            "message": message,
+            "attempts": attempt,
+            "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        try:
+            # La nouvelle version sort la commande de la file (apply_records, sous le verrou du journal)
+            self.writer.submit([(user, settled)])
+        except Exception:
+            # Décision retenue par le prestataire : le prochain essai obtient la même, sans nouveau débit
+            self._retry(key, 'write', attempt)
+            return
+        with self._cond:
+            self.outcomes[outcome] += 1
+        PAYMENTS.inc(outcome=outcome)
+
+    def retry_delay(self, attempt):
+        """Délai avant l'essai suivant : exponentiel, tiré dans [plafond / 2, plafond]."""
+        ceiling = min(self.retry_max, self.retry_base * 2 ** max(0, attempt - 1))
+        with self._cond:
+            return ceiling / 2 + self._random.uniform(0, ceiling / 2)
+
+    def _retry(self, key, reason, attempt=1):
+        delay = self.retry_delay(attempt)
+        with self._cond:
+            if key not in self._pending:
+                return
+            self.retries[reason] += 1
+            self._schedule(key, delay)
+            self._cond.notify()
+        PAYMENT_RETRIES.inc(reason=reason)
+
+    # --- Statut (long-poll) ---
+
+    def wait_for_status(self, user, order_id, timeout):
+        """Version courante de la commande (None si inconnue), après avoir attendu au plus
+        `timeout` secondes qu'elle quitte 'pending'."""
+        key = (user, order_id)
+        event = None
+        if timeout > 0:
+            with self._cond:
+                if key in self._pending:
+                    event = self._events.setdefault(key, threading.Event())
+        if event is not None:
+            event.wait(timeout)
+        return self.store.get_order(user, order_id)
+
+    # --- Point de reprise ---
+
+    def checkpoint(self):
+        """Seq jusqu'à laquelle toutes les commandes sont réglées (relecture au démarrage : au-delà)."""
+        with self._cond:
+            if self._pending:
+                return min(self._pending.values()) - 1
+            return self.seq
+
+    def save(self, path=CHECKPOINT_FILE):
+        """Écrit le point de reprise (fichier temporaire + os.replace : jamais à moitié écrit)."""
+        seq = self.checkpoint()
+        if seq == self._saved_seq:
+            return
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"format": CHECKPOINT_FORMAT, "seq": seq}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._saved_seq = seq
+
+    @staticmethod
+    def load_checkpoint(path=CHECKPOINT_FILE):
+        """Seq sauvegardée, ou 0 si le fichier est absent ou illisible (tout le journal est relu)."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('format') != CHECKPOINT_FORMAT:
+                raise ValueError("Format inconnu.")
+            return int(data['seq'])
+        except FileNotFoundError:
+            return 0
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            print(f"Point de reprise des paiements ignoré ({path}) : {e}")
+            return 0
+
+    def start_background_checkpoints(self, path=CHECKPOINT_FILE, interval=CHECKPOINT_INTERVAL):
+        def run():
+            while True:
+                with self._cond:
+                    if self._cond.wait_for(lambda: self._stop, interval):
+                        return
+                self._save_quietly(path)
+
+        self._checkpointer = threading.Thread(target=run, name='payment-checkpoint', daemon=True)
+        self._checkpointer.start()
+
+    def _save_quietly(self, path):
+        try:
+            self.save(path)
+        except OSError as e:
+            print(f"Erreur de sauvegarde du point de reprise des paiements : {e}")
+
+    def close(self, path=CHECKPOINT_FILE, timeout=5.0):
+        """Arrête les threads (un paiement en cours se termine) puis sauvegarde le point de reprise.
+        À appeler avant de fermer l'écrivain du journal."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._save_quietly(path)
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                "workers": self.workers,
+                "pending": len(self._pending),
+                "max_pending": self.max_pending,
+                "scheduled": len(self._queue),
+                "waiters": len(self._events),
+                "max_attempts": self.max_attempts,
+                "outcomes": dict(self.outcomes),
+                "retries": dict(self.retries),
+                "seq": self.seq,
+            }
+        stats["checkpoint_seq"] = self.checkpoint()
+        stats["provider"] = self.provider.stats()
+        return stats
+
+
+def open_payments(store, writer, path=CHECKPOINT_FILE, **options):
+    """Processeur abonné au journal à partir du point de reprise : les commandes restées 'pending'
+    (service arrêté avant leur paiement) sont remises en file, puis les threads démarrent.
+    Journal relu en entier si le point de reprise est en avance sur lui (journal remplacé ou restauré)."""
+    seq = PaymentProcessor.load_checkpoint(path)
+    if seq > store.stats()['last_seq']:
+        seq = 0
+    processor = PaymentProcessor(store, writer, seq=seq, **options)
+    store.subscribe(processor.apply_records, after_seq=seq)
+    return processor.start()
@@ -0,0 +1,221 @@
+'''Limitation de débit par seaux à jetons (token bucket), partagée entre les workers du Gateway.
+- un seau par clé ('user:alice', 'ip:10.0.0.1') : `rate` jetons par seconde, au plus `burst`,
+- une requête prend un jeton dans chacun de ses seaux, ou dans aucun (tout ou rien) ; refusée,
+  elle reçoit le délai avant qu'un jeton soit disponible (Retry-After),
+- seaux rangés du moins au plus récemment utilisé : un seau redevenu plein (client inactif) est
+  supprimé au passage, et au-delà de MAX_KEYS le plus ancien est évincé (mémoire bornée),
+- plusieurs workers (supervisor.py) : un seul jeu de seaux, tenu par un serveur sur socket Unix
+  (datagrammes) dans le superviseur ; chaque worker l'interroge (RateLimitClient). Sans réponse
+  dans le délai, le worker décide avec ses propres seaux (la limite devient approximative, le
+  service reste disponible).
+La même socket transporte les révocations de tokens du Gateway (common/revocations.py).'''
+
+# common/rate_limiter.py
+import itertools
+import json
+import math
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from common.metrics import REGISTRY
+
+MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+SOCKET_TIMEOUT = float(os.environ.get('RATE_LIMIT_SOCKET_TIMEOUT_MS', 20)) / 1000
+MAX_DATAGRAM = 64 * 1024
+
+THROTTLED = REGISTRY.counter(
+    'rate_limit_throttled_total', "Requêtes refusées par la limitation de débit (429).", ('service', 'scope'))
+BACKEND_FALLBACKS = REGISTRY.counter(
+    'rate_limit_backend_fallbacks_total', "Décisions prises localement faute de réponse du serveur de seaux.",
+    ('service',))
+
+# Limite d'une portée ('user', 'ip') : jetons par seconde et capacité du seau
+Rule = namedtuple('Rule', ['scope', 'rate', 'burst'])
+
+
+class TokenBuckets:
+    """Seaux { clé -> (jetons, instant de mise à jour, instant où le seau sera plein) }, thread-safe."""
+
+    def __init__(self, max_keys=MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def take(self, checks, cost=1.0):
+        """checks = [(clé, rate, burst)]. Retourne (autorisée, secondes avant un nouvel essai,
+        indice du seau qui a refusé ou None)."""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            levels = []
+            wait = 0.0
+            refused = None
+            for index, (key, rate, burst) in enumerate(checks):
+                entry = self._buckets.get(key)
+                tokens = burst if entry is None else min(burst, entry[0] + (now - entry[1]) * rate)
+                levels.append(tokens)
+                if tokens < cost:
+                    needed = (cost - tokens) / rate if rate > 0 else math.inf
+                    if needed > wait:
+                        wait, refused = needed, index
+            if refused is not None:
+                self.throttled += 1
+                return False, wait, refused
+            for (key, rate, burst), tokens in zip(checks, levels):
+                tokens -= cost
+                full_at = now + (burst - tokens) / rate if rate > 0 else math.inf
+                self._buckets[key] = (tokens, now, full_at)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+            self.allowed += 1
+            return True, 0.0, None
+
+    def _expire(self, now, limit=8):
+        # Quelques seaux par appel, depuis le moins récemment utilisé : coût constant
+        for _ in range(limit):
+            if not self._buckets:
+                return
+            key, (_, _, full_at) = next(iter(self._buckets.items()))
+            if full_at > now:
+                return
+            del self._buckets[key]
+            self.expired += 1
+
+    def stats(self):
+        with self._lock:
+            return {"keys": len(self._buckets), "allowed": self.allowed, "throttled": self.throttled,
+                    "expired": self.expired, "evicted": self.evicted}
+
+
+class RateLimitServer:
+    """Seaux partagés servis sur une socket Unix (datagrammes JSON) :
+    requête [id, coût, [[clé, rate, burst], ...]] -> réponse [id, autorisée, délai, seau refusant].
+    Les messages objets ({...}) vont au journal `revocations` (common.revocations.RevocationLog)."""
+
+    def __init__(self, path, buckets=None, revocations=None):
+        self.path = path
+        self.buckets = buckets or TokenBuckets()
+        self.revocations = revocations
+        if os.path.exists(path):
+            os.unlink(path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(path)
+        self._thread = None
+        self.errors = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name='rate-limit-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def _serve(self):
+        while True:
+            try:
+                data, address = self._sock.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                return  # socket fermée
+            try:
+                message = json.loads(data)
+                if isinstance(message, dict) and self.revocations is not None:
+                    self._sock.sendto(json.dumps(self.revocations.handle(message)).encode(), address)
+                    continue
+                request_id, cost, checks = message
+                allowed, wait, refused = self.buckets.take([(str(key), float(rate), float(burst))
+                                                            for key, rate, burst in checks], float(cost))
+                reply = json.dumps([request_id, allowed, wait if math.isfinite(wait) else 3600.0, refused])
+                self._sock.sendto(reply.encode(), address)
+            except (ValueError, TypeError, KeyError, OSError):
+                self.errors += 1  # requête illisible ou client parti : il décidera seul
+
+    def close(self):
+        self._sock.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class RateLimitClient:
+    """Interroge un RateLimitServer ; une socket par thread. Sans réponse dans `timeout`,
+    la décision est prise avec les seaux locaux `fallback`."""
+
+    def __init__(self, path, timeout=SOCKET_TIMEOUT, fallback=None, service='gateway'):
+        self.path = path
+        self.timeout = timeout
+        self.fallback = fallback or TokenBuckets()
+        self.service = service
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self.fallbacks = 0
+
+    def _socket(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                sock.bind('')   # Linux : adresse abstraite attribuée automatiquement
+            except OSError:
+                sock.bind(tempfile.mktemp(prefix='rate-limit-', suffix='.sock'))
+            sock.settimeout(self.timeout)
+            self._local.sock = sock
+        return sock
+
+    def take(self, checks, cost=1.0):
+        request_id = next(self._ids)
+        sock = self._socket()
+        try:
+            sock.sendto(json.dumps([request_id, cost, checks]).encode(), self.path)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                reply_id, allowed, wait, refused = json.loads(sock.recv(MAX_DATAGRAM))
+                if reply_id == request_id:
+                    return bool(allowed), float(wait), refused
+                # Réponse tardive à une requête abandonnée : ignorée
+                sock.settimeout(max(0.0001, deadline - time.monotonic()))
+        except (OSError, ValueError, TypeError):
+            self.fallbacks += 1
+            BACKEND_FALLBACKS.inc(service=self.service)
+            return self.fallback.take(checks, cost)
+        finally:
+            sock.settimeout(self.timeout)
+
+    def stats(self):
+        return dict(self.fallback.stats(), backend='socket', fallbacks=self.fallbacks)
+
+
+class RateLimiter:
+    """Règles par portée appliquées à une requête : check(user=..., ip=...)."""
+
+    def __init__(self, rules, backend=None, service='gateway'):
+        self.rules = [rule for rule in rules if rule.rate > 0]
+        self.backend = backend or TokenBuckets()
+        self.service = service
+
+    def check(self, **identities):
+        """(autorisée, Retry-After en secondes entières, portée refusée ou None)."""
+        rules = [rule for rule in self.rules if identities.get(rule.scope)]
+        if not rules:
+            return True, 0, None
+        allowed, wait, refused = self.backend.take(
+            [(f"{rule.scope}:{identities[rule.scope]}", rule.rate, rule.burst) for rule in rules])
+        if allowed:
+            return True, 0, None
+        scope = rules[refused].scope
+        THROTTLED.inc(service=self.service, scope=scope)
+        return False, max(1, math.ceil(wait)), scope
+
+    def stats(self):
+        stats = self.backend.stats()
+        stats['rules'] = {rule.scope: {"rate": rule.rate, "burst": rule.burst} for rule in self.rules}
+        return stats
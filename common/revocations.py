@@ -0,0 +1,153 @@
+'''Révocations de tokens d'accès (déconnexions) partagées entre les workers du Gateway.
+- le superviseur tient la liste sur la socket de la limitation de débit (RATE_LIMIT_SOCKET,
+  cf. common/rate_limiter.py) : { empreinte du token -> fin de validité }, numérotée,
+- chaque worker y publie les tokens qu'il révoque (POST /api/auth/logout) et relève ceux des autres
+  toutes les REVOCATION_SYNC_INTERVAL secondes ; un worker qui démarre reçoit toute la liste,
+- une révocation est oubliée à l'expiration du token, qui serait de toute façon rejeté.
+Fenêtre résiduelle : un token révoqué par un worker reste accepté par les autres pendant au plus un
+intervalle (0,5 s par défaut), ou tant que le superviseur ne répond pas ; sans superviseur (un seul
+processus), la révocation est immédiate.'''
+
+# common/revocations.py
+import itertools
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from common.rate_limiter import MAX_DATAGRAM, SOCKET_TIMEOUT
+
+REVOCATION_SYNC_INTERVAL = float(os.environ.get('GATEWAY_REVOCATION_SYNC_MS', 500)) / 1000
+MAX_ENTRIES_PER_REPLY = 500     # ~80 octets par révocation : une réponse tient dans un datagramme
+
+
+class RevocationLog:
+    """Révocations en cours, côté superviseur (thread-safe) ; chaque ajout reçoit un numéro croissant.
+    Messages (JSON) : {"id", "revoke": [clé, fin]} -> {"id", "seq"} ;
+    {"id", "since": seq} -> {"id", "seq", "revoked": [[clé, fin], ...]} (seq : dernier numéro transmis)."""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._entries = OrderedDict()     # clé -> (numéro, fin), par numéro croissant
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def add(self, key, until):
+        with self._lock:
+            now = self.clock()
+            # Rare (une déconnexion) : on en profite pour oublier les révocations expirées
+            for old_key in [k for k, (_, end) in self._entries.items() if end <= now]:
+                del self._entries[old_key]
+            if until <= now:
+                return self._seq
+            self._seq += 1
+            self._entries.pop(key, None)
+            self._entries[key] = (self._seq, until)
+            return self._seq
+
+    def since(self, seq, limit=None):
+        """(dernier numéro transmis, [[clé, fin], ...]) des révocations ajoutées après `seq`."""
+        limit = limit or MAX_ENTRIES_PER_REPLY
+        with self._lock:
+            now = self.clock()
+            revoked = []
+            sent = seq
+            for key, (number, until) in self._entries.items():
+                if number <= seq or until <= now:
+                    continue
+                if len(revoked) == limit:
+                    return sent, revoked    # suite au prochain relevé
+                revoked.append([key, until])
+                sent = number
+            return self._seq, revoked
+
+    def handle(self, message):
+        if 'revoke' in message:
+            key, until = message['revoke']
+            return {"id": message.get('id'), "seq": self.add(str(key), float(until))}
+        seq, revoked = self.since(int(message['since']))
+        return {"id": message.get('id'), "seq": seq, "revoked": revoked}
+
+    def stats(self):
+        with self._lock:
+            return {"revoked": len(self._entries), "seq": self._seq}
+
+
+class RevocationSync:
+    """Côté worker : publie les révocations du TokenCache (`on_revoke`) et y applique celles des autres."""
+
+    def __init__(self, path, token_cache, interval=REVOCATION_SYNC_INTERVAL, timeout=SOCKET_TIMEOUT):
+        self.path = path
+        self.token_cache = token_cache
+        self.interval = interval
+        self.timeout = timeout
+        self.seq = 0
+        self._ids = itertools.count(1)
+        self._sock = None
+        self._lock = threading.Lock()
+        self._unpublished = []        # révocations à renvoyer (superviseur muet lors de la publication)
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        token_cache.on_revoke = self.publish
+
+    def _request(self, message):
+        """Envoie un message au superviseur ; sa réponse, ou None sans réponse dans le délai."""
+        message['id'] = next(self._ids)
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                    try:
+                        self._sock.bind('')   # Linux : adresse abstraite attribuée automatiquement
+                    except OSError:
+                        self._sock.bind(tempfile.mktemp(prefix='revocations-', suffix='.sock'))
+                    self._sock.settimeout(self.timeout)
+                self._sock.sendto(json.dumps(message).encode(), self.path)
+                while True:
+                    reply = json.loads(self._sock.recv(MAX_DATAGRAM))
+                    if reply.get('id') == message['id']:
+                        return reply
+                    # Réponse tardive à un message abandonné : ignorée
+            except (OSError, ValueError, TypeError, AttributeError):
+                self.errors += 1
+                return None
+
+    def publish(self, key, until):
+        if self._request({"revoke": [key, until]}) is None:
+            self._unpublished.append((key, until))
+        else:
+            self.published += 1
+
+    def poll(self):
+        """Renvoie les publications en échec puis applique les révocations publiées depuis le dernier relevé ;
+        False si le superviseur ne répond pas."""
+        unpublished, self._unpublished = self._unpublished, []
+        for key, until in unpublished:
+            self.publish(key, until)
+        while True:
+            reply = self._request({"since": self.seq})
+            if reply is None:
+                return False
+            for key, until in reply['revoked']:
+                self.token_cache.revoke_key(key, until)
+            self.received += len(reply['revoked'])
+            self.seq = reply['seq']
+            if len(reply['revoked']) < MAX_ENTRIES_PER_REPLY:
+                return True
+
+    def start(self):
+        def run():
+            while True:
+                self.poll()
+                time.sleep(self.interval)
+
+        threading.Thread(target=run, name='token-revocations', daemon=True).start()
+        return self
+
+    def stats(self):
+        return {"interval_ms": self.interval * 1000, "seq": self.seq, "published": self.published,
+                "unpublished": len(self._unpublished), "received": self.received, "errors": self.errors}
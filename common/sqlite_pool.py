@@ -0,0 +1,104 @@
+'''Pool de connexions SQLite réutilisables.
+- les connexions sont ouvertes une seule fois puis rendues au pool après usage,
+- le mode WAL est activé : les lectures ne sont plus bloquées par les écritures,
+- chaque connexion garde en cache ses requêtes préparées (cached_statements) :
+  une requête fréquente n'est compilée qu'une fois par connexion.'''
+
+# common/sqlite_pool.py
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Réglages appliqués à chaque nouvelle connexion
+DEFAULT_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",     # sûr en WAL, beaucoup moins de fsync
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",       # ~8 Mo de cache de pages par connexion
+    "PRAGMA foreign_keys=ON",
+)
+
+
+class SQLitePool:
+    """Pool borné de connexions vers une base SQLite."""
+
+    def __init__(self, database, max_connections=8, busy_timeout=5.0,
+                 cached_statements=256, pragmas=DEFAULT_PRAGMAS):
+        self.database = database
+        self.max_connections = max_connections
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.pragmas = pragmas
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        # check_same_thread=False : une connexion passe d'un thread à l'autre via le pool,
+        # mais n'est jamais utilisée par deux threads à la fois
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout,
+                               cached_statements=self.cached_statements,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Pool SQLite fermé.")
+            if len(self._all) < self.max_connections:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+        # Toutes les connexions sont prises : on attend qu'une se libère
+        try:
+            return self._idle.get(timeout=self.busy_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Aucune connexion SQLite disponible.")
+
+    def release(self, conn):
+        if self._closed:
+            # Pool fermé pendant l'utilisation : close_all a déjà pu fermer cette connexion
+            conn.close()
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ...  (la connexion retourne au pool à la sortie)"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            opened = len(self._all)
+        return {"open": opened, "idle": self._idle.qsize(), "max": self.max_connections}
+
+    def close_all(self):
+        """Ferme toutes les connexions (à l'arrêt du service)."""
+        with self._lock:
+            self._closed = True
+            connections, self._all = self._all, []
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
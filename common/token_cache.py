@@ -0,0 +1,196 @@
+'''Cache LRU borné des résultats de validation de JWT, utilisé par l'API Gateway.
+- les tokens valides sont gardés jusqu'à leur claim `exp`,
+- les tokens rejetés sont gardés peu de temps (cache négatif),
+- la clé est un hash SHA-256 du token : le token brut n'est jamais conservé,
+- un token révoqué (déconnexion) reste rejeté jusqu'à son `exp`, même si l'Auth Service le valide encore
+  (JWT sans état) ; `on_revoke` permet de partager la révocation (cf. common/revocations.py).'''
+
+# common/token_cache.py
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Résultat mis en cache : user est None pour un token rejeté (message contient alors la raison)
+CachedValidation = namedtuple('CachedValidation', ['user', 'message', 'expires_at'])
+
+REVOKED_MESSAGE = "Token révoqué (déconnexion)."
+
+
+def token_key(token):
+    """Clé de cache : empreinte du token (évite de garder des JWT en mémoire)."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def unverified_exp(token):
+    """Claim `exp` d'un JWT lu sans vérifier la signature (durée d'une révocation), ou None."""
+    try:
+        payload = token.split('.')[1]
+        exp = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))['exp']
+        return float(exp)
+    except (IndexError, ValueError, TypeError, KeyError):
+        return None
+
+
+class TokenCache:
+    """Cache thread-safe { hash(token) -> CachedValidation } avec éviction LRU."""
+
+    def __init__(self, max_size=10000, negative_ttl=5.0, default_ttl=60.0, max_revocation_ttl=86400.0):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.default_ttl = default_ttl  # si l'Auth Service ne renvoie pas de `exp`
+        self.max_revocation_ttl = max_revocation_ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._revoked = {}              # hash(token) -> fin de la révocation
+        self._lock = threading.Lock()
+        self.on_revoke = None           # on_revoke(clé, fin), appelée hors verrou après chaque revoke()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.revocations = 0
+
+    def get(self, token):
+        """Retourne le CachedValidation du token, ou None (absent ou expiré)."""
+        key = token_key(token)
+        now = time.time()
+        with self._lock:
+            until = self._revoked.get(key)
+            if until is not None:
+                if until > now:
+                    self.hits += 1
+                    return CachedValidation(None, REVOKED_MESSAGE, until)
+                del self._revoked[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put_valid(self, token, user, exp=None):
+        """Mémorise un token valide jusqu'à son expiration (`exp`, timestamp UNIX)."""
+        expires_at = exp if exp is not None else time.time() + self.default_ttl
+        if expires_at <= time.time():
+            return
+        self._store(token_key(token), CachedValidation(user, None, expires_at))
+
+    def put_invalid(self, token, message):
+        """Mémorise un rejet pendant `negative_ttl` secondes."""
+        if self.negative_ttl <= 0:
+            return
+        self._store(token_key(token), CachedValidation(None, message, time.time() + self.negative_ttl))
+
+    def pop(self, token):
+        """Retire le token du cache et retourne son entrée (None si absente ou expirée).
+        Sans effet sur les compteurs hits/misses ni sur l'ordre LRU."""
+        key = token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._remove(key)
+            self.invalidations += 1
+            return entry if entry.expires_at > time.time() else None
+
+    def revoke(self, token, until=None):
+        """Révoque le token jusqu'à `until` (par défaut son `exp`, borné à max_revocation_ttl) :
+        get() le rejette désormais. Retourne son entrée valide retirée du cache (None sinon)."""
+        entry = self.pop(token)
+        now = time.time()
+        if until is None:
+            if entry is not None and entry.user is not None:
+                until = entry.expires_at
+            else:
+                until = unverified_exp(token) or now + self.default_ttl
+        until = min(until, now + self.max_revocation_ttl)
+        key = token_key(token)
+        self.revoke_key(key, until)
+        if self.on_revoke is not None and until > now:
+            self.on_revoke(key, until)
+        return entry
+
+    def revoke_key(self, key, until):
+        """Applique une révocation par empreinte (publiée par un autre worker)."""
+        now = time.time()
+        with self._lock:
+            if until <= now:
+                return
+            self._remove(key)
+            self._revoked[key] = max(until, self._revoked.get(key, 0))
+            self.revocations += 1
+            for old_key in [k for k, end in self._revoked.items() if end <= now]:
+                del self._revoked[old_key]
+
+    def invalidate(self, token):
+        with self._lock:
+            if self._remove(token_key(token)):
+                self.invalidations += 1
+
+    def invalidate_user(self, user):
+        """Supprime toutes les entrées d'un utilisateur (ex : après /auth/logout)."""
+        with self._lock:
+            for key in list(self._keys_by_user.get(user, ())):
+                if self._remove(key):
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "revoked": len(self._revoked),
+                "revocations": self.revocations,
+            }
+
+    # --- Fonctions internes ---
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            if entry.user is not None:
+                self._keys_by_user.setdefault(entry.user, set()).add(key)
+            while len(self._entries) > self.max_size:
+                old_key, old_entry = self._entries.popitem(last=False)
+                if old_entry.user is not None:
+                    self._forget_user_key(old_key, old_entry.user)
+                self.evictions += 1
+
+    def _remove(self, key):
+        # Appelée avec self._lock déjà pris
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        if entry.user is not None:
+            self._forget_user_key(key, entry.user)
+        return True
+
+    def _forget_user_key(self, key, user):
+        keys = self._keys_by_user.get(user)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user]
@@ -0,0 +1,131 @@
+'''Résumé des traces échantillonnées (common.tracing) : chemins les plus lents et saut dominant.
+Les lignes des différents services sont regroupées par X-Request-ID ; pour chaque saut,
+le temps propre = durée du saut - durée de ses appels upstream.
+Usage : python -m common.trace_report [traces.ndjson] [--top 10] [--json]'''
+
+# common/trace_report.py
+import argparse
+import json
+import sys
+
+from common.tracing import TRACE_FILE
+
+
+def load_records(path):
+    """Lignes JSON du fichier de traces (lignes illisibles ignorées)."""
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and 'request_id' in record:
+                records.append(record)
+    return records
+
+
+def percentile(sorted_values, fraction):
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def self_time(record):
+    upstream = sum(span['duration_ms'] for span in record.get('spans', ())
+                   if span['name'].startswith('upstream.'))
+    return max(0.0, record['duration_ms'] - upstream)
+
+
+def hop_label(record):
+    return f"{record['service']} {record['method']} {record['route']}"
+
+
+def build_requests(records):
+    """Une entrée par X-Request-ID : sauts dans l'ordre d'arrivée, durée vue par le premier service."""
+    by_id = {}
+    for record in records:
+        by_id.setdefault(record['request_id'], []).append(record)
+    requests = []
+    for request_id, hops in by_id.items():
+        # À début égal, le service appelant (plus longue durée) vient en premier
+        hops.sort(key=lambda hop: (hop['start'], -hop['duration_ms']))
+        requests.append({
+            "request_id": request_id,
+            "path": ' → '.join(hop_label(hop) for hop in hops),
+            "duration_ms": hops[0]['duration_ms'],
+            "hops": [{"hop": hop_label(hop), "status": hop.get('status'),
+                      "duration_ms": hop['duration_ms'], "self_ms": round(self_time(hop), 3)}
+                     for hop in hops],
+        })
+    return requests
+
+
+def summarize_paths(requests):
+    """Par chemin : nombre, p50 / p95 / max, temps propre moyen de chaque saut et saut dominant."""
+    by_path = {}
+    for request in requests:
+        by_path.setdefault(request['path'], []).append(request)
+    paths = []
+    for path, items in by_path.items():
+        durations = sorted(item['duration_ms'] for item in items)
+        hop_self = {}
+        for item in items:
+            for hop in item['hops']:
+                hop_self.setdefault(hop['hop'], []).append(hop['self_ms'])
+        mean_self = {hop: round(sum(values) / len(values), 3) for hop, values in hop_self.items()}
+        paths.append({
+            "path": path,
+            "count": len(items),
+            "p50_ms": percentile(durations, 0.50),
+            "p95_ms": percentile(durations, 0.95),
+            "max_ms": durations[-1],
+            "mean_self_ms": mean_self,
+            "dominant_hop": max(mean_self, key=mean_self.get),
+        })
+    paths.sort(key=lambda item: item['p95_ms'], reverse=True)
+    return paths
+
+
+def report(records, top=10):
+    requests = build_requests(records)
+    requests.sort(key=lambda item: item['duration_ms'], reverse=True)
+    return {"requests": len(requests), "paths": summarize_paths(requests)[:top], "slowest": requests[:top]}
+
+
+def print_report(result):
+    print(f"{result['requests']} requête(s) tracée(s)")
+    print("\n== Chemins les plus lents (p95)")
+    for path in result['paths']:
+        print(f"  {path['path']}")
+        print(f"    n={path['count']}  p50={path['p50_ms']} ms  p95={path['p95_ms']} ms  max={path['max_ms']} ms"
+              f"  saut dominant : {path['dominant_hop']}")
+        for hop, self_ms in path['mean_self_ms'].items():
+            print(f"      {self_ms:>10} ms  {hop}")
+    print("\n== Requêtes les plus lentes")
+    for request in result['slowest']:
+        print(f"  {request['duration_ms']:>10} ms  {request['request_id']}")
+        for hop in request['hops']:
+            print(f"      {hop['self_ms']:>10} ms propres / {hop['duration_ms']} ms  {hop['hop']} ({hop['status']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Résumé des traces : chemins les plus lents.")
+    parser.add_argument('path', nargs='?', default=TRACE_FILE, help=f"fichier de traces ({TRACE_FILE})")
+    parser.add_argument('--top', type=int, default=10, help="nombre de chemins / requêtes affichés")
+    parser.add_argument('--json', action='store_true', help="sortie JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        records = load_records(args.path)
+    except FileNotFoundError:
+        sys.exit(f"Fichier de traces introuvable : {args.path}")
+    result = report(records, top=args.top)
+    if args.json:
+        json.dump(result, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+'''Suivi d'une requête à travers les services (Front → Gateway → Auth / Orders).
+- X-Request-ID : créé par le premier service touché, repris tel quel par les suivants
+  et ajouté à chaque appel upstream,
+- spans : durée des sections chronométrées (common.metrics.timed_section) et des appels upstream,
+- Server-Timing : chaque service renvoie ses spans ; ceux des upstreams sont recopiés à la suite,
+  la réponse du Gateway (ou du Front) contient donc le détail de tous les sauts,
+- traces échantillonnées : une ligne JSON par service et par requête dans TRACE_FILE
+  (résumé : python -m common.trace_report).'''
+
+# common/tracing.py
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+SERVER_TIMING_HEADER = 'Server-Timing'
+
+# Même décision d'échantillonnage dans tous les services : elle ne dépend que du X-Request-ID
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.01))
+TRACE_SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', 500))    # toujours enregistrée au-delà (0 = jamais)
+TRACE_FILE = os.environ.get('TRACE_FILE', 'traces.ndjson')
+
+# Identifiant reçu accepté tel quel s'il est court et sans caractère spécial (sinon : nouveau)
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+SERVER_TIMING_MAX_ENTRIES = 32
+
+_current = contextvars.ContextVar('trace', default=None)
+_file_lock = threading.Lock()
+
+
+class Trace:
+    """Spans d'une requête dans un service."""
+
+    __slots__ = ('request_id', 'service', 'method', 'route', 'started', 'wall_started', 'spans', 'remote')
+
+    def __init__(self, request_id, service, method, route):
+        self.request_id = request_id
+        self.service = service
+        self.method = method
+        self.route = route
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.spans = []       # (nom, début relatif, durée) en secondes
+        self.remote = []      # entrées Server-Timing reçues des upstreams
+
+    def add_span(self, name, started, seconds):
+        self.spans.append((name, started - self.started, seconds))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, extra_spans=()):
+        """En-tête Server-Timing : total du service, ses spans (cumulés par nom), puis ceux des upstreams.
+        extra_spans : (nom, secondes) encore en cours, ex. un relais dont le corps n'est pas fini."""
+        totals = {}
+        for name, _, seconds in list(self.spans) + [(name, None, seconds) for name, seconds in extra_spans]:
+            totals[name] = totals.get(name, 0.0) + seconds
+        entries = [f"{self.service};dur={self.elapsed() * 1000:.2f}"]
+        prefix = self.service + '.'
+        entries.extend(f"{name if name.startswith(prefix) else prefix + name};dur={seconds * 1000:.2f}"
+                       for name, seconds in totals.items())
+        entries.extend(self.remote)
+        return ', '.join(entries[:SERVER_TIMING_MAX_ENTRIES])
+
+    def to_record(self, status):
+        return {
+            "request_id": self.request_id,
+            "service": self.service,
+            "method": self.method,
+            "route": self.route,
+            "status": status,
+            "start": round(self.wall_started, 6),
+            "duration_ms": round(self.elapsed() * 1000, 3),
+            "spans": [{"name": name, "start_ms": round(offset * 1000, 3), "duration_ms": round(seconds * 1000, 3)}
+                      for name, offset, seconds in self.spans],
+        }
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+def accept_request_id(value):
+    """Reprend l'identifiant reçu s'il est valide, sinon en crée un."""
+    if value and REQUEST_ID_PATTERN.match(value):
+        return value
+    return new_request_id()
+
+
+def is_sampled(request_id, rate=None):
+    rate = TRACE_SAMPLE_RATE if rate is None else rate
+    if rate <= 0:
+        return False
+    digest = hashlib.sha1(request_id.encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') / 2 ** 32 < rate
+
+
+def start_trace(request_id, service, method, route):
+    trace = Trace(request_id, service, method, route)
+    return trace, _current.set(trace)
+
+
+def end_trace(token):
+    _current.reset(token)
+
+
+def detach_trace():
+    """Dans une tâche asyncio qui sert plusieurs requêtes (lot de validations) : aucune trace rattachée."""
+    _current.set(None)
+
+
+def current_trace():
+    return _current.get()
+
+
+def current_request_id():
+    trace = _current.get()
+    return trace.request_id if trace is not None else None
+
+
+def record_span(name, started, seconds):
+    """Ajoute un span à la trace de la requête en cours (sans effet hors requête : threads de fond)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add_span(name, started, seconds)
+
+
+def outgoing_headers(headers=None):
+    """En-têtes d'un appel upstream, complétés du X-Request-ID de la requête en cours."""
+    headers = dict(headers or {})
+    request_id = current_request_id()
+    if request_id is not None:
+        headers.setdefault(REQUEST_ID_HEADER, request_id)
+    return headers
+
+
+def merge_server_timing(value):
+    """Recopie le Server-Timing d'une réponse upstream dans la trace en cours."""
+    trace = _current.get()
+    if trace is None or not value:
+        return
+    trace.remote.extend(entry.strip() for entry in value.split(',') if entry.strip())
+
+
+def finish_trace(trace, status):
+    """Écrit la trace si elle est échantillonnée ou lente."""
+    slow = TRACE_SLOW_MS > 0 and trace.elapsed() * 1000 >= TRACE_SLOW_MS
+    if slow or is_sampled(trace.request_id):
+        try:
+            write_record(trace.to_record(status))
+        except OSError as e:
+            # Une trace perdue ne doit pas faire échouer la requête
+            print(f"Trace non enregistrée ({TRACE_FILE}) : {e}")
+
+
+def write_record(record, path=None):
+    line = (json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+    # Un seul write() en O_APPEND : les lignes des différents services ne s'entremêlent pas
+    with _file_lock:
+        fd = os.open(path or TRACE_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def instrument_flask(app, service):
+    """X-Request-ID, Server-Timing et traces échantillonnées pour une application Flask."""
+    from flask import g, request
+
+    @app.before_request
+    def _trace_start():
+        request_id = accept_request_id(request.headers.get(REQUEST_ID_HEADER))
+        g._trace, g._trace_token = start_trace(request_id, service, request.method,
+                                               request.url_rule.rule if request.url_rule is not None else 'non_route')
+
+    @app.after_request
+    def _trace_headers(response):
+        trace = g.get('_trace')
+        if trace is not None:
+            response.headers[REQUEST_ID_HEADER] = trace.request_id
+            response.headers[SERVER_TIMING_HEADER] = trace.server_timing()
+            finish_trace(trace, response.status_code)
+        return response
+
+    @app.teardown_request
+    def _trace_end(exc):
+        token = g.pop('_trace_token', None)
+        if token is not None:
+            end_trace(token)
+
+    return app
@@ -0,0 +1,236 @@
+'''Clients HTTP partagés vers les services internes (Auth, Orders, Gateway).
+Chaque upstream possède sa propre session `requests` avec un pool de connexions
+keep-alive : on évite d'ouvrir une connexion TCP par appel (et l'accumulation de
+sockets en TIME_WAIT). Taille du pool et timeouts sont réglables par upstream.
+Chaque appel passe par le disjoncteur de l'upstream et respecte le délai de la requête en cours.
+Option `adaptive_limit` : nombre d'appels simultanés ajusté à la latence de l'upstream, requêtes en
+trop refusées vite (common/concurrency_limiter.py).'''
+
+# common/upstream.py
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+import requests
+from requests.adapters import HTTPAdapter
+from common import deadline
+from common.circuit_breaker import CircuitOpen, UpstreamBreaker, UpstreamFailure, UpstreamShed, check_response
+from common.concurrency_limiter import (AdaptiveLimit, ConcurrencyLimiter, Overloaded, DEFAULT_LATENCY_TOLERANCE,
+                                        DEFAULT_LIMIT_MIN, DEFAULT_QUEUE_TIMEOUT)
+from common.metrics import observe_upstream
+from common.tracing import SERVER_TIMING_HEADER, merge_server_timing, outgoing_headers, record_span
+
+# Pannes comptées par le disjoncteur (un délai épuisé avant l'envoi est local : ce n'en est pas une)
+FAILURE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+# Erreurs à traiter comme "service indisponible" (dont : disjoncteur ouvert, upstream saturé, délai épuisé)
+UPSTREAM_ERRORS = FAILURE_ERRORS + (deadline.DeadlineExceeded, CircuitOpen, Overloaded)
+# Échecs qui font baisser la limite adaptative : pannes et réponses 5xx. Pas un délai épuisé en attendant
+# une connexion locale, ni un 503 avec Retry-After (UpstreamShed : l'upstream a répondu, il refuse de la charge)
+LIMIT_FAILURES = FAILURE_ERRORS + (UpstreamFailure,)
+
+DEFAULT_POOL_SIZE = 10
+# Clients de long-poll (statut de paiement) : chaque appel garde une connexion plusieurs secondes
+LONG_POLL_POOL_SIZE = 50
+DEFAULT_CONNECT_TIMEOUT = 2.0   # secondes
+DEFAULT_READ_TIMEOUT = 10.0     # secondes
+DEFAULT_BREAKER_FAIL_MAX = 5    # échecs consécutifs avant ouverture
+DEFAULT_BREAKER_RESET_TIMEOUT = 10.0   # secondes avant l'appel d'essai
+
+
+class UpstreamClient:
+    """Client d'un service interne : pool keep-alive borné + timeouts par défaut."""
+
+    def __init__(self, name, base_url, pool_size=DEFAULT_POOL_SIZE,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 breaker_fail_max=DEFAULT_BREAKER_FAIL_MAX, breaker_reset_timeout=DEFAULT_BREAKER_RESET_TIMEOUT,
+                 adaptive_limit=False, limit_min=DEFAULT_LIMIT_MIN, limit_max=None, queue_size=None,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT, latency_tolerance=DEFAULT_LATENCY_TOLERANCE):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        # pool_block=True : au-delà de pool_size, on attend une connexion libre
+        # au lieu d'en ouvrir une jetable
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                    pool_block=True, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+
+        self.breaker = UpstreamBreaker(name, FAILURE_ERRORS, fail_max=breaker_fail_max,
+                                       reset_timeout=breaker_reset_timeout)
+        # Limite adaptative : au plus pool_size appels (au-delà, ils attendraient une connexion)
+        self.limiter = None
+        if adaptive_limit:
+            self.limiter = ConcurrencyLimiter(
+                name, AdaptiveLimit(limit_min, limit_max or pool_size, tolerance=latency_tolerance),
+                queue_size=2 * pool_size if queue_size is None else queue_size, queue_timeout=queue_timeout,
+                failures=LIMIT_FAILURES)
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waits = 0
+        self.requests = 0
+        self.errors = 0
+
+    def request(self, method, path, **kwargs):
+        # Timeouts raccourcis au temps restant de la requête en cours (DeadlineExceeded s'il n'y en a plus)
+        kwargs['timeout'] = deadline.bound_timeout(kwargs.get('timeout', (self.connect_timeout, self.read_timeout)))
+        # X-Request-ID et temps restant transmis à l'upstream
+        kwargs['headers'] = deadline.outgoing_headers(outgoing_headers(kwargs.get('headers')))
+
+        started = time.perf_counter()
+        try:
+            # Upstream saturé : Overloaded après une courte attente au plus, sans rien envoyer
+            with self.limiter.slot() if self.limiter is not None else nullcontext():
+                # Connexion du pool prise avant le disjoncteur : un délai épuisé pendant cette attente
+                # est local, ce n'est pas une panne de l'upstream
+                with self._pool_slot():
+                    # Disjoncteur ouvert : CircuitOpen tout de suite, sans rien envoyer
+                    with self.breaker.guard():
+                        response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+                        check_response(response, response.status_code)
+        except (UpstreamFailure, UpstreamShed) as e:
+            response = e.response
+        except UPSTREAM_ERRORS as e:
+            elapsed = time.perf_counter() - started
+            observe_upstream(self.name, method, 'rejected' if isinstance(e, (CircuitOpen, Overloaded)) else 'error',
+                             elapsed)
+            record_span(f"upstream.{self.name}", started, elapsed)
+            with self._lock:
+                self.errors += 1
+            raise
+        elapsed = time.perf_counter() - started
+        observe_upstream(self.name, method, str(response.status_code), elapsed)
+        record_span(f"upstream.{self.name}", started, elapsed)
+        merge_server_timing(response.headers.get(SERVER_TIMING_HEADER))
+        return response
+
+    @contextmanager
+    def _pool_slot(self):
+        """Une des pool_size connexions ; DeadlineExceeded si aucune ne se libère à temps."""
+        if not self._slots.acquire(blocking=False):
+            # Pool saturé : on compte l'attente puis on bloque (au plus le temps restant de la requête)
+            with self._lock:
+                self.waits += 1
+            wait = deadline.remaining()
+            if not self._slots.acquire(timeout=max(0, wait) if wait is not None else None):
+                raise deadline.DeadlineExceeded("Délai de la requête dépassé (pool de connexions saturé).")
+        with self._lock:
+            self.in_use += 1
+            self.requests += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def idle_connections(self):
+        """Nombre de connexions ouvertes et disponibles dans le pool urllib3."""
+        idle = 0
+        try:
+            pools = self._adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None and pool.pool is not None:
+                    idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        except AttributeError:
+            pass
+        return idle
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "base_url": self.base_url,
+                "pool_size": self.pool_size,
+                "connect_timeout": self.connect_timeout,
+                "read_timeout": self.read_timeout,
+                "in_use": self.in_use,
+                "waits": self.waits,
+                "requests": self.requests,
+                "errors": self.errors,
+            }
+        stats["idle"] = self.idle_connections()
+        stats["breaker"] = self.breaker.stats()
+        stats["concurrency"] = self.limiter.stats() if self.limiter is not None else None
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+# --- Registre des upstreams du processus ---
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _env(name, suffix, default, cast):
+    value = os.environ.get(f"UPSTREAM_{name.upper()}_{suffix}")
+    return cast(value) if value is not None else default
+
+
+def upstream_settings(name, pool_size=DEFAULT_POOL_SIZE,
+                      connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                      adaptive_limit=False):
+    """Réglages effectifs de l'upstream `name` : les variables UPSTREAM_<NAME>_POOL_SIZE /
+    _CONNECT_TIMEOUT / _READ_TIMEOUT / _BREAKER_FAIL_MAX / _BREAKER_RESET_TIMEOUT, et pour la limite
+    adaptative _ADAPTIVE_LIMIT / _LIMIT_MIN / _LIMIT_MAX / _QUEUE_SIZE / _QUEUE_TIMEOUT /
+    _LATENCY_TOLERANCE, ont priorité sur les valeurs passées en paramètre."""
+    pool_size = _env(name, 'POOL_SIZE', pool_size, int)
+    return {
+        "pool_size": pool_size,
+        "connect_timeout": _env(name, 'CONNECT_TIMEOUT', connect_timeout, float),
+        "read_timeout": _env(name, 'READ_TIMEOUT', read_timeout, float),
+        "breaker_fail_max": _env(name, 'BREAKER_FAIL_MAX', DEFAULT_BREAKER_FAIL_MAX, int),
+        "breaker_reset_timeout": _env(name, 'BREAKER_RESET_TIMEOUT', DEFAULT_BREAKER_RESET_TIMEOUT, float),
+        "adaptive_limit": _env(name, 'ADAPTIVE_LIMIT', adaptive_limit, lambda value: value != '0'),
+        "limit_min": _env(name, 'LIMIT_MIN', DEFAULT_LIMIT_MIN, int),
+        "limit_max": _env(name, 'LIMIT_MAX', pool_size, int),
+        "queue_size": _env(name, 'QUEUE_SIZE', 2 * pool_size, int),
+        "queue_timeout": _env(name, 'QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT, float),
+        "latency_tolerance": _env(name, 'LATENCY_TOLERANCE', DEFAULT_LATENCY_TOLERANCE, float),
+    }
+
+
+def configure_upstream(name, base_url, pool_size=DEFAULT_POOL_SIZE,
+                       connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                       adaptive_limit=False):
+    """Crée (ou remplace) le client `name` (voir upstream_settings pour la configuration)."""
+    client = UpstreamClient(name, base_url, **upstream_settings(
+        name, pool_size=pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout,
+        adaptive_limit=adaptive_limit))
+    with _clients_lock:
+        previous = _clients.get(name)
+        _clients[name] = client
+    if previous is not None:
+        previous.close()
+    return client
+
+
+def get_upstream(name):
+    return _clients[name]
+
+
+def upstream_stats():
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.stats() for client in clients}
+
+
+def unavailable_status(error):
+    """(statut, en-têtes) d'une réponse quand un appel interne a échoué :
+    504 si le délai de la requête est épuisé, sinon 503 avec Retry-After (attente du disjoncteur ouvert,
+    ou 1 s pour un upstream saturé)."""
+    if isinstance(error, deadline.DeadlineExceeded):
+        return 504, {}
+    retry_after = error.retry_after if isinstance(error, (CircuitOpen, Overloaded)) else 1
+    return 503, {'Retry-After': str(retry_after)}
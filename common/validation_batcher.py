@@ -0,0 +1,95 @@
+'''Regroupement des validations de token côté Gateway.
+Les tokens à valider qui arrivent dans une courte fenêtre (quelques ms) partent
+ensemble en un seul appel à /auth/validate/batch au lieu d'un appel chacun.
+Un même token demandé plusieurs fois pendant la fenêtre n'est envoyé qu'une fois.'''
+
+# common/validation_batcher.py
+import threading
+import time
+
+
+class _Waiter:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ValidationBatcher:
+    """send_batch(tokens) -> liste de résultats (même ordre), appelée par un thread dédié."""
+
+    def __init__(self, send_batch, window=0.002, max_batch=100, timeout=10.0):
+        self.send_batch = send_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._pending = {}
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.tokens_sent = 0
+        self.coalesced = 0
+        self._thread = threading.Thread(target=self._run, name='token-validation-batcher', daemon=True)
+        self._thread.start()
+
+    def validate(self, token):
+        """Retourne le résultat de validation du token (bloque le temps du lot)."""
+        with self._cond:
+            waiter = self._pending.get(token)
+            if waiter is None:
+                waiter = _Waiter()
+                self._pending[token] = waiter
+                self._cond.notify()
+            else:
+                self.coalesced += 1
+        if not waiter.event.wait(self.timeout):
+            raise TimeoutError("Validation groupée trop longue.")
+        if waiter.error is not None:
+            raise waiter.error
+        return waiter.result
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Fenêtre de regroupement (écourtée si le lot est déjà plein)
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            tokens = list(self._pending)[:self.max_batch]
+            return [(token, self._pending.pop(token)) for token in tokens]
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            tokens = [token for token, _ in batch]
+            try:
+                results = self.send_batch(tokens)
+                if len(results) != len(tokens):
+                    raise ValueError("Réponse de validation groupée incomplète.")
+                for (_, waiter), result in zip(batch, results):
+                    waiter.result = result
+            except Exception as e:
+                for _, waiter in batch:
+                    waiter.error = e
+            finally:
+                for _, waiter in batch:
+                    waiter.event.set()
+            with self._cond:
+                self.batches += 1
+                self.tokens_sent += len(tokens)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "tokens_sent": self.tokens_sent,
+                "coalesced": self.coalesced,
+                "avg_batch_size": round(self.tokens_sent / self.batches, 2) if self.batches else 0.0,
+            }
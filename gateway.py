@@ -6,15 +6,149 @@ Il sert à :
 
 
 # gateway.py
+import os
+import sys
+from urllib.parse import quote
 from flask import Flask, request, jsonify, abort
-import requests
+from common.token_cache import TokenCache
+from common.jwt_keys import JWKSVerifier
+from common.validation_batcher import ValidationBatcher
+from common.upstream import configure_upstream, upstream_stats, unavailable_status, UPSTREAM_ERRORS, LONG_POLL_POOL_SIZE
+from common.http_headers import filter_buffered_response_headers, client_ip, AUTHENTICATED_USER_HEADER
+from common.rate_limiter import RateLimitClient, RateLimiter, Rule, TokenBuckets
+from common.revocations import RevocationSync
+from common.metrics import REGISTRY, instrument_flask, timed_section
+from common import deadline, tracing
 
 # --- Initialisation de l'API Gateway ---
 gateway_app = Flask(__name__)
+# Latence par route, requêtes en cours, appels aux services internes : GET /metrics
+instrument_flask(gateway_app, 'gateway')
+# X-Request-ID propagé, Server-Timing par saut, traces échantillonnées (TRACE_FILE)
+tracing.instrument_flask(gateway_app, 'gateway')
+
+# Délai maximal d'une requête (secondes), réduit par celui reçu du client (X-Request-Deadline-Ms)
+# et transmis aux services appelés
+REQUEST_TIMEOUT = float(os.environ.get('GATEWAY_REQUEST_TIMEOUT', 10))
+deadline.instrument_flask(gateway_app, REQUEST_TIMEOUT)
 
 # --- Configuration des Microservices (URLs internes) ---
-AUTH_SERVICE_URL = 'http://localhost:5002/auth' 
-ORDERS_SERVICE_URL = 'http://localhost:5001' # Base URL pour l'Orders Service
+# (AUTH_SERVICE_URL / ORDERS_SERVICE_URL : autres adresses, ex. pour les benchmarks)
+AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'http://localhost:5002').rstrip('/') + '/auth'
+ORDERS_SERVICE_URL = os.environ.get('ORDERS_SERVICE_URL', 'http://localhost:5001') # Base URL pour l'Orders Service
+
+# Clients keep-alive (un pool de connexions par service interne), chacun avec une limite adaptative
+# d'appels simultanés : un service qui ralentit reçoit moins de requêtes, le surplus est refusé en 503
+# au lieu de s'accumuler (réglages UPSTREAM_<NAME>_LIMIT_* / _QUEUE_*, cf. common/upstream.py)
+ADAPTIVE_LIMIT = os.environ.get('GATEWAY_ADAPTIVE_LIMIT', '1') != '0'
+auth_client = configure_upstream('auth', AUTH_SERVICE_URL, adaptive_limit=ADAPTIVE_LIMIT)
+orders_client = configure_upstream('orders', ORDERS_SERVICE_URL, adaptive_limit=ADAPTIVE_LIMIT)
+# Long-poll du statut de paiement : pool à part, sans limite adaptative (la durée d'un appel est
+# l'attente du paiement, pas la latence du Orders Service)
+orders_status_client = configure_upstream('orders_status', ORDERS_SERVICE_URL, pool_size=LONG_POLL_POOL_SIZE)
+
+# --- Cache des validations de token (évite un appel à /auth/validate par requête) ---
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get('GATEWAY_TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_NEGATIVE_TTL = float(os.environ.get('GATEWAY_TOKEN_CACHE_NEGATIVE_TTL', 5))
+token_cache = TokenCache(max_size=TOKEN_CACHE_MAX_SIZE, negative_ttl=TOKEN_CACHE_NEGATIVE_TTL)
+REGISTRY.register_stats('gateway_token_cache', token_cache.stats)
+REGISTRY.register_stats('upstream', upstream_stats)
+
+
+# --- Vérification locale des tokens signés en EdDSA / RS256 (clés publiques du JWKS de l'Auth Service) ---
+# Les tokens HS256 (sans kid) et les kid inconnus restent validés par l'Auth Service.
+LOCAL_VERIFY = os.environ.get('GATEWAY_LOCAL_VERIFY', '1') != '0'
+jwks_verifier = (JWKSVerifier(fetch=lambda: auth_client.get('/.well-known/jwks.json').json())
+                 if LOCAL_VERIFY else None)
+if jwks_verifier is not None:
+    REGISTRY.register_stats('gateway_jwks', jwks_verifier.stats)
+
+
+# --- Limitation de débit par utilisateur et par adresse IP (seaux à jetons) ---
+# Appliquée après la validation du token : un client trop bavard reçoit 429 + Retry-After au lieu
+# d'occuper l'écrivain unique du Orders Service. Avec plusieurs workers, les seaux sont partagés
+# via la socket du superviseur (RATE_LIMIT_SOCKET).
+RATE_LIMIT_ENABLED = os.environ.get('GATEWAY_RATE_LIMIT', '1') != '0'
+RATE_LIMIT_RULES = [
+    Rule('user', float(os.environ.get('GATEWAY_RATE_LIMIT_USER_RATE', 10)),
+         float(os.environ.get('GATEWAY_RATE_LIMIT_USER_BURST', 20))),
+    Rule('ip', float(os.environ.get('GATEWAY_RATE_LIMIT_IP_RATE', 50)),
+         float(os.environ.get('GATEWAY_RATE_LIMIT_IP_BURST', 100))),
+]
+RATE_LIMIT_SOCKET = os.environ.get('RATE_LIMIT_SOCKET')
+# Proxys dont X-Forwarded-For est cru : l'adresse du Front (qui relaie celle de ses visiteurs), à
+# configurer. Aucun par défaut : croire 127.0.0.1 laisserait tout client local choisir son adresse.
+TRUSTED_PROXIES = frozenset(filter(None, os.environ.get('GATEWAY_TRUSTED_PROXIES', '').split(',')))
+rate_limiter = None
+if RATE_LIMIT_ENABLED:
+    rate_limiter = RateLimiter(RATE_LIMIT_RULES,
+                               RateLimitClient(RATE_LIMIT_SOCKET) if RATE_LIMIT_SOCKET else TokenBuckets())
+    REGISTRY.register_stats('gateway_rate_limit', rate_limiter.stats)
+
+# --- Révocations de tokens (déconnexions) partagées entre les workers du superviseur ---
+# Sans superviseur (un seul processus), la révocation dans token_cache suffit.
+revocation_sync = RevocationSync(RATE_LIMIT_SOCKET, token_cache).start() if RATE_LIMIT_SOCKET else None
+if revocation_sync is not None:
+    REGISTRY.register_stats('gateway_revocations', revocation_sync.stats)
+
+def throttled_response(user):
+    """Réponse 429 si l'utilisateur ou l'adresse du client a épuisé son seau, sinon None."""
+    if rate_limiter is None:
+        return None
+    ip = client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'), TRUSTED_PROXIES)
+    allowed, retry_after, scope = rate_limiter.check(user=user, ip=ip)
+    if allowed:
+        return None
+    return (jsonify({"message": "Trop de requêtes, réessayez plus tard.", "scope": scope}), 429,
+            {'Retry-After': str(retry_after)})
+
+
+# --- Validation de token auprès de l'Auth Service ---
+def validate_remote(token):
+    """Un appel /auth/validate ; retourne {"status": "valid"|"expired"|"invalid"|"error", ...}."""
+    response = auth_client.post('/validate', json={'token': token})
+    data = response.json()
+    if response.status_code == 200:
+        return {"status": "valid", "user": data.get('user'), "exp": data.get('exp')}
+    if response.status_code == 401:
+        return {"status": "invalid", "message": data.get('message', "Token invalide.")}
+    return {"status": "error", "message": data.get('message', "Token invalide.")}
+
+def validate_remote_batch(tokens):
+    """Un appel /auth/validate/batch pour tous les tokens du lot."""
+    response = auth_client.post('/validate/batch', json={'tokens': tokens})
+    if response.status_code != 200:
+        raise ValueError(f"Validation groupée refusée ({response.status_code}).")
+    return response.json()['results']
+
+# Fenêtre de regroupement des validations (0 = un appel par token)
+VALIDATION_BATCH_WINDOW_MS = float(os.environ.get('GATEWAY_VALIDATION_BATCH_WINDOW_MS', 2))
+VALIDATION_BATCH_MAX = int(os.environ.get('GATEWAY_VALIDATION_BATCH_MAX', 100))
+validation_batcher = (ValidationBatcher(validate_remote_batch, window=VALIDATION_BATCH_WINDOW_MS / 1000,
+                                        max_batch=VALIDATION_BATCH_MAX)
+                      if VALIDATION_BATCH_WINDOW_MS > 0 else None)
+if validation_batcher is not None:
+    REGISTRY.register_stats('gateway_validation_batcher', validation_batcher.stats)
+
+
+class AuthUnavailable(Exception):
+    """Le token n'a pas pu être vérifié (Auth Service en panne, disjoncteur ouvert, délai épuisé)."""
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+def unavailable_response(message, error):
+    """503 + Retry-After (ou 504 si le délai de la requête est épuisé) : le client réessaie plus tard."""
+    status, headers = unavailable_status(error)
+    return jsonify({"message": message}), status, headers
+
+
+# Pas un 401 : le token n'est pas en cause, le client ne doit pas se reconnecter
+@gateway_app.errorhandler(AuthUnavailable)
+def handle_auth_unavailable(e):
+    return unavailable_response("Auth Service indisponible.", e.error)
 
 
 # --- Middleware de validation de Token ---
@@ -27,23 +161,48 @@ def validate_and_get_user():
         return None, "Token JWT manquant ou format invalide (Bearer requis)."
 
     token = auth_header.split(' ')[1]
+
+    # 2. Résultat déjà connu ? (token validé récemment, ou rejeté il y a peu)
+    cached = token_cache.get(token)
+    if cached is not None:
+        if cached.user is not None:
+            return cached.user, None
+        return None, cached.message
     
-    # 2. Appeler l'Auth Service pour valider le token
-    try:
-        response = requests.post(
-            f"{AUTH_SERVICE_URL}/validate",
-            json={'token': token}
-        )
-        
-        if response.status_code == 200:
-            # Token valide, retourne le nom d'utilisateur extrait
-            return response.json().get('user'), None
-        else:
-            # Token invalide (expiré, signature incorrecte)
-            return None, response.json().get('message', "Token invalide.")
-            
-    except requests.exceptions.ConnectionError:
-        return None, "Erreur de connexion : Auth Service indisponible."
+    # 3. Token signé par une clé publiée : vérifié ici, sans appel réseau
+    result = None
+    if jwks_verifier is not None:
+        with timed_section('gateway.verify_token_local'):
+            result = jwks_verifier.check(token)
+
+    # 4. Sinon, appeler l'Auth Service pour valider le token (regroupé avec les autres si activé)
+    if result is None:
+        try:
+            with timed_section('gateway.validate_token'):
+                if validation_batcher is not None:
+                    result = validation_batcher.validate(token)
+                else:
+                    result = validate_remote(token)
+        except (UPSTREAM_ERRORS + (ValueError, KeyError, TimeoutError)) as e:
+            # Pas de mise en cache : l'indisponibilité est temporaire
+            raise AuthUnavailable(e)
+
+    if result['status'] == 'valid':
+        # Token valide, retourne le nom d'utilisateur extrait
+        token_cache.put_valid(token, result['user'], result.get('exp'))
+        return result['user'], None
+
+    # Token invalide (expiré, signature incorrecte)
+    message = result.get('message', "Token invalide.")
+    if result['status'] != 'error':
+        # Rejet définitif : on le garde quelques secondes (cache négatif)
+        token_cache.put_invalid(token, message)
+    return None, message
+
+
+def forwarded_auth_headers(user):
+    """Utilisateur validé + token d'origine (le Orders Service peut le vérifier lui-même, ORDERS_VERIFY_TOKENS)."""
+    return {AUTHENTICATED_USER_HEADER: user, 'Authorization': request.headers['Authorization']}
 
 
 # --- ROUTE PRINCIPALE DU GATEWAY ---
@@ -58,6 +217,9 @@ def handle_submit_order():
     if error:
         # 401 Unauthorized si le token est invalide ou absent
         return jsonify({"message": f"Accès refusé. {error}"}), 401
+    throttled = throttled_response(user)
+    if throttled:
+        return throttled
     
     # 2. Ajout de l'utilisateur validé aux données de la requête (Enrichissement)
     # On force l'utilisateur dans le payload pour s'assurer qu'il correspond au token
@@ -67,20 +229,122 @@ def handle_submit_order():
     # 3. Routage vers le Orders Service (API métier)
     try:
         # Envoie la requête au Orders Service (port 5001)
-        response = requests.post(f"{ORDERS_SERVICE_URL}/orders", json=payload)
+        response = orders_client.post('/orders', json=payload, headers=forwarded_auth_headers(user))
         
         # 4. Retourne la réponse du service au client
         # Utilise .content et .status_code pour transmettre la réponse binaire/JSON et le statut exact
-        return response.content, response.status_code, response.headers.items()
+        # (sans les en-têtes hop-by-hop ni Content-Length/Content-Encoding du corps d'origine)
+        return response.content, response.status_code, filter_buffered_response_headers(response.headers.items())
         
-    except requests.exceptions.ConnectionError:
-        return jsonify({"message": "Orders Service indisponible."}, 503)
+    except UPSTREAM_ERRORS as e:
+        return unavailable_response("Orders Service indisponible.", e)
+
+
+# --- ROUTE : Déconnexion (révocation de la session et du token d'accès + purge du cache) ---
+@gateway_app.route('/api/auth/logout', methods=['POST'])
+def handle_logout():
+    data = request.get_json(silent=True) or {}
+    auth_header = request.headers.get('Authorization', '')
+
+    # Le token d'accès présenté est rejeté jusqu'à son expiration (et publié aux autres workers) ;
+    # les autres validations de l'utilisateur sont oubliées
+    if auth_header.startswith('Bearer '):
+        cached = token_cache.revoke(auth_header.split(' ')[1])
+        if cached is not None and cached.user is not None:
+            token_cache.invalidate_user(cached.user)
+
+    try:
+        response = auth_client.post('/logout', json={'refresh_token': data.get('refresh_token')})
+        return response.content, response.status_code, {'Content-Type': 'application/json'}
+    except UPSTREAM_ERRORS as e:
+        return unavailable_response("Auth Service indisponible.", e)
 
 
-# Vous pouvez ajouter d'autres routes ici (ex: GET /api/orders/<user> pour l'historique)
-# ...
+# --- ROUTE : Statistiques internes du Gateway ---
+@gateway_app.route('/gateway/stats', methods=['GET'])
+def gateway_stats():
+    return jsonify({
+        "token_cache": token_cache.stats(),
+        "validation_batcher": validation_batcher.stats() if validation_batcher else None,
+        "jwks": jwks_verifier.stats() if jwks_verifier else None,
+        "rate_limit": rate_limiter.stats() if rate_limiter else None,
+        "revocations": revocation_sync.stats() if revocation_sync else None,
+        "upstreams": upstream_stats()
+    }), 200
+
+
+# --- ROUTE : Plusieurs commandes en une requête (POST /api/orders/batch) ---
+# Un seul contrôle du token pour tout le lot ; le Orders Service les enregistre ensemble.
+@gateway_app.route('/api/orders/batch', methods=['POST'])
+def handle_submit_orders_batch():
+    user, error = validate_and_get_user()
+    if error:
+        return jsonify({"message": f"Accès refusé. {error}"}), 401
+    throttled = throttled_response(user)
+    if throttled:
+        return throttled
+    try:
+        response = orders_client.post('/orders/batch', data=request.get_data(),
+                                      headers={'Content-Type': 'application/json', **forwarded_auth_headers(user)})
+        return response.content, response.status_code, filter_buffered_response_headers(response.headers.items())
+    except UPSTREAM_ERRORS as e:
+        return unavailable_response("Orders Service indisponible.", e)
+
+
+# --- ROUTE : Historique des commandes (GET /api/orders/<user>) ---
+# Un utilisateur ne lit que son propre historique. Pagination (limit, cursor, from, to)
+# et ETag / If-None-Match sont relayés tels quels au Orders Service.
+@gateway_app.route('/api/orders/<user>', methods=['GET'])
+def handle_order_history(user):
+    token_user, error = validate_and_get_user()
+    if error:
+        return jsonify({"message": f"Accès refusé. {error}"}), 401
+    if token_user != user:
+        return jsonify({"message": "Accès refusé à l'historique d'un autre utilisateur."}), 403
+    throttled = throttled_response(token_user)
+    if throttled:
+        return throttled
+
+    headers = forwarded_auth_headers(user)
+    if 'If-None-Match' in request.headers:
+        headers['If-None-Match'] = request.headers['If-None-Match']
+    try:
+        response = orders_client.get(f"/orders/{quote(user, safe='')}/history",
+                                     params=request.args, headers=headers)
+        return response.content, response.status_code, filter_buffered_response_headers(response.headers.items())
+    except UPSTREAM_ERRORS as e:
+        return unavailable_response("Orders Service indisponible.", e)
+
+
+# --- ROUTE : Statut d'une commande (GET /api/orders/<order_id>/status) ---
+# Commande acceptée en 202 'pending' puis payée hors requête : le client suit son statut ici
+# (wait=N : long-poll, la réponse attend au plus N secondes la fin du paiement).
+@gateway_app.route('/api/orders/<order_id>/status', methods=['GET'])
+def handle_order_status(order_id):
+    user, error = validate_and_get_user()
+    if error:
+        return jsonify({"message": f"Accès refusé. {error}"}), 401
+    throttled = throttled_response(user)
+    if throttled:
+        return throttled
+    try:
+        response = orders_status_client.get(f"/orders/{quote(order_id, safe='')}/status",
+                                            params=request.args, headers=forwarded_auth_headers(user))
+        return response.content, response.status_code, filter_buffered_response_headers(response.headers.items())
+    except UPSTREAM_ERRORS as e:
+        return unavailable_response("Orders Service indisponible.", e)
 
 if __name__ == '__main__':
     # Le Gateway s'exécute sur le port 5003
-    print("API Gateway démarrée sur http://localhost:5003")
-    gateway_app.run(debug=True, port=5003)
\ No newline at end of file
+    # Mode asynchrone (asyncio + streaming) : python gateway.py --async  (ou GATEWAY_MODE=async)
+    if '--async' in sys.argv or os.environ.get('GATEWAY_MODE') == 'async':
+        import gateway_async
+        print("API Gateway (mode asynchrone) démarrée sur http://localhost:5003")
+        gateway_async.run(port=5003, auth_url=AUTH_SERVICE_URL, orders_url=ORDERS_SERVICE_URL,
+                          token_cache=token_cache, jwks_verifier=jwks_verifier,
+                          rate_limiter=rate_limiter, trusted_proxies=TRUSTED_PROXIES, adaptive_limit=ADAPTIVE_LIMIT,
+                          batch_window=VALIDATION_BATCH_WINDOW_MS / 1000,
+                          batch_max=VALIDATION_BATCH_MAX, request_timeout=REQUEST_TIMEOUT)
+    else:
+        print("API Gateway démarrée sur http://localhost:5003")
+        gateway_app.run(debug=True, port=5003)
\ No newline at end of file
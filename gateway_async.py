@@ -0,0 +1,551 @@
+'''Mode asynchrone de l'API Gateway (asyncio + aiohttp).
+Mêmes routes et même contrôle du JWT que gateway.py, mais :
+- un seul event loop gère des milliers de requêtes en vol (pas un thread par requête),
+- les corps de requête et de réponse sont relayés par morceaux, sans être chargés en mémoire,
+- les en-têtes hop-by-hop ne sont pas recopiés d'une connexion à l'autre.
+Lancement : python gateway.py --async  (ou GATEWAY_MODE=async python gateway.py)'''
+
+# gateway_async.py
+import asyncio
+import time
+from contextlib import contextmanager, nullcontext
+from urllib.parse import quote
+import aiohttp
+from aiohttp import web
+from common.upstream import upstream_settings, unavailable_status, LONG_POLL_POOL_SIZE
+from common.http_headers import filter_headers, client_ip, AUTHENTICATED_USER_HEADER
+from common.circuit_breaker import CircuitOpen, UpstreamBreaker, UpstreamFailure, UpstreamShed, check_response
+from common.concurrency_limiter import AdaptiveLimit, AsyncConcurrencyLimiter, Overloaded
+from common.jwt_keys import KeysUnavailable
+from common.rate_limiter import TokenBuckets
+from common import deadline, tracing
+from common.metrics import (REGISTRY, CONTENT_TYPE, HTTP_DURATION, HTTP_IN_FLIGHT, HTTP_REQUESTS,
+                            observe_upstream, timed_section)
+
+CHUNK_SIZE = 64 * 1024
+# Pannes comptées par les disjoncteurs (un délai épuisé avant l'envoi est local : ce n'en est pas une)
+FAILURE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+# "Service indisponible" (dont : disjoncteur ouvert, upstream saturé, délai épuisé)
+UPSTREAM_ERRORS = FAILURE_ERRORS + (deadline.DeadlineExceeded, CircuitOpen, Overloaded)
+# Échecs qui font baisser la limite adaptative (voir common.upstream.LIMIT_FAILURES)
+LIMIT_FAILURES = FAILURE_ERRORS + (UpstreamFailure,)
+# Réponse de l'Auth Service illisible (ex : page HTML d'erreur) : traitée comme une indisponibilité
+VALIDATION_ERRORS = UPSTREAM_ERRORS + (ValueError, KeyError, TypeError)
+
+
+class AuthUnavailable(Exception):
+    """Le token n'a pas pu être vérifié (voir gateway.AuthUnavailable)."""
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+def unavailable_response(message, error):
+    status, headers = unavailable_status(error)
+    return web.json_response({"message": message}, status=status, headers=headers)
+
+
+class UpstreamCounters:
+    """Compteurs d'usage d'un upstream (mêmes champs que common.upstream.UpstreamClient.stats)."""
+
+    def __init__(self, name, base_url, settings):
+        self.name = name
+        self.base_url = base_url
+        self.settings = settings
+        self.breaker = UpstreamBreaker(name, FAILURE_ERRORS, fail_max=settings['breaker_fail_max'],
+                                       reset_timeout=settings['breaker_reset_timeout'])
+        # Limite adaptative d'appels simultanés (comme common.upstream.UpstreamClient)
+        self.limiter = None
+        if settings['adaptive_limit']:
+            self.limiter = AsyncConcurrencyLimiter(
+                name, AdaptiveLimit(settings['limit_min'], settings['limit_max'],
+                                    tolerance=settings['latency_tolerance']),
+                queue_size=settings['queue_size'], queue_timeout=settings['queue_timeout'],
+                failures=LIMIT_FAILURES)
+        self.in_use = 0
+        self.requests = 0
+        self.errors = 0
+
+    @contextmanager
+    def track(self, method):
+        """Compte un appel en cours (pas de verrou : tout se passe dans l'event loop).
+        L'appelant renseigne call['status'] : durée exportée par statut, ou 'error' sans réponse."""
+        self.in_use += 1
+        self.requests += 1
+        started = time.perf_counter()
+        call = {'status': None, 'started': started}
+        try:
+            yield call
+        except UPSTREAM_ERRORS:
+            self.errors += 1
+            raise
+        finally:
+            self.in_use -= 1
+            elapsed = time.perf_counter() - started
+            outcome = str(call['status']) if call['status'] is not None else 'error'
+            observe_upstream(self.name, method, outcome, elapsed)
+            tracing.record_span(f"upstream.{self.name}", started, elapsed)
+
+    def stats(self, connector):
+        return {
+            "base_url": self.base_url,
+            "pool_size": self.settings['pool_size'],
+            "connect_timeout": self.settings['connect_timeout'],
+            "read_timeout": self.settings['read_timeout'],
+            "in_use": self.in_use,
+            "requests": self.requests,
+            "errors": self.errors,
+            # Connexions keep-alive disponibles dans le connecteur aiohttp
+            "idle": sum(len(conns) for conns in getattr(connector, '_conns', {}).values()),
+            "breaker": self.breaker.stats(),
+            "concurrency": self.limiter.stats() if self.limiter is not None else None,
+        }
+
+    def timeout(self):
+        """Timeouts de l'appel, raccourcis au temps restant de la requête (None : ceux de la session)."""
+        left = deadline.remaining()
+        if left is None:
+            return None
+        if left <= 0:
+            raise deadline.DeadlineExceeded("Délai de la requête dépassé.")
+        return aiohttp.ClientTimeout(total=left, sock_connect=min(self.settings['connect_timeout'], left),
+                                     sock_read=min(self.settings['read_timeout'], left))
+
+
+class AsyncGateway:
+    """État du Gateway asynchrone : sessions HTTP par upstream + cache des tokens."""
+
+    def __init__(self, auth_url, orders_url, token_cache, batch_window=0.002, batch_max=100,
+                 request_timeout=None, jwks_verifier=None, rate_limiter=None, trusted_proxies=(),
+                 adaptive_limit=False):
+        self.auth_url = auth_url.rstrip('/')
+        self.orders_url = orders_url.rstrip('/')
+        self.token_cache = token_cache
+        # Vérification locale des tokens EdDSA / RS256 (JWKS partagé avec gateway.py)
+        self.jwks_verifier = jwks_verifier
+        # Limitation de débit par utilisateur / adresse IP (mêmes seaux que gateway.py)
+        self.rate_limiter = rate_limiter
+        self.trusted_proxies = trusted_proxies
+        self.adaptive_limit = adaptive_limit
+        self.request_timeout = request_timeout
+        self.sessions = {}
+        self.counters = {}
+        # Regroupement des validations (comme ValidationBatcher en mode synchrone)
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self._pending = {}       # token -> Future, en attente du prochain lot
+        self._flush_handle = None
+        self.batches = 0
+        self.tokens_sent = 0
+        self.coalesced = 0
+
+    # --- Cycle de vie ---
+
+    async def open_sessions(self, app):
+        upstreams = (('auth', self.auth_url, {'adaptive_limit': self.adaptive_limit}),
+                     ('orders', self.orders_url, {'adaptive_limit': self.adaptive_limit}),
+                     # Long-poll du statut de paiement : pool à part, sans limite adaptative (comme gateway.py)
+                     ('orders_status', self.orders_url, {'pool_size': LONG_POLL_POOL_SIZE}))
+        for name, base_url, defaults in upstreams:
+            settings = upstream_settings(name, **defaults)
+            self.counters[name] = UpstreamCounters(name, base_url, settings)
+            # limit = UPSTREAM_<NAME>_POOL_SIZE : connexions simultanées max vers cet upstream
+            connector = aiohttp.TCPConnector(limit=settings['pool_size'], keepalive_timeout=30)
+            timeout = aiohttp.ClientTimeout(sock_connect=settings['connect_timeout'],
+                                            sock_read=settings['read_timeout'])
+            # auto_decompress=False : les octets de l'upstream sont relayés tels quels
+            self.sessions[name] = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                        auto_decompress=False)
+
+    async def close_sessions(self, app):
+        for session in self.sessions.values():
+            await session.close()
+
+    # --- Validation du token ---
+
+    async def validate_and_get_user(self, request):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return None, "Token JWT manquant ou format invalide (Bearer requis)."
+        token = auth_header.split(' ')[1]
+
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            if cached.user is not None:
+                return cached.user, None
+            return None, cached.message
+
+        result = None
+        if self.jwks_verifier is not None:
+            with timed_section('gateway.verify_token_local'):
+                try:
+                    result = self.jwks_verifier.check(token, fetch=False)
+                except KeysUnavailable:
+                    # Téléchargement du JWKS bloquant : hors de l'event loop
+                    result = await asyncio.get_running_loop().run_in_executor(None, self.jwks_verifier.check, token)
+
+        if result is None:
+            try:
+                with timed_section('gateway.validate_token'):
+                    if self.batch_window > 0:
+                        result = await asyncio.shield(self._enqueue_validation(token))
+                    else:
+                        result = await self._validate_remote(token)
+            except VALIDATION_ERRORS as e:
+                # Pas de mise en cache : l'indisponibilité est temporaire
+                raise AuthUnavailable(e)
+
+        if result['status'] == 'valid':
+            self.token_cache.put_valid(token, result['user'], result.get('exp'))
+            return result['user'], None
+        message = result.get('message', "Token invalide.")
+        if result['status'] != 'error':
+            self.token_cache.put_invalid(token, message)
+        return None, message
+
+    async def _open(self, upstream, method, url, call, **kwargs):
+        """Envoie la requête (disjoncteur, délai restant) ; retourne la réponse, corps non lu."""
+        counters = self.counters[upstream]
+        timeout = counters.timeout()
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        try:
+            # Upstream saturé : Overloaded après une courte attente au plus ; la place est rendue
+            # à l'arrivée des en-têtes de la réponse (le corps est relayé ensuite)
+            async with counters.limiter.slot() if counters.limiter is not None else nullcontext():
+                # Disjoncteur ouvert : CircuitOpen tout de suite, sans prendre de connexion
+                with counters.breaker.guard():
+                    response = await self.sessions[upstream].request(method, url, **kwargs)
+                    check_response(response, response.status)
+        except (UpstreamFailure, UpstreamShed) as e:
+            response = e.response
+        except (CircuitOpen, Overloaded):
+            call['status'] = 'rejected'
+            raise
+        call['status'] = response.status
+        tracing.merge_server_timing(response.headers.get(tracing.SERVER_TIMING_HEADER))
+        return response
+
+    async def _call(self, upstream, method, url, headers=None, **kwargs):
+        """Appel JSON vers un upstream ; retourne (statut, corps décodé)."""
+        headers = deadline.outgoing_headers(tracing.outgoing_headers(headers))
+        with self.counters[upstream].track(method) as call:
+            async with await self._open(upstream, method, url, call, headers=headers, **kwargs) as response:
+                return response.status, await response.json(content_type=None)
+
+    async def _validate_remote(self, token):
+        """Un appel /auth/validate (même format de résultat que check_access_token)."""
+        status, data = await self._call('auth', 'POST', f"{self.auth_url}/validate", json={'token': token})
+        if status == 200:
+            return {"status": "valid", "user": data['user'], "exp": data.get('exp')}
+        if status == 401:
+            return {"status": "invalid", "message": data.get('message', "Token invalide.")}
+        return {"status": "error", "message": data.get('message', "Token invalide.")}
+
+    def _enqueue_validation(self, token):
+        """Ajoute le token au prochain lot /auth/validate/batch ; un même token n'est envoyé qu'une fois."""
+        future = self._pending.get(token)
+        if future is not None:
+            self.coalesced += 1
+            return future
+        future = asyncio.get_running_loop().create_future()
+        self._pending[token] = future
+        if len(self._pending) >= self.batch_max:
+            self._flush_validations()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window,
+                                                                       self._flush_validations)
+        return future
+
+    def _flush_validations(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._send_batch(batch))
+
+    async def _send_batch(self, batch):
+        # Lot commun à plusieurs requêtes : ni la trace ni le délai de celle qui l'a déclenché
+        tracing.detach_trace()
+        deadline.start(None)
+        tokens = list(batch)
+        self.batches += 1
+        self.tokens_sent += len(tokens)
+        try:
+            status, data = await self._call('auth', 'POST', f"{self.auth_url}/validate/batch",
+                                            json={'tokens': tokens})
+            if status != 200:
+                raise ValueError(f"Validation groupée refusée ({status}).")
+            results = data['results']
+            if len(results) != len(tokens):
+                raise ValueError("Réponse de validation groupée incomplète.")
+        except VALIDATION_ERRORS as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for token, result in zip(tokens, results):
+            if not batch[token].done():
+                batch[token].set_result(result)
+
+    # --- Relais en streaming ---
+
+    async def proxy(self, request, upstream, url, unavailable_message, user=None):
+        """Relaie la requête vers `url` et recopie la réponse morceau par morceau."""
+        headers = filter_headers(request.headers.items(),
+                                 drop=('host', 'authorization', AUTHENTICATED_USER_HEADER,
+                                       tracing.REQUEST_ID_HEADER, deadline.DEADLINE_HEADER))
+        if user is not None:
+            # Utilisateur validé + token d'origine (vérifiable par le Orders Service, ORDERS_VERIFY_TOKENS)
+            headers.append((AUTHENTICATED_USER_HEADER, user))
+            headers.append(('Authorization', request.headers['Authorization']))
+        headers.extend(deadline.outgoing_headers(tracing.outgoing_headers()).items())
+
+        data = request.content if request.body_exists else None
+        with self.counters[upstream].track(request.method) as call:
+            try:
+                upstream_response = await self._open(upstream, request.method, url, call,
+                                                     headers=headers, data=data)
+            except UPSTREAM_ERRORS as e:
+                self.counters[upstream].errors += 1
+                return unavailable_response(unavailable_message, e)
+
+            # Une erreur après l'envoi des en-têtes ne peut plus devenir un 503 : la connexion est coupée
+            async with upstream_response:
+                response = web.StreamResponse(status=upstream_response.status,
+                                              headers=filter_headers(upstream_response.headers.items()))
+                # Envoyés avant le corps : Server-Timing couvre le Gateway jusqu'aux en-têtes de l'upstream
+                set_trace_headers(response, [(f"upstream.{upstream}", time.perf_counter() - call['started'])])
+                await response.prepare(request)
+                async for chunk in upstream_response.content.iter_chunked(CHUNK_SIZE):
+                    await response.write(chunk)
+                await response.write_eof()
+                return response
+
+    # --- Limitation de débit ---
+
+    async def throttled_response(self, request, user):
+        """Réponse 429 si l'utilisateur ou l'adresse du client a épuisé son seau, sinon None."""
+        if self.rate_limiter is None:
+            return None
+        ip = client_ip(request.remote, request.headers.get('X-Forwarded-For'), self.trusted_proxies)
+        if isinstance(self.rate_limiter.backend, TokenBuckets):
+            allowed, retry_after, scope = self.rate_limiter.check(user=user, ip=ip)
+        else:
+            # Seaux partagés : aller-retour sur la socket du superviseur, hors de la boucle
+            allowed, retry_after, scope = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.rate_limiter.check(user=user, ip=ip))
+        if allowed:
+            return None
+        return web.json_response({"message": "Trop de requêtes, réessayez plus tard.", "scope": scope},
+                                 status=429, headers={'Retry-After': str(retry_after)})
+
+    # --- Routes ---
+
+    async def handle_submit_order(self, request):
+        user, error = await self.validate_and_get_user(request)
+        if error:
+            return web.json_response({"message": f"Accès refusé. {error}"}, status=401)
+        throttled = await self.throttled_response(request, user)
+        if throttled:
+            return throttled
+        # Le corps n'est pas relu : l'utilisateur validé part dans l'en-tête X-Authenticated-User
+        return await self.proxy(request, 'orders', f"{self.orders_url}/orders",
+                                "Orders Service indisponible.", user=user)
+
+    async def handle_submit_orders_batch(self, request):
+        user, error = await self.validate_and_get_user(request)
+        if error:
+            return web.json_response({"message": f"Accès refusé. {error}"}, status=401)
+        throttled = await self.throttled_response(request, user)
+        if throttled:
+            return throttled
+        return await self.proxy(request, 'orders', f"{self.orders_url}/orders/batch",
+                                "Orders Service indisponible.", user=user)
+
+    async def handle_order_history(self, request):
+        user = request.match_info['user']
+        token_user, error = await self.validate_and_get_user(request)
+        if error:
+            return web.json_response({"message": f"Accès refusé. {error}"}, status=401)
+        if token_user != user:
+            return web.json_response({"message": "Accès refusé à l'historique d'un autre utilisateur."},
+                                     status=403)
+        throttled = await self.throttled_response(request, token_user)
+        if throttled:
+            return throttled
+        url = f"{self.orders_url}/orders/{quote(user, safe='')}/history"
+        if request.query_string:
+            url += '?' + request.query_string
+        return await self.proxy(request, 'orders', url, "Orders Service indisponible.", user=user)
+
+    async def handle_order_status(self, request):
+        user, error = await self.validate_and_get_user(request)
+        if error:
+            return web.json_response({"message": f"Accès refusé. {error}"}, status=401)
+        throttled = await self.throttled_response(request, user)
+        if throttled:
+            return throttled
+        url = f"{self.orders_url}/orders/{quote(request.match_info['order_id'], safe='')}/status"
+        if request.query_string:
+            url += '?' + request.query_string
+        return await self.proxy(request, 'orders_status', url, "Orders Service indisponible.", user=user)
+
+    async def handle_logout(self, request):
+        # Même tolérance que get_json(silent=True) or {} en mode synchrone
+        try:
+            data = await request.json() if request.body_exists else {}
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            cached = self.token_cache.revoke(auth_header.split(' ')[1])
+            if cached is not None and cached.user is not None:
+                self.token_cache.invalidate_user(cached.user)
+        try:
+            with self.counters['auth'].track('POST') as call:
+                headers = deadline.outgoing_headers(tracing.outgoing_headers())
+                async with await self._open('auth', 'POST', f"{self.auth_url}/logout", call, headers=headers,
+                                            json={'refresh_token': data.get('refresh_token')}) as response:
+                    body = await response.read()
+                    return web.Response(body=body, status=response.status, content_type='application/json')
+        except UPSTREAM_ERRORS as e:
+            return unavailable_response("Auth Service indisponible.", e)
+
+    async def gateway_stats(self, request):
+        return web.json_response({
+            "mode": "async",
+            "token_cache": self.token_cache.stats(),
+            "jwks": self.jwks_verifier.stats() if self.jwks_verifier else None,
+            "rate_limit": self.rate_limiter.stats() if self.rate_limiter else None,
+            "validation_batcher": {
+                "window_ms": self.batch_window * 1000,
+                "max_batch": self.batch_max,
+                "batches": self.batches,
+                "tokens_sent": self.tokens_sent,
+                "coalesced": self.coalesced,
+                "avg_batch_size": round(self.tokens_sent / self.batches, 2) if self.batches else 0.0,
+            } if self.batch_window > 0 else None,
+            "upstreams": {name: counters.stats(self.sessions[name].connector)
+                          for name, counters in self.counters.items()},
+        })
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Latence par route et requêtes en cours (mêmes séries que instrument_flask, service='gateway')."""
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'non_route'
+    status = 500
+    HTTP_IN_FLIGHT.inc(service='gateway')
+    started = time.perf_counter()
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        HTTP_IN_FLIGHT.dec(service='gateway')
+        HTTP_DURATION.observe(time.perf_counter() - started, service='gateway', method=request.method, route=route)
+        HTTP_REQUESTS.inc(service='gateway', method=request.method, route=route, status=status)
+
+
+def set_trace_headers(response, extra_spans=()):
+    trace = tracing.current_trace()
+    if trace is not None:
+        response.headers[tracing.REQUEST_ID_HEADER] = trace.request_id
+        response.headers[tracing.SERVER_TIMING_HEADER] = trace.server_timing(extra_spans)
+
+
+@web.middleware
+async def tracing_middleware(request, handler):
+    """X-Request-ID, Server-Timing et traces échantillonnées (comme tracing.instrument_flask)."""
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'non_route'
+    request_id = tracing.accept_request_id(request.headers.get(tracing.REQUEST_ID_HEADER))
+    trace, token = tracing.start_trace(request_id, 'gateway', request.method, route)
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        if not response.prepared:
+            set_trace_headers(response)
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        tracing.finish_trace(trace, status)
+        tracing.end_trace(token)
+
+
+def deadline_middleware_factory(request_timeout):
+    @web.middleware
+    async def deadline_middleware(request, handler):
+        """Délai de la requête (comme deadline.instrument_flask) ; AuthUnavailable -> 503 / 504."""
+        budget = deadline.parse_budget(request.headers.get(deadline.DEADLINE_HEADER), request_timeout)
+        token = deadline.start(budget)
+        try:
+            if budget is not None and budget <= 0:
+                return web.json_response({"message": "Délai de la requête dépassé.", "status": "error_timeout"},
+                                         status=504)
+            return await handler(request)
+        except AuthUnavailable as e:
+            # Pas un 401 : le token n'est pas en cause, le client ne doit pas se reconnecter
+            return unavailable_response("Auth Service indisponible.", e.error)
+        finally:
+            deadline.end(token)
+    return deadline_middleware
+
+
+async def metrics(request):
+    return web.Response(text=REGISTRY.render(), headers={'Content-Type': CONTENT_TYPE})
+
+
+def create_app(auth_url, orders_url, token_cache, batch_window=0.002, batch_max=100, request_timeout=None,
+               jwks_verifier=None, rate_limiter=None, trusted_proxies=(), adaptive_limit=False):
+    gateway = AsyncGateway(auth_url, orders_url, token_cache, batch_window, batch_max, request_timeout,
+                           jwks_verifier, rate_limiter, trusted_proxies, adaptive_limit)
+    REGISTRY.register_stats('gateway_token_cache', token_cache.stats)
+    REGISTRY.register_stats('upstream', lambda: {name: counters.stats(gateway.sessions[name].connector)
+                                                 for name, counters in gateway.counters.items()})
+    app = web.Application(middlewares=[metrics_middleware, tracing_middleware,
+                                       deadline_middleware_factory(request_timeout)])
+    app.on_startup.append(gateway.open_sessions)
+    app.on_cleanup.append(gateway.close_sessions)
+    app.router.add_post('/api/orders', gateway.handle_submit_order)
+    app.router.add_post('/api/orders/batch', gateway.handle_submit_orders_batch)
+    app.router.add_get('/api/orders/{user}', gateway.handle_order_history)
+    app.router.add_get('/api/orders/{order_id}/status', gateway.handle_order_status)
+    app.router.add_post('/api/auth/logout', gateway.handle_logout)
+    app.router.add_get('/gateway/stats', gateway.gateway_stats)
+    app.router.add_get('/metrics', metrics)
+    return app
+
+
+def run(port=5003, sock=None, shutdown_timeout=60.0, **config):
+    """Sert le Gateway sur `port`, ou sur des sockets déjà ouverts (`sock`, cf. supervisor.py)."""
+    if not config:
+        # Lancement direct (python gateway_async.py) : même configuration que gateway.py
+        import gateway
+        config = dict(auth_url=gateway.AUTH_SERVICE_URL, orders_url=gateway.ORDERS_SERVICE_URL,
+                      token_cache=gateway.token_cache, jwks_verifier=gateway.jwks_verifier,
+                      rate_limiter=gateway.rate_limiter, trusted_proxies=gateway.TRUSTED_PROXIES,
+                      adaptive_limit=gateway.ADAPTIVE_LIMIT,
+                      batch_window=gateway.VALIDATION_BATCH_WINDOW_MS / 1000,
+                      batch_max=gateway.VALIDATION_BATCH_MAX,
+                      request_timeout=gateway.REQUEST_TIMEOUT)
+    web.run_app(create_app(**config), port=None if sock is not None else port, sock=sock,
+                shutdown_timeout=shutdown_timeout)
+
+
+if __name__ == '__main__':
+    print("API Gateway (mode asynchrone) démarrée sur http://localhost:5003")
+    run(port=5003)
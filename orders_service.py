@@ -1,19 +1,65 @@
 # orders_service.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import json
+import base64
 import datetime
-import random
+import hashlib
+import hmac
+import re
 import os
+import sys
+import atexit
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from common.order_store import OrderStore, StoreLocked
+from common.order_export import FORMATS, export_chunks, resume_point
+from common.order_analytics import open_analytics
+from common.payments import PENDING, open_payments
+from common.group_commit import GroupCommitWriter, WriteQueueFull, WriteTimeout
+from common.http_headers import AUTHENTICATED_USER_HEADER
+from common.metrics import REGISTRY, instrument_flask, timed, timed_section
+from common.catalog import CatalogError, catalog_stats, get_catalog
+from common.jwt_keys import JWKSVerifier
+from common import deadline, tracing
 
 # --- 1. Initialisation de l'API ---
 orders_app = Flask(__name__)
+# Latence par route, requêtes en cours et sections chronométrées : GET /metrics
+instrument_flask(orders_app, 'orders')
+# X-Request-ID propagé, Server-Timing par saut, traces échantillonnées (TRACE_FILE)
+tracing.instrument_flask(orders_app, 'orders')
+# Délai transmis par le Gateway (X-Request-Deadline-Ms) : 504 s'il est déjà épuisé, attente d'écriture bornée
+deadline.instrument_flask(orders_app)
 
 # --- Configuration des fichiers de données ---
-ORDERS_FILE = 'orders.json'
-DEFAULT_ORDERS = {}
+ORDERS_FILE = 'orders.json'          # ancien format (importé une seule fois)
+ORDERS_LOG_FILE = 'orders.log'       # journal append-only (une commande par ligne)
+COMPACT_INTERVAL = float(os.environ.get('ORDERS_COMPACT_INTERVAL', 60))
+
+# --- Fenêtre de "group commit" (latence / débit des écritures) ---
+BATCH_MAX_SIZE = int(os.environ.get('ORDERS_BATCH_MAX_SIZE', 256))
+BATCH_MAX_DELAY_MS = float(os.environ.get('ORDERS_BATCH_MAX_DELAY_MS', 2))
+WRITE_QUEUE_SIZE = int(os.environ.get('ORDERS_WRITE_QUEUE_SIZE', 10000))
+WRITE_TIMEOUT = float(os.environ.get('ORDERS_WRITE_TIMEOUT', 10))   # secondes
+
+# --- Commandes groupées (POST /orders/batch) ---
+BATCH_MAX_ORDERS = int(os.environ.get('ORDERS_BATCH_MAX_ORDERS', 1000))
+
+# --- Statut d'une commande (GET /orders/<order_id>/status?wait=N) : attente maximale du long-poll ---
+STATUS_MAX_WAIT = float(os.environ.get('PAYMENT_STATUS_MAX_WAIT', 8))   # secondes
+STATUS_WAIT_MARGIN = 0.5   # secondes laissées pour répondre avant le délai de la requête
+
+# --- Pagination de l'historique ---
+HISTORY_DEFAULT_LIMIT = 20
+HISTORY_MAX_LIMIT = 100
+DATE_FILTER_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?$')
 
 # --- Fonctions de gestion des fichiers JSON (Base de données du service) ---
 
+@timed('orders.load_data')
 def load_data(filename):
     """Charge les données depuis un fichier JSON donné."""
     try:
@@ -24,18 +70,129 @@ def load_data(filename):
     except json.JSONDecodeError:
         return {}
 
-def save_data(data, filename):
-    """Sauvegarde les données dans un fichier JSON donné."""
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=4)
+def initialize_order_store():
+    """Ouvre le journal des commandes et y importe l'ancien orders.json s'il existe."""
+    store = OrderStore(ORDERS_LOG_FILE)
+    if os.path.exists(ORDERS_FILE):
+        imported = store.import_legacy(load_data(ORDERS_FILE))
+        # Renommé après import : l'import n'a lieu qu'une fois
+        os.replace(ORDERS_FILE, ORDERS_FILE + '.imported')
+        print(f"{imported} commande(s) importée(s) depuis {ORDERS_FILE} vers {ORDERS_LOG_FILE}.")
+    store.start_background_compaction(COMPACT_INTERVAL)
+    return store
+
+# Avec debug=True, Werkzeug relance le script dans un processus enfant (WERKZEUG_RUN_MAIN) :
+# le processus parent ne sert aucune requête et ne doit pas ouvrir le journal.
+RELOADER_PARENT = __name__ == '__main__' and 'WERKZEUG_RUN_MAIN' not in os.environ
+
+order_store = None
+order_writer = None
+order_analytics = None
+payment_processor = None
+if not RELOADER_PARENT:
+    order_store = initialize_order_store()
+    # Statistiques (utilisateur / article / jour) mises à jour à chaque lot écrit dans le journal
+    order_analytics = open_analytics(order_store)
+    order_analytics.start_background_snapshots()
+    # Un seul thread écrit dans le journal : les commandes en attente partent en un lot (un fsync)
+    order_writer = GroupCommitWriter(order_store, max_batch=BATCH_MAX_SIZE,
+                                     max_delay=BATCH_MAX_DELAY_MS / 1000, queue_size=WRITE_QUEUE_SIZE,
+                                     commit_timeout=WRITE_TIMEOUT)
+    # Paiements hors requête : commandes 'pending' du journal payées par un pool de threads
+    payment_processor = open_payments(order_store, order_writer)
+    payment_processor.start_background_checkpoints()
+    REGISTRY.register_stats('orders_store', order_store.stats)
+    REGISTRY.register_stats('orders_writer', order_writer.stats)
+    REGISTRY.register_stats('orders_catalog', catalog_stats)
+    REGISTRY.register_stats('orders_analytics', order_analytics.stats)
+    REGISTRY.register_stats('orders_payments', payment_processor.stats)
+
+@atexit.register
+def close_order_store():
+    # Les threads de paiement écrivent leurs résultats via l'écrivain : arrêtés avant lui
+    if payment_processor is not None:
+        payment_processor.close()
+    if order_writer is not None:
+        order_writer.close()
+    if order_analytics is not None:
+        order_analytics.close()
+    if order_store is not None:
+        order_store.close()
+
+
+# --- Vérification des tokens dans le service (ORDERS_VERIFY_TOKENS=1) ---
+# Le token relayé par le Gateway est vérifié avec les clés publiques de l'Auth Service (JWKS, EdDSA / RS256) :
+# l'utilisateur vient du token signé, pas seulement de l'en-tête posé par le Gateway.
+VERIFY_TOKENS = os.environ.get('ORDERS_VERIFY_TOKENS', '0') == '1'
+AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'http://localhost:5002').rstrip('/')
+token_verifier = JWKSVerifier(url=AUTH_SERVICE_URL + '/auth/.well-known/jwks.json') if VERIFY_TOKENS else None
+if token_verifier is not None:
+    REGISTRY.register_stats('orders_jwks', token_verifier.stats)
+
+def request_user(claimed=None):
+    """(utilisateur, None) ou (None, réponse d'erreur). Sans vérification des tokens, l'utilisateur
+    transmis par le Gateway fait foi sur celui du corps (`claimed`)."""
+    user = request.headers.get(AUTHENTICATED_USER_HEADER) or claimed
+    if token_verifier is None:
+        return user, None
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None, (jsonify({"message": "Token JWT manquant.", "status": "error"}), 401)
+    with timed_section('orders.verify_token'):
+        result = token_verifier.check(auth_header.split(' ', 1)[1])
+    if result is None:
+        # Token sans kid (HS256) ou clé introuvable : ce service ne peut pas trancher
+        return None, (jsonify({"message": "Token non vérifiable.", "status": "error_service"}), 503,
+                      {'Retry-After': '1'})
+    if result['status'] != 'valid':
+        return None, (jsonify({"message": result['message'], "status": "error"}), 401)
+    if user and user != result['user']:
+        return None, (jsonify({"message": "Utilisateur différent de celui du token.", "status": "error"}), 403)
+    return result['user'], None
+
+# --- Accès d'exploitation (export de toutes les commandes) ---
+# Jeton partagé avec les outils d'exploitation, présenté dans X-Internal-Token ; non défini : accès refusé.
+INTERNAL_TOKEN = os.environ.get('ORDERS_INTERNAL_TOKEN', '')
+INTERNAL_TOKEN_HEADER = 'X-Internal-Token'
+
+def internal_caller():
+    """Vrai si la requête porte le jeton d'exploitation (ORDERS_INTERNAL_TOKEN)."""
+    presented = request.headers.get(INTERNAL_TOKEN_HEADER, '')
+    return bool(INTERNAL_TOKEN) and hmac.compare_digest(presented.encode('utf-8'), INTERNAL_TOKEN.encode('utf-8'))
+
+
+# --- Identifiants de commande (uniques même pour des requêtes simultanées) ---
+_order_id_lock = threading.Lock()
+_last_order_id = 0
+
+def new_order_id():
+    global _last_order_id
+    with _order_id_lock:
+        candidate = time.time_ns() // 1000  # microsecondes, comme l'ancien timestamp sans le point
+        _last_order_id = max(candidate, _last_order_id + 1)
+        return str(_last_order_id)
 
-def initialize_orders_file():
-    """Crée le fichier orders.json s'il n'existe pas."""
-    if not os.path.exists(ORDERS_FILE):
-        print(f"Création initiale de {ORDERS_FILE} pour Orders Service...")
-        save_data(DEFAULT_ORDERS, ORDERS_FILE)
 
-initialize_orders_file()
+# --- Construction d'une commande (payée ensuite par common.payments) ---
+def price_cart(cart_items):
+    """(lignes chiffrées, total, version du catalogue) : les prix viennent du catalogue,
+    jamais du client. Lève CatalogError si le panier est vide ou mal formé."""
+    catalog = get_catalog()
+    lines, total_amount = catalog.price_cart(cart_items)
+    return lines, total_amount, catalog.version
+
+def make_order(lines, total_amount, catalog_version):
+    return {
+        "order_id": new_order_id(),
+        "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "total": total_amount,
+        "items": lines,
+        "catalog_version": catalog_version,
+        "status": PENDING
+    }
+
+def payments_saturated_response():
+    return jsonify({"message": "Trop de paiements en attente, réessayez.", "status": "error_service"}), 503, {'Retry-After': '1'}
 
 
 # --- ROUTE : API pour soumettre une commande (POST /orders) ---
@@ -44,51 +201,370 @@ initialize_orders_file()
 def create_order():
     # 1. Le Gateway nous a déjà passé les données et a validé le token
     data = request.get_json()
-    user = data.get('user')
+    # L'utilisateur authentifié transmis par le Gateway (ou celui du token vérifié) fait foi sur celui du corps
+    user, error = request_user(data.get('user'))
+    if error:
+        return error
     cart_items = data.get('items', [])
     
     if not user or not cart_items:
         # Erreur si les données envoyées par le Gateway sont incomplètes
         return jsonify({"message": "Données de commande manquantes.", "status": "error"}), 400
     
-    # 2. Logique de paiement et d'enregistrement (Remplacement de process_payment)
-    total_amount = round(sum(item['total_price'] for item in cart_items), 2)
+    # 2. Prix calculés à partir du catalogue (article_id + quantité)
+    try:
+        lines, total_amount, catalog_version = price_cart(cart_items)
+    except CatalogError as e:
+        return jsonify({"message": f"Panier invalide : {e}", "status": "error"}), 400
     
-    # Simuler un succès 4 fois sur 5
-    if random.random() < 0.8:
-        # PAIEMENT RÉUSSI (et Enregistrement)
+    # 3. Commande enregistrée 'pending' puis payée hors requête (common.payments) :
+    #    le client suit son statut via GET /orders/<order_id>/status
+    if not payment_processor.admit(1):
+        return payments_saturated_response()
+    try:
+        # Créer la nouvelle commande
+        new_order = make_order(lines, total_amount, catalog_version)
+
+        # Ajout en fin de journal via l'écrivain groupé : on attend que le lot soit durable
+        # (la commande est alors dans la file des paiements, même après un redémarrage)
+        with timed_section('orders.commit_wait'):
+            order_writer.submit([(user, new_order)], timeout=deadline.remaining())
+
+        return jsonify({
+            "message": "Commande enregistrée, paiement en cours.",
+            "status": PENDING,
+            "order_id": new_order["order_id"],
+            "total": total_amount,
+            "catalog_version": catalog_version
+        }), 202
+
+    except WriteQueueFull:
+        return jsonify({"message": "Service surchargé, réessayez.", "status": "error_service"}), 503, {'Retry-After': '1'}
+    except WriteTimeout as e:
+        if e.may_be_written:
+            # Ne pas inviter à réessayer : la commande a peut-être été enregistrée
+            return jsonify({"message": "Enregistrement non confirmé, vérifiez l'historique.",
+                            "status": "error_service", "order_id": new_order["order_id"]}), 504
+        return jsonify({"message": "Service surchargé, réessayez.", "status": "error_service"}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        print(f"Erreur d'enregistrement du journal: {e}")
+        return jsonify({"message": "Erreur d'enregistrement interne.", "status": "error"}), 500
+
+# --- ROUTE : Plusieurs paniers en une requête (POST /orders/batch) ---
+# Corps : {"orders": [{"items": [...]}, ...]}. Les paniers valides sont écrits ensemble, 'pending'
+# (un seul dépôt dans l'écrivain groupé, donc une seule écriture + fsync), puis payés hors requête.
+# Réponse : un résultat par panier, dans l'ordre d'envoi.
+@orders_app.route('/orders/batch', methods=['POST'])
+def create_orders_batch():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    user, error = request_user(data.get('user'))
+    if error:
+        return error
+    carts = data.get('orders')
+    if not user or not isinstance(carts, list) or not carts:
+        return jsonify({"message": "Données de commande manquantes.", "status": "error"}), 400
+    if len(carts) > BATCH_MAX_ORDERS:
+        return jsonify({"message": f"Au plus {BATCH_MAX_ORDERS} commandes par requête.",
+                        "status": "error"}), 413
+
+    results = []
+    accepted = []
+    for index, cart in enumerate(carts):
         try:
-            orders_data = load_data(ORDERS_FILE)
-            
-            if user not in orders_data:
-                 orders_data[user] = []
-            
-            # Créer la nouvelle commande
-            new_order = {
-                "order_id": str(datetime.datetime.now().timestamp()).replace('.', ''), 
-                "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "total": total_amount,
-                "items": cart_items 
-            }
-            
-            orders_data[user].append(new_order)
-            save_data(orders_data, ORDERS_FILE)
-            
-            return jsonify({
-                "message": "Commande enregistrée.",
-                "status": "ok",
-                "order_id": new_order["order_id"]
-            }, 201)
-            
+            lines, total_amount, catalog_version = price_cart(cart.get('items') if isinstance(cart, dict) else None)
+        except CatalogError as e:
+            results.append({"index": index, "status": "error", "message": f"Panier invalide : {e}"})
+            continue
+        new_order = make_order(lines, total_amount, catalog_version)
+        accepted.append((user, new_order))
+        results.append({"index": index, "status": PENDING, "order_id": new_order["order_id"],
+                        "total": total_amount})
+
+    if accepted:
+        if not payment_processor.admit(len(accepted)):
+            return payments_saturated_response()
+        try:
+            with timed_section('orders.commit_wait'):
+                order_writer.submit(accepted, timeout=deadline.remaining())
+        except WriteQueueFull:
+            return jsonify({"message": "Service surchargé, réessayez.", "status": "error_service"}), 503, {'Retry-After': '1'}
+        except WriteTimeout as e:
+            if e.may_be_written:
+                return jsonify({"message": "Enregistrement non confirmé, vérifiez l'historique.",
+                                "status": "error_service", "results": results}), 504
+            return jsonify({"message": "Service surchargé, réessayez.", "status": "error_service"}), 503, {'Retry-After': '1'}
         except Exception as e:
-            print(f"Erreur d'enregistrement JSON: {e}")
-            return jsonify({"message": "Erreur d'enregistrement interne.", "status": "error"}, 500)
-        
-    else:
-        # PAIEMENT ÉCHOUÉ (Simulé)
-        return jsonify({"message": "Paiement rejeté (simulé).", "status": "error"}, 200)
-
-if __name__ == '__main__':
+            print(f"Erreur d'enregistrement du journal: {e}")
+            return jsonify({"message": "Erreur d'enregistrement interne.", "status": "error"}), 500
+
+    return jsonify({
+        "message": f"{len(accepted)} commande(s) enregistrée(s) sur {len(carts)}, paiement en cours.",
+        "status": "ok",
+        "results": results
+    }), 200
+
+# --- ROUTE : Statut d'une commande (GET /orders/<order_id>/status) ---
+# Paramètre : wait (secondes, au plus PAYMENT_STATUS_MAX_WAIT) : tant que la commande est 'pending',
+# la réponse attend son paiement (long-poll) ; le client rappelle la route tant que le statut reste 'pending'.
+@orders_app.route('/orders/<order_id>/status', methods=['GET'])
+def order_payment_status(order_id):
+    user, error = request_user()
+    if error:
+        return error
+    if not user:
+        return jsonify({"message": "Utilisateur manquant.", "status": "error"}), 400
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({"message": "Paramètre wait invalide.", "status": "error"}), 400
+    wait = max(0.0, min(wait, STATUS_MAX_WAIT))
+    left = deadline.remaining()
+    if left is not None:
+        wait = min(wait, max(0.0, left - STATUS_WAIT_MARGIN))
+
+    with timed_section('orders.status_wait'):
+        order = payment_processor.wait_for_status(user, order_id, wait)
+    if order is None:
+        return jsonify({"message": "Commande introuvable.", "status": "error"}), 404
+    payment = order.get('payment') or {}
+    return jsonify({
+        "order_id": order_id,
+        # Commandes antérieures aux paiements asynchrones : enregistrées une fois payées
+        "status": order.get('status', 'paid'),
+        "message": payment.get('message'),
+        "attempts": payment.get('attempts'),
+        "date": order.get('date'),
+        "total": order.get('total'),
+        "items": order.get('items', [])
+    }), 200, {'Cache-Control': 'no-store'}
+
+# --- Curseur de pagination : clé (date, order_id) de la dernière commande renvoyée ---
+def encode_cursor(key):
+    raw = json.dumps(list(key), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Retourne la clé (date, order_id), ou lève ValueError si le curseur est illisible."""
+    try:
+        date, order_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError):
+        raise ValueError("Curseur invalide.")
+    if not isinstance(date, str):
+        raise ValueError("Curseur invalide.")
+    return date, order_id
+
+
+# --- ROUTE : Historique paginé d'un utilisateur (GET /orders/<user>/history) ---
+# Paramètres : limit (20, max 100), cursor (next_cursor de la page précédente),
+# from / to (bornes incluses, 'AAAA-MM-JJ' ou 'AAAA-MM-JJ HH:MM:SS'). Plus récentes en premier.
+@orders_app.route('/orders/<user>/history', methods=['GET'])
+def order_history(user):
+    token_user, error = request_user(user)
+    if error:
+        return error
+    if token_user != user:
+        return jsonify({"message": "Accès refusé à l'historique d'un autre utilisateur.", "status": "error"}), 403
+    try:
+        limit = int(request.args.get('limit', HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"message": "Paramètre limit invalide.", "status": "error"}), 400
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    for value in (date_from, date_to):
+        if value is not None and not DATE_FILTER_PATTERN.match(value):
+            return jsonify({"message": "Date invalide (AAAA-MM-JJ [HH:MM:SS]).", "status": "error"}), 400
+
+    cursor = request.args.get('cursor')
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"message": str(e), "status": "error"}), 400
+
+    # ETag = dernière écriture de l'utilisateur + paramètres de la page :
+    # une page inchangée est confirmée (304) sans relire ni sérialiser les commandes
+    version = order_store.user_version(user)
+    page_key = f"{user}\n{version}\n{limit}\n{cursor}\n{date_from}\n{date_to}"
+    etag = hashlib.sha1(page_key.encode('utf-8')).hexdigest()[:20]
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+    if request.if_none_match.contains(etag):
+        return '', 304, headers
+
+    with timed_section('orders.history'):
+        orders, next_key = order_store.history(user, limit, before=before, date_from=date_from, date_to=date_to)
+    return jsonify({
+        "user": user,
+        "orders": orders,
+        "next_cursor": encode_cursor(next_key) if next_key else None
+    }), 200, headers
+
+# --- ROUTE : Export en flux (GET /orders/export) ---
+# Paramètres : format (ndjson | csv), user, from / to (comme l'historique), after_seq / until_seq.
+# Commandes par seq croissante, lues ligne à ligne dans le journal : mémoire constante.
+# Sans until_seq, la plage s'arrête à la dernière commande écrite (en-tête X-Export-Until-Seq) ;
+# pour reprendre un export interrompu : after_seq = dernière seq reçue, même until_seq.
+# Un utilisateur authentifié n'exporte que ses commandes ; toutes les commandes (ou celles d'un
+# autre utilisateur) demandent le jeton d'exploitation.
+EXPORT_UNTIL_HEADER = 'X-Export-Until-Seq'
+
+def parse_export_args(args):
+    """(format, user, from, to, after_seq, until_seq, en-tête CSV) ; lève ValueError si un paramètre est invalide."""
+    fmt = args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu ({', '.join(FORMATS)}).")
+    date_from = args.get('from')
+    date_to = args.get('to')
+    for value in (date_from, date_to):
+        if value is not None and not DATE_FILTER_PATTERN.match(value):
+            raise ValueError("Date invalide (AAAA-MM-JJ [HH:MM:SS]).")
+    try:
+        after_seq = int(args.get('after_seq', 0))
+        until_seq = int(args['until_seq']) if args.get('until_seq') else None
+    except ValueError:
+        raise ValueError("Paramètre after_seq ou until_seq invalide.")
+    return fmt, args.get('user') or None, date_from, date_to, after_seq, until_seq, args.get('header') != '0'
+
+@orders_app.route('/orders/export', methods=['GET'])
+def export_orders():
+    try:
+        fmt, user, date_from, date_to, after_seq, until_seq, header = parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e), "status": "error"}), 400
+    if not internal_caller():
+        token_user, error = request_user()
+        if error:
+            return error
+        if not token_user:
+            return jsonify({"message": "Utilisateur ou jeton d'exploitation manquant.", "status": "error"}), 401
+        if user and user != token_user:
+            return jsonify({"message": "Accès refusé aux commandes d'un autre utilisateur.", "status": "error"}), 403
+        user = token_user
+    if until_seq is None:
+        until_seq = order_store.stats()['last_seq']
+    chunks = export_chunks(order_store.scan(after_seq, until_seq, user=user), fmt,
+                           date_from=date_from, date_to=date_to, header=header)
+    return Response(chunks, mimetype=FORMATS[fmt], headers={
+        EXPORT_UNTIL_HEADER: str(until_seq),
+        'Content-Disposition': f'attachment; filename="orders-{after_seq}-{until_seq}.{fmt}"',
+        'Cache-Control': 'no-store',
+    })
+
+# --- ROUTE : Statistiques de l'utilisateur (GET /orders/stats) ---
+# Compteurs de l'utilisateur authentifié (user=, facultatif, doit être le sien). Montants en centimes.
+@orders_app.route('/orders/stats', methods=['GET'])
+def order_stats():
+    user, error = request_user()
+    if error:
+        return error
+    if not user:
+        return jsonify({"message": "Utilisateur manquant.", "status": "error"}), 401
+    claimed = request.args.get('user')
+    if claimed is not None and claimed != user:
+        return jsonify({"message": "Accès refusé aux statistiques d'un autre utilisateur.", "status": "error"}), 403
+    return jsonify({"user": user, **order_analytics.user_stats(user)}), 200, {'Cache-Control': 'private, no-store'}
+
+# --- ROUTE : Statistiques globales des commandes (GET /internal/stats/orders, exploitation) ---
+# Sans paramètre : totaux, détail par article et par jour. Avec article= ou day= ('AAAA-MM-JJ') :
+# les compteurs de cette clé. Montants en centimes ; aucune commande n'est relue.
+@orders_app.route('/internal/stats/orders', methods=['GET'])
+def internal_order_stats():
+    for name, lookup in (('article', order_analytics.article_stats), ('day', order_analytics.day_stats)):
+        key = request.args.get(name)
+        if key is not None:
+            return jsonify({name: key, **lookup(key)}), 200
+
+    summary = order_analytics.summary()
+    # ETag = séquence du journal couverte par les agrégats
+    headers = {'ETag': f'"{summary["seq"]}"', 'Cache-Control': 'private, no-cache'}
+    if request.if_none_match.contains(str(summary["seq"])):
+        return '', 304, headers
+    return jsonify(summary), 200, headers
+
+# --- ROUTE : Statistiques internes (journal et écritures groupées) ---
+@orders_app.route('/internal/stats', methods=['GET'])
+def internal_stats():
+    return jsonify({
+        "store": order_store.stats(),
+        "writer": order_writer.stats(),
+        "payments": payment_processor.stats()
+    }), 200
+
+# --- Export en ligne de commande ---
+# python orders_service.py export [--format csv] [--user u] [--from ...] [--to ...] [--output fichier [--resume]]
+# Par défaut via GET /orders/export du service démarré (ORDERS_SERVICE_URL) ; --log lit le journal
+# directement (service arrêté : il faut son verrou). --resume reprend un fichier interrompu.
+def export_main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='orders_service.py export', description="Export des commandes (NDJSON ou CSV).")
+    parser.add_argument('--format', choices=list(FORMATS), default='ndjson')
+    parser.add_argument('--user')
+    parser.add_argument('--from', dest='date_from', help="AAAA-MM-JJ [HH:MM:SS], inclus")
+    parser.add_argument('--to', dest='date_to', help="AAAA-MM-JJ [HH:MM:SS], inclus")
+    parser.add_argument('--after-seq', type=int, default=0)
+    parser.add_argument('--until-seq', type=int)
+    parser.add_argument('--output', help="fichier de sortie (sortie standard par défaut)")
+    parser.add_argument('--resume', action='store_true', help="reprend après la dernière commande complète de --output")
+    parser.add_argument('--url', default=os.environ.get('ORDERS_SERVICE_URL', 'http://localhost:5001'))
+    parser.add_argument('--token', default=INTERNAL_TOKEN, help="jeton d'exploitation (ORDERS_INTERNAL_TOKEN)")
+    parser.add_argument('--log', help=f"journal à lire directement (ex. {ORDERS_LOG_FILE}), service arrêté")
+    args = parser.parse_args(argv)
+    if args.resume and not args.output:
+        parser.error("--resume nécessite --output")
+
+    after_seq = args.after_seq
+    appending = False
+    if args.resume:
+        after_seq = max(after_seq, resume_point(args.output, args.format))
+        appending = os.path.exists(args.output) and os.path.getsize(args.output) > 0
+    params = {'format': args.format, 'after_seq': after_seq, 'header': '0' if appending else '1'}
+    for name, value in (('user', args.user), ('from', args.date_from), ('to', args.date_to), ('until_seq', args.until_seq)):
+        if value is not None:
+            params[name] = value
+    try:
+        parse_export_args({key: str(value) for key, value in params.items()})
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.output, 'ab' if appending else 'wb') if args.output else sys.stdout.buffer
+    try:
+        if args.log:
+            try:
+                store = OrderStore(args.log)
+            except StoreLocked as e:
+                sys.exit(f"{e} Exporter via le service (--url).")
+            try:
+                until_seq = args.until_seq if args.until_seq is not None else store.stats()['last_seq']
+                for chunk in export_chunks(store.scan(after_seq, until_seq, user=args.user), args.format,
+                                           date_from=args.date_from, date_to=args.date_to, header=not appending):
+                    out.write(chunk)
+            finally:
+                store.close()
+        else:
+            url = args.url.rstrip('/') + '/orders/export?' + urllib.parse.urlencode(params)
+            headers = {INTERNAL_TOKEN_HEADER: args.token} if args.token else {}
+            try:
+                response = urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+            except urllib.error.HTTPError as e:
+                sys.exit(f"Export refusé par le service ({e.code}) : {e.read().decode('utf-8', 'replace')}")
+            with response:
+                until_seq = response.headers.get(EXPORT_UNTIL_HEADER)
+                while True:
+                    chunk = response.read(64 * 1024)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"Export terminé (séquences {after_seq + 1} à {until_seq}).", file=sys.stderr)
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ['export']:
+    export_main(sys.argv[2:])
+elif __name__ == '__main__':
     # Le Orders Service s'exécute sur le port 5001
     print("Orders Service démarré sur http://localhost:5001")
     orders_app.run(debug=True, port=5001)
\ No newline at end of file
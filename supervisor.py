@@ -0,0 +1,416 @@
+'''Superviseur des services (remplace les terminaux xterm de run_all.py).
+- N processus par service (supervisor.json) ; le superviseur ouvre le port d'écoute une seule fois
+  et le transmet aux workers, qui acceptent les connexions sur le même socket,
+- chaque worker a aussi un port de contrôle privé (127.0.0.1, port libre) : le superviseur y vérifie
+  régulièrement `health_path` ; un worker arrêté ou qui ne répond plus est remplacé,
+- SIGHUP : redémarrage progressif (un worker à la fois : le nouveau doit répondre avant l'arrêt de l'ancien),
+- SIGTERM / SIGINT : arrêt propre ; chaque worker cesse d'accepter et termine ses requêtes en cours
+  (au plus drain_timeout secondes).
+Les services marqués `shared_rate_limit` (le Gateway) partagent leurs seaux de limitation de débit :
+le superviseur les tient sur une socket Unix (RATE_LIMIT_SOCKET, cf. common/rate_limiter.py).
+La même socket relaie les déconnexions (tokens révoqués) entre les workers du Gateway
+(cf. common/revocations.py).
+Le Orders Service reste à un seul worker (`single_writer` : verrou exclusif sur orders.log) ;
+il est arrêté avant d'être relancé lors d'un redémarrage progressif.
+
+Usage : python supervisor.py [--config supervisor.json]'''
+
+# supervisor.py
+import argparse
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.environ.get('SUPERVISOR_CONFIG', os.path.join(ROOT_DIR, 'supervisor.json'))
+
+DEFAULTS = {
+    "host": "127.0.0.1",
+    "backlog": 1024,
+    "health_path": "/metrics",
+    "health_interval": 2.0,     # secondes entre deux vérifications
+    "health_timeout": 1.0,
+    "health_failures": 3,       # échecs consécutifs avant remplacement
+    "start_timeout": 30.0,      # délai pour qu'un nouveau worker réponde
+    "drain_timeout": 15.0,      # requêtes en cours terminées avant arrêt forcé
+    "restart_delay": 1.0,       # doublé à chaque arrêt prématuré, au plus max_restart_delay
+    "max_restart_delay": 30.0,
+    "min_uptime": 10.0,         # un worker arrêté avant ce délai compte comme prématuré
+}
+
+# Adresse d'un service transmise aux autres (mêmes variables que benchmarks.harness)
+URL_ENV = {'auth': 'AUTH_SERVICE_URL', 'orders': 'ORDERS_SERVICE_URL', 'gateway': 'GATEWAY_URL'}
+
+
+class ConfigError(Exception):
+    pass
+
+
+def load_config(path=None):
+    """Configuration complétée par DEFAULTS ; `single_writer` ramène les workers à 1."""
+    path = path or CONFIG_FILE
+    try:
+        with open(path, encoding='utf-8') as f:
+            raw = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Configuration illisible ({path}) : {e}") from None
+    config = dict(DEFAULTS, **{key: value for key, value in raw.items() if key != 'services'})
+    services = raw.get('services')
+    if not isinstance(services, dict) or not services:
+        raise ConfigError("Aucun service dans la configuration.")
+    config['services'] = {}
+    for name, service in services.items():
+        try:
+            service = dict(service, port=int(service['port']), workers=int(service.get('workers', 1)))
+            service['module'], service['app'] = str(service['module']), str(service['app'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ConfigError(f"Service {name} mal décrit : {e!r}") from None
+        if service['workers'] < 1:
+            raise ConfigError(f"Service {name} : au moins un worker.")
+        if service.get('single_writer') and service['workers'] > 1:
+            print(f"[superviseur] {name} : un seul worker possible (écrivain unique), {service['workers']} demandés.")
+            service['workers'] = 1
+        service.setdefault('health_path', config['health_path'])
+        service.setdefault('env', {})
+        config['services'][name] = service
+    return config
+
+
+def listen_socket(host, port, backlog):
+    """Socket d'écoute partagé par les workers (non bloquant : un seul worker obtient chaque connexion,
+    les autres retournent attendre au lieu de rester bloqués dans accept())."""
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Worker:
+    def __init__(self, service, process, health_sock):
+        self.service = service
+        self.process = process
+        self.health_sock = health_sock
+        self.health_port = health_sock.getsockname()[1]
+        self.started_at = time.monotonic()
+        self.failures = 0
+        self.stopped_at = None
+        self.restart_at = None
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def healthy(self, path, timeout):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{self.health_port}{path}", timeout=timeout) as response:
+                return response.status < 500
+        except (OSError, urllib.error.URLError):
+            return False
+
+    def terminate(self):
+        if self.alive():
+            self.process.send_signal(signal.SIGTERM)
+
+    def wait(self, timeout):
+        """Attend la fin du worker ; arrêt forcé après `timeout` secondes."""
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f"[superviseur] {self.service} pid={self.pid} : arrêt forcé (drain trop long).")
+            self.process.kill()
+            self.process.wait()
+        self.health_sock.close()
+
+
+class ServiceGroup:
+    """Les workers d'un service et leur socket d'écoute commun."""
+
+    def __init__(self, name, config, supervisor):
+        self.name = name
+        self.config = config
+        self.supervisor = supervisor
+        self.sock = listen_socket(supervisor.config['host'], config['port'], supervisor.config['backlog'])
+        self.workers = []
+        self.restart_delay = supervisor.config['restart_delay']
+
+    def spawn(self):
+        settings = self.supervisor.config
+        health_sock = listen_socket('127.0.0.1', 0, 64)
+        command = [sys.executable, os.path.join(ROOT_DIR, 'supervisor.py'), '--worker',
+                   self.config['module'], self.config['app'],
+                   '--host', settings['host'], '--listen-fd', str(self.sock.fileno()),
+                   '--health-fd', str(health_sock.fileno()), '--drain-timeout', str(settings['drain_timeout'])]
+        env = dict(self.supervisor.environment(), SERVICE_WORKERS=str(self.config['workers']))
+        env.update({key: str(value) for key, value in self.config['env'].items()})
+        process = subprocess.Popen(command, env=env, pass_fds=(self.sock.fileno(), health_sock.fileno()))
+        worker = Worker(self.name, process, health_sock)
+        print(f"[superviseur] {self.name} : worker pid={worker.pid} démarré (contrôle :{worker.health_port}).")
+        return worker
+
+    def wait_ready(self, worker):
+        settings = self.supervisor.config
+        deadline = time.monotonic() + settings['start_timeout']
+        while time.monotonic() < deadline:
+            if not worker.alive():
+                return False
+            if worker.healthy(self.config['health_path'], settings['health_timeout']):
+                return True
+            time.sleep(0.1)
+        return False
+
+    def stop(self, worker):
+        worker.terminate()
+        worker.wait(self.supervisor.config['drain_timeout'])
+
+    def start(self):
+        for _ in range(self.config['workers']):
+            worker = self.spawn()
+            self.workers.append(worker)
+            if not self.wait_ready(worker):
+                raise RuntimeError(f"{self.name} : le worker pid={worker.pid} ne répond pas.")
+
+    def check(self):
+        """Remplace les workers arrêtés ou qui ne répondent plus (avec délai croissant si cela se répète)."""
+        settings = self.supervisor.config
+        for index, worker in enumerate(self.workers):
+            if worker.stopped_at is None:
+                if worker.alive():
+                    if worker.healthy(self.config['health_path'], settings['health_timeout']):
+                        worker.failures = 0
+                        continue
+                    worker.failures += 1
+                    if worker.failures < settings['health_failures']:
+                        continue
+                    print(f"[superviseur] {self.name} pid={worker.pid} : ne répond plus, remplacement.")
+                    self.stop(worker)
+                else:
+                    print(f"[superviseur] {self.name} pid={worker.pid} : arrêté (code {worker.process.returncode}).")
+                    worker.health_sock.close()
+                worker.stopped_at = time.monotonic()
+                if worker.stopped_at - worker.started_at < settings['min_uptime']:
+                    # Arrêts répétés juste après le démarrage : on espace les relances
+                    worker.restart_at = worker.stopped_at + self.restart_delay
+                    self.restart_delay = min(self.restart_delay * 2, settings['max_restart_delay'])
+                else:
+                    worker.restart_at = worker.stopped_at
+                    self.restart_delay = settings['restart_delay']
+            if time.monotonic() >= worker.restart_at:
+                self.workers[index] = self.spawn()
+
+    def rolling_restart(self):
+        """Remplace les workers un par un ; s'arrête au premier nouveau worker qui ne répond pas."""
+        for index, old in enumerate(list(self.workers)):
+            if self.config.get('single_writer'):
+                self.stop(old)
+            new = self.spawn()
+            if not self.wait_ready(new):
+                print(f"[superviseur] {self.name} : le nouveau worker pid={new.pid} ne répond pas, "
+                      f"redémarrage interrompu.")
+                self.stop(new)
+                if self.config.get('single_writer'):
+                    self.workers[index] = self.spawn()
+                return False
+            if not self.config.get('single_writer'):
+                self.stop(old)
+            self.workers[index] = new
+        return True
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.wait(self.supervisor.config['drain_timeout'])
+        self.workers = []
+        self.sock.close()
+
+
+class Supervisor:
+    def __init__(self, config):
+        self.config = config
+        self.groups = {}
+        self._stopping = threading.Event()
+        self._reload = threading.Event()
+        self.rate_limit_server = None
+
+    def environment(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+        env['PYTHONUNBUFFERED'] = '1'
+        host = self.config['host']
+        for name, service in self.config['services'].items():
+            if name in URL_ENV:
+                env[URL_ENV[name]] = f"http://{host}:{service['port']}"
+        if self.rate_limit_server is not None:
+            env['RATE_LIMIT_SOCKET'] = self.rate_limit_server.path
+        return env
+
+    def start_rate_limit_server(self):
+        """Seaux de limitation de débit communs aux workers des services `shared_rate_limit`."""
+        if not any(service.get('shared_rate_limit') for service in self.config['services'].values()):
+            return
+        from common.rate_limiter import RateLimitServer
+        from common.revocations import RevocationLog
+        path = os.path.join(tempfile.mkdtemp(prefix='supervisor-'), 'rate_limit.sock')
+        # La même socket relaie les déconnexions entre les workers du Gateway
+        self.rate_limit_server = RateLimitServer(path, revocations=RevocationLog()).start()
+        print(f"[superviseur] limitation de débit partagée sur {path}")
+
+    def start(self):
+        try:
+            self.start_rate_limit_server()
+            for name, service in self.config['services'].items():
+                group = self.groups[name] = ServiceGroup(name, service, self)
+                group.start()
+                print(f"[superviseur] {name} : {service['workers']} worker(s) sur "
+                      f"http://{self.config['host']}:{service['port']}")
+        except BaseException:
+            self.shutdown()
+            raise
+
+    def request_stop(self, *args):
+        self._stopping.set()
+
+    def request_reload(self, *args):
+        self._reload.set()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.request_reload)
+        self.start()
+        try:
+            while not self._stopping.wait(self.config['health_interval']):
+                if self._reload.is_set():
+                    self._reload.clear()
+                    print("[superviseur] redémarrage progressif...")
+                    for group in self.groups.values():
+                        group.rolling_restart()
+                    print("[superviseur] redémarrage progressif terminé.")
+                    continue
+                for group in self.groups.values():
+                    group.check()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        # Front d'abord, Auth en dernier : les services appelés restent disponibles pendant le drain
+        for group in reversed(list(self.groups.values())):
+            group.shutdown()
+        self.groups.clear()
+        if self.rate_limit_server is not None:
+            self.rate_limit_server.close()
+            os.rmdir(os.path.dirname(self.rate_limit_server.path))
+            self.rate_limit_server = None
+        print("[superviseur] arrêté.")
+
+
+# --- Côté worker ---
+
+class InFlight:
+    """Middleware WSGI : nombre de requêtes en cours (attendues avant l'arrêt du worker)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.count = 0
+        self._idle = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        with self._idle:
+            self.count += 1
+        try:
+            result = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return self._iterate(result)
+
+    def _iterate(self, result):
+        try:
+            yield from result
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            self._done()
+
+    def _done(self):
+        with self._idle:
+            self.count -= 1
+            self._idle.notify_all()
+
+    def wait_idle(self, timeout):
+        with self._idle:
+            return self._idle.wait_for(lambda: self.count == 0, timeout)
+
+
+def run_worker(module_name, attribute, host, listen_fd, health_fd, drain_timeout):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    listen_sock = socket.socket(fileno=listen_fd)
+    health_sock = socket.socket(fileno=health_fd)
+
+    if module_name == 'gateway_async':
+        # aiohttp gère lui-même SIGTERM et l'attente des requêtes en cours
+        import gateway_async
+        gateway_async.run(sock=[listen_sock, health_sock], shutdown_timeout=drain_timeout)
+        return
+
+    from werkzeug.serving import make_server
+    app = getattr(importlib.import_module(module_name), attribute)
+    in_flight = InFlight(app)
+    server = make_server(host, 0, in_flight, threaded=True, fd=listen_sock.fileno())
+    control = make_server('127.0.0.1', 0, app, threaded=True, fd=health_sock.fileno())
+    threading.Thread(target=control.serve_forever, daemon=True).start()
+
+    def drain(signum, frame):
+        # shutdown() attend la fin de serve_forever : appelé depuis un autre thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)
+    server.serve_forever()
+    # Plus de nouvelle connexion acceptée ; les requêtes en cours se terminent
+    server.server_close()
+    if not in_flight.wait_idle(drain_timeout):
+        print(f"[worker {os.getpid()}] {in_flight.count} requête(s) interrompue(s) à l'arrêt.")
+    control.shutdown()
+    # sys.exit : les handlers atexit (fsync du journal, pool bcrypt) s'exécutent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Superviseur multi-processus des services.")
+    parser.add_argument('--config', default=CONFIG_FILE, help="fichier de configuration (supervisor.json)")
+    parser.add_argument('--worker', nargs=2, metavar=('MODULE', 'APP'), help=argparse.SUPPRESS)
+    parser.add_argument('--host', default=DEFAULTS['host'], help=argparse.SUPPRESS)
+    parser.add_argument('--listen-fd', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--health-fd', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--drain-timeout', type=float, default=DEFAULTS['drain_timeout'], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.worker[0], args.worker[1], args.host, args.listen_fd, args.health_fd, args.drain_timeout)
+        sys.exit(0)
+    try:
+        Supervisor(load_config(args.config)).run()
+    except ConfigError as e:
+        sys.exit(str(e))
+
+
+# Garde indispensable : les processus bcrypt ('spawn') réimportent ce module
+if __name__ == '__main__':
+    main()
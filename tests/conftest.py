@@ -0,0 +1,71 @@
+# tests/conftest.py
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Les tests importent `common` comme les services (lancés depuis la racine du dépôt)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubServer(ThreadingHTTPServer):
+    """Upstream local : routes[chemin] = (statut, en-têtes, corps JSON, délai en secondes)."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.routes = {}
+        self.hits = []
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        with self.server._lock:
+            self.server.hits.append((self.command, self.path, dict(self.headers)))
+        status, headers, body, delay = self.server.routes.get(self.path.split('?')[0], (404, {}, {}, 0))
+        if delay:
+            time.sleep(delay)
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
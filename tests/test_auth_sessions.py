@@ -0,0 +1,97 @@
+# tests/test_auth_sessions.py
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('jwt')
+pytest.importorskip('bcrypt')
+
+from common.sqlite_pool import SQLitePool
+
+
+@pytest.fixture
+def auth(tmp_path, monkeypatch):
+    """auth_service sur une base neuve (première importation : fichiers du service dans tmp_path)."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('AUTH_BCRYPT_WORKERS', '1')
+    import auth_service
+    pool = SQLitePool(str(tmp_path / 'users.db'))
+    monkeypatch.setattr(auth_service, 'db_pool', pool)
+    auth_service.init_db()
+    yield auth_service
+    pool.close_all()
+
+
+def in_days(days):
+    return datetime.now(timezone.utc) + timedelta(days=days)
+
+
+def stored_rows(auth):
+    with auth.get_db_connection() as conn:
+        return [tuple(row) for row in conn.execute(
+            "SELECT username, token_hash, expires_at FROM refresh_tokens ORDER BY expires_at")]
+
+
+def test_only_the_token_hash_is_stored(auth):
+    auth.store_refresh_token('alice', 'jeton-secret', in_days(7))
+    (user, token_hash, _), = stored_rows(auth)
+    assert user == 'alice' and token_hash == hashlib.sha256(b'jeton-secret').hexdigest()
+
+    assert auth.is_refresh_token_active('alice', 'jeton-secret')
+    assert not auth.is_refresh_token_active('bob', 'jeton-secret')
+    assert not auth.is_refresh_token_active('alice', 'autre-jeton')
+    auth.revoke_refresh_token('jeton-secret')
+    assert not auth.is_refresh_token_active('alice', 'jeton-secret')
+
+
+def test_expired_sessions_are_inactive_and_purged(auth, monkeypatch):
+    auth.store_refresh_token('alice', 'expire', in_days(-1))
+    auth.store_refresh_token('alice', 'valide', in_days(1))
+    assert not auth.is_refresh_token_active('alice', 'expire')
+    monkeypatch.setattr(auth, 'PURGE_BATCH_SIZE', 1)
+    assert auth.purge_expired_refresh_tokens() == 1
+    assert [row[1] for row in stored_rows(auth)] == [auth.token_digest('valide')]
+
+
+def test_only_the_most_recent_sessions_are_kept(auth, monkeypatch):
+    monkeypatch.setattr(auth, 'MAX_SESSIONS_PER_USER', 3)
+    for day in range(1, 6):
+        auth.store_refresh_token('alice', f'jeton-{day}', in_days(day))
+    auth.store_refresh_token('bob', 'jeton-bob', in_days(1))
+
+    rows = stored_rows(auth)
+    assert sorted(row[1] for row in rows if row[0] == 'alice') == sorted(
+        auth.token_digest(f'jeton-{day}') for day in (3, 4, 5))
+    assert [row[1] for row in rows if row[0] == 'bob'] == [auth.token_digest('jeton-bob')]
+    assert not auth.is_refresh_token_active('alice', 'jeton-1')
+
+
+def test_legacy_plaintext_tokens_are_migrated(auth, tmp_path, monkeypatch):
+    pool = SQLitePool(str(tmp_path / 'legacy.db'))
+    monkeypatch.setattr(auth, 'db_pool', pool)
+    with auth.get_db_connection() as conn:
+        conn.execute('''CREATE TABLE refresh_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL,
+            token TEXT NOT NULL, expires_at TEXT NOT NULL)''')
+        conn.executemany("INSERT INTO refresh_tokens (username, token, expires_at) VALUES (?, ?, ?)", [
+            ('alice', 'ancien-valide', str(in_days(7))),
+            ('alice', 'ancien-expire', str(in_days(-1))),
+            ('bob', 'date-illisible', 'demain'),
+        ])
+        conn.commit()
+
+    auth.init_db()
+    assert [row[1] for row in stored_rows(auth)] == [auth.token_digest('ancien-valide')]
+    assert auth.is_refresh_token_active('alice', 'ancien-valide')
+    with auth.get_db_connection() as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert 'refresh_tokens_legacy' not in tables
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("SELECT token FROM refresh_tokens")
+    # Redémarrage : rien à migrer
+    auth.init_db()
+    assert len(stored_rows(auth)) == 1
+    pool.close_all()
@@ -0,0 +1,71 @@
+# tests/test_catalog.py
+import json
+import os
+
+import pytest
+
+from common.catalog import Catalog, CatalogError, CatalogLoader, load_catalog
+
+
+def write_catalog(path, version, cookies_cents=200):
+    path.write_text(json.dumps({"version": version, "products": [
+        {"id": "cookies", "name": "Cookies", "price_cents": cookies_cents},
+        {"id": "pates", "name": "Paquet de pâtes", "price_cents": 120},
+    ]}), encoding='utf-8')
+
+
+def test_shipped_catalog_loads():
+    catalog = load_catalog()
+    assert catalog.products
+    assert all(product.price_cents > 0 for product in catalog.products)
+
+
+def test_price_cart_ignores_client_prices(tmp_path):
+    write_catalog(tmp_path / 'catalog.json', 'v1')
+    catalog = load_catalog(str(tmp_path / 'catalog.json'))
+    lines, total = catalog.price_cart([
+        {'article_id': 'cookies', 'quantity': 3, 'total_price': 0.01},
+        {'article': 'Paquet de pâtes', 'quantity': 1},      # ancien format : nom de l'article
+    ])
+    assert total == 7.20
+    assert [(line['article_id'], line['unit_price'], line['total_price']) for line in lines] == [
+        ('cookies', 2.0, 6.0), ('pates', 1.2, 1.2)]
+
+
+@pytest.mark.parametrize('items', [
+    [], None, [{'article_id': 'inconnu', 'quantity': 1}], [{'article_id': 'cookies', 'quantity': 0}],
+    [{'article_id': 'cookies', 'quantity': '2'}], [{'article_id': 'cookies', 'quantity': True}], ['cookies'],
+])
+def test_price_cart_rejects_bad_carts(items):
+    catalog = Catalog('v1', [])
+    with pytest.raises(CatalogError):
+        catalog.price_cart(items)
+
+
+def test_table_is_read_only():
+    catalog = Catalog.from_dict({"version": 1, "products": [{"id": "a", "name": "A", "price_cents": 1}]})
+    with pytest.raises(TypeError):
+        catalog.by_id['b'] = None
+
+
+def test_loader_swaps_table_only_on_new_version(tmp_path):
+    path = tmp_path / 'catalog.json'
+    write_catalog(path, 'v1')
+    loader = CatalogLoader(str(path), check_interval=0)
+    first = loader.get()
+    assert loader.get() is first
+
+    write_catalog(path, 'v1', cookies_cents=999)
+    os.utime(path, ns=(1, 1))
+    assert loader.get() is first                      # même version : table inchangée
+
+    path.write_text('{ invalide', encoding='utf-8')
+    os.utime(path, ns=(2, 2))
+    assert loader.get() is first                      # fichier illisible : on garde l'ancienne table
+    assert loader.stats()['reload_errors'] == 1
+
+    write_catalog(path, 'v2', cookies_cents=250)
+    os.utime(path, ns=(3, 3))
+    second = loader.get()
+    assert second.version == 'v2' and second.by_id['cookies'].price_cents == 250
+    assert loader.stats()['reloads'] == 1
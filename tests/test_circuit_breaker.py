@@ -0,0 +1,101 @@
+# tests/test_circuit_breaker.py
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('pybreaker')
+
+from common.circuit_breaker import CircuitOpen, UpstreamBreaker, UpstreamFailure, UpstreamShed, check_response
+
+
+class Down(Exception):
+    pass
+
+
+def fail(breaker, error=Down):
+    with pytest.raises(error):
+        with breaker.guard():
+            raise error()
+
+
+def test_opens_after_fail_max_and_rejects_without_calling():
+    breaker = UpstreamBreaker('test-open', (Down,), fail_max=2, reset_timeout=30)
+    fail(breaker)
+    fail(breaker)           # l'échec qui ouvre le circuit remonte tel quel
+    assert breaker.state == 'open'
+
+    called = []
+    with pytest.raises(CircuitOpen) as info:
+        with breaker.guard():
+            called.append(1)
+    assert called == []
+    assert 1 <= info.value.retry_after <= 30
+    stats = breaker.stats()
+    assert (stats['opened'], stats['rejected']) == (1, 1)
+
+
+def test_other_exceptions_do_not_count():
+    breaker = UpstreamBreaker('test-exclude', (Down,), fail_max=1, reset_timeout=30)
+    fail(breaker, KeyError)
+    assert breaker.state == 'closed'
+
+
+def test_upstream_failure_counts():
+    breaker = UpstreamBreaker('test-5xx', (Down,), fail_max=1, reset_timeout=30)
+    with pytest.raises(UpstreamFailure):
+        with breaker.guard():
+            raise UpstreamFailure(object())
+    assert breaker.state == 'open'
+
+
+class Reply:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+
+def test_load_shedding_reply_does_not_count():
+    breaker = UpstreamBreaker('test-shed', (Down,), fail_max=1, reset_timeout=30)
+    for _ in range(3):
+        with pytest.raises(UpstreamShed):
+            with breaker.guard():
+                check_response(Reply({'Retry-After': '1'}), 503)
+    assert breaker.state == 'closed'
+    check_response(Reply(), 200)
+    with pytest.raises(UpstreamFailure):
+        with breaker.guard():
+            check_response(Reply(), 503)
+    assert breaker.state == 'open'
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = UpstreamBreaker('test-probe', (Down,), fail_max=1, reset_timeout=0.05)
+    fail(breaker)
+    time.sleep(0.06)
+
+    inside, release = threading.Event(), threading.Event()
+
+    def probe():
+        with breaker.guard():
+            inside.set()
+            release.wait(2)
+
+    thread = threading.Thread(target=probe)
+    thread.start()
+    assert inside.wait(2)
+    with pytest.raises(CircuitOpen):   # pendant l'essai, les autres appels échouent tout de suite
+        with breaker.guard():
+            pass
+    release.set()
+    thread.join()
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens():
+    breaker = UpstreamBreaker('test-reopen', (Down,), fail_max=1, reset_timeout=0.05)
+    fail(breaker)
+    time.sleep(0.06)
+    fail(breaker)
+    assert breaker.state == 'open'
+    assert breaker.stats()['opened'] == 2
+
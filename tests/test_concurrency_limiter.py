@@ -0,0 +1,208 @@
+# tests/test_concurrency_limiter.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from common.concurrency_limiter import AdaptiveLimit, AsyncConcurrencyLimiter, ConcurrencyLimiter, Overloaded
+
+
+def feed(limit, latency, count, in_flight=None, start=0.0, dropped=False):
+    for i in range(count):
+        now = start + i * latency + latency
+        limit.update(now - latency, latency, in_flight or limit.value, dropped, now)
+    return start + count * latency
+
+
+def test_limit_grows_while_used_and_latency_is_stable():
+    limit = AdaptiveLimit(min_limit=1, max_limit=50, initial=4)
+    feed(limit, 0.010, 200)
+    assert limit.value >= 15
+    # Limite peu utilisée : pas de hausse
+    idle = AdaptiveLimit(min_limit=1, max_limit=50, initial=10)
+    feed(idle, 0.010, 200, in_flight=1)
+    assert idle.value == 10
+
+
+def test_limit_backs_off_once_per_round_trip():
+    limit = AdaptiveLimit(min_limit=2, max_limit=50, initial=20)
+    now = feed(limit, 0.010, 50)
+    before = limit.limit
+    # Dix appels lents partis en même temps : une seule baisse
+    for _ in range(10):
+        limit.update(now, 0.100, limit.value, False, now + 0.100)
+    assert limit.limit == pytest.approx(before * 0.9) and limit.decreases == 1
+    # Latence durablement haute : la limite descend jusqu'au minimum
+    for i in range(200):
+        started = now + 0.1 + i * 0.1
+        limit.update(started, 0.5, limit.value, True, started + 0.5)
+    assert limit.value == 2
+
+
+def test_sync_queue_full_and_timeout_are_shed():
+    limiter = ConcurrencyLimiter('orders', AdaptiveLimit(1, 1), queue_size=1, queue_timeout=0.05)
+    release = threading.Event()
+    entered = threading.Event()
+    outcome = {}
+
+    def holder():
+        with limiter.slot():
+            entered.set()
+            release.wait(2)
+
+    def waiter():
+        try:
+            with limiter.slot():
+                outcome['waiter'] = 'served'
+        except Overloaded as e:
+            outcome['waiter'] = e.reason
+
+    threading.Thread(target=holder).start()
+    entered.wait(1)
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    while limiter.waiting == 0:
+        time.sleep(0.001)
+    with pytest.raises(Overloaded) as error:
+        with limiter.slot():
+            pass
+    assert error.value.reason == 'queue_full' and error.value.retry_after == 1
+    thread.join()
+    assert outcome['waiter'] == 'queue_timeout'
+    release.set()
+    assert limiter.stats()['shed'] == {'queue_full': 1, 'queue_timeout': 1}
+
+
+def test_sync_waiter_gets_released_slot():
+    limiter = ConcurrencyLimiter('orders', AdaptiveLimit(1, 1), queue_size=5, queue_timeout=2)
+    order = []
+
+    def waiter():
+        with limiter.slot():
+            order.append('waiter')
+
+    with limiter.slot():
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        while limiter.waiting == 0:
+            time.sleep(0.001)
+        order.append('holder')
+    thread.join(2)
+    assert order == ['holder', 'waiter'] and limiter.in_flight == 0 and limiter.stats()['queued'] == 1
+
+
+def test_only_listed_failures_lower_the_limit():
+    limiter = ConcurrencyLimiter('orders', AdaptiveLimit(1, 10, initial=10), failures=(TimeoutError,))
+    limiter.limit.samples = 100
+    with pytest.raises(KeyError):
+        with limiter.slot():
+            raise KeyError('pas une panne')
+    assert limiter.limit.value == 10 and limiter.in_flight == 0
+    with pytest.raises(TimeoutError):
+        with limiter.slot():
+            raise TimeoutError()
+    assert limiter.limit.value == 9
+
+
+def test_async_limiter_hands_slots_over_in_order():
+    async def scenario():
+        limiter = AsyncConcurrencyLimiter('orders', AdaptiveLimit(2, 2), queue_size=2, queue_timeout=1)
+        served = []
+        gate = asyncio.Event()
+
+        async def call(name):
+            try:
+                async with limiter.slot():
+                    served.append(name)
+                    await gate.wait()
+            except Overloaded as e:
+                served.append(f"{name}:{e.reason}")
+
+        tasks = [asyncio.create_task(call(i)) for i in range(5)]
+        await asyncio.sleep(0.01)
+        assert served == [0, 1, '4:queue_full'] and limiter.waiting == 2
+        gate.set()
+        await asyncio.gather(*tasks)
+        assert served[3:] == [2, 3] and limiter.in_flight == 0
+
+        # Attente trop longue, puis annulation d'une requête en file : la place n'est pas perdue
+        limiter.queue_timeout = 0.02
+        gate.clear()
+        holders = [asyncio.create_task(call(i)) for i in (5, 6)]
+        await asyncio.sleep(0)
+        await call(7)
+        assert served[-1] == '7:queue_timeout'
+        cancelled = asyncio.create_task(call(8))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        gate.set()
+        await asyncio.gather(*holders, return_exceptions=True)
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert limiter.in_flight == 0 and limiter.waiting == 0
+
+    asyncio.run(scenario())
+
+
+def test_load_shedding_and_local_waits_do_not_lower_the_limit(stub_server):
+    pytest.importorskip('requests')
+    pytest.importorskip('pybreaker')
+    from common import deadline
+    from common.upstream import UpstreamClient
+
+    stub_server.routes = {'/shed': (503, {'Retry-After': '1'}, {}, 0), '/fail': (500, {}, {}, 0),
+                          '/slow': (200, {}, {}, 0.3)}
+    # Deux appels admis par la limite pour une seule connexion : le second attend le pool
+    client = UpstreamClient('orders', stub_server.url, pool_size=1, adaptive_limit=True, limit_min=2, limit_max=2)
+    limit = client.limiter.limit
+    limit.samples = 100
+    # Refus de charge de l'upstream (503 + Retry-After) : rendu à l'appelant, sans baisse
+    for _ in range(5):
+        assert client.get('/shed').status_code == 503
+    assert limit.decreases == 0
+
+    # Délai épuisé en attendant la seule connexion du pool : rien n'est envoyé, pas de baisse
+    busy = threading.Thread(target=client.get, args=('/slow',))
+    busy.start()
+    while client.stats()['in_use'] == 0:
+        time.sleep(0.001)
+    token = deadline.start(0.05)
+    try:
+        with pytest.raises(deadline.DeadlineExceeded):
+            client.get('/fail')
+    finally:
+        deadline.end(token)
+    busy.join()
+    assert limit.decreases == 0 and client.breaker.stats()['consecutive_failures'] == 0
+
+    # Une vraie réponse 5xx fait baisser la limite
+    assert client.get('/fail').status_code == 500
+    assert limit.decreases == 1
+    client.close()
+
+
+def test_async_load_shedding_does_not_lower_the_limit(stub_server):
+    pytest.importorskip('aiohttp')
+    pytest.importorskip('pybreaker')
+    from common.token_cache import TokenCache
+    from gateway_async import AsyncGateway
+
+    stub_server.routes = {'/shed': (503, {'Retry-After': '1'}, {}, 0), '/fail': (500, {}, {}, 0)}
+
+    async def scenario():
+        gateway = AsyncGateway(stub_server.url, stub_server.url, TokenCache(), adaptive_limit=True)
+        await gateway.open_sessions(None)
+        counters = gateway.counters['orders']
+        counters.limiter.limit.samples = 100
+        try:
+            for _ in range(5):
+                status, _ = await gateway._call('orders', 'GET', stub_server.url + '/shed')
+                assert status == 503
+            assert counters.limiter.limit.decreases == 0
+            assert counters.breaker.stats()['consecutive_failures'] == 0
+            status, _ = await gateway._call('orders', 'GET', stub_server.url + '/fail')
+            assert status == 500 and counters.limiter.limit.decreases == 1
+        finally:
+            await gateway.close_sessions(None)
+
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+# tests/test_deadline.py
+import pytest
+
+from common import deadline
+
+
+def test_deadline_bounds_timeouts_and_headers():
+    assert deadline.bound_timeout((2.0, 10.0)) == (2.0, 10.0)
+    token = deadline.start(deadline.parse_budget('500', 10.0))
+    try:
+        connect, read = deadline.bound_timeout((2.0, 10.0))
+        assert connect <= 0.5 and read <= 0.5
+        assert 0 < int(deadline.outgoing_headers()[deadline.DEADLINE_HEADER]) <= 500
+    finally:
+        deadline.end(token)
+    assert deadline.remaining() is None
+
+    token = deadline.start(deadline.parse_budget('0', 10.0))
+    try:
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.bound_timeout(5.0)
+    finally:
+        deadline.end(token)
+    assert deadline.parse_budget('abc', 3.0) == 3.0
+    assert deadline.parse_budget(None, None) is None
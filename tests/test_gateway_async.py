@@ -0,0 +1,106 @@
+# tests/test_gateway_async.py
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('aiohttp')
+pytest.importorskip('pybreaker')
+
+from aiohttp import test_utils
+
+from common.rate_limiter import RateLimiter, Rule, TokenBuckets
+from common.token_cache import TokenCache
+from gateway_async import create_app
+
+ALICE = {'Authorization': 'Bearer jeton-alice'}
+
+
+@pytest.fixture
+def upstreams(stub_server):
+    """Auth et Orders servis par le même stub : /validate accepte tout token pour alice."""
+    stub_server.routes = {
+        '/validate': (200, {}, {"user": "alice", "exp": time.time() + 600}, 0),
+        '/orders': (202, {}, {"status": "ok"}, 0),
+    }
+    return stub_server
+
+
+def run_gateway(stub_server, scenario, orders_url=None, **config):
+    async def main():
+        app = create_app(stub_server.url, orders_url or stub_server.url, TokenCache(), batch_window=0, **config)
+        async with test_utils.TestClient(test_utils.TestServer(app)) as client:
+            await scenario(client)
+
+    asyncio.run(main())
+
+
+def paths(stub_server):
+    return [path for _, path, _ in stub_server.hits]
+
+
+def test_missing_or_rejected_token_is_401(upstreams):
+    async def scenario(client):
+        response = await client.post('/api/orders', json={"items": []})
+        assert response.status == 401
+        upstreams.routes['/validate'] = (401, {}, {"message": "Token expiré."}, 0)
+        for _ in range(2):
+            response = await client.post('/api/orders', json={"items": []}, headers=ALICE)
+            assert response.status == 401 and "Token expiré." in (await response.json())['message']
+
+    run_gateway(upstreams, scenario)
+    # Rejet gardé en cache : l'Auth Service n'est appelé qu'une fois, le Orders Service jamais
+    assert paths(upstreams) == ['/validate']
+
+
+def test_history_of_another_user_is_403(upstreams):
+    async def scenario(client):
+        response = await client.get('/api/orders/bob', headers=ALICE)
+        assert response.status == 403
+
+    run_gateway(upstreams, scenario)
+    assert paths(upstreams) == ['/validate']
+
+
+def test_throttled_user_gets_429(upstreams):
+    limiter = RateLimiter([Rule('user', 0.01, 2)], TokenBuckets())
+
+    async def scenario(client):
+        statuses = []
+        for _ in range(3):
+            response = await client.post('/api/orders', json={"items": []}, headers=ALICE)
+            statuses.append(response.status)
+        assert statuses == [202, 202, 429]
+        assert int(response.headers['Retry-After']) >= 1
+        assert (await response.json())['scope'] == 'user'
+
+    run_gateway(upstreams, scenario, rate_limiter=limiter)
+    assert paths(upstreams).count('/orders') == 2
+
+
+def test_response_is_streamed_with_the_validated_user(upstreams):
+    # Corps de plusieurs blocs (CHUNK_SIZE = 64 Kio), relayé sans être décodé
+    orders = [{"order_id": str(i), "items": ["x" * 100]} for i in range(5000)]
+    upstreams.routes['/orders/alice/history'] = (200, {'ETag': '"v1"'}, {"orders": orders}, 0)
+
+    async def scenario(client):
+        # Un X-Authenticated-User envoyé par le client n'est jamais relayé
+        response = await client.get('/api/orders/alice?limit=5',
+                                    headers=dict(ALICE, **{'X-Authenticated-User': 'bob'}))
+        assert response.status == 200 and response.headers['ETag'] == '"v1"'
+        assert (await response.json())['orders'] == orders
+
+    run_gateway(upstreams, scenario)
+    method, path, headers = upstreams.hits[-1]
+    assert (method, path) == ('GET', '/orders/alice/history?limit=5')
+    assert headers['X-Authenticated-User'] == 'alice'
+    assert headers['Authorization'] == ALICE['Authorization']
+
+
+def test_unreachable_orders_service_is_503(upstreams):
+    async def scenario(client):
+        response = await client.post('/api/orders', json={"items": []}, headers=ALICE)
+        assert response.status == 503 and response.headers['Retry-After'] == '1'
+
+    # Orders Service sur un port fermé
+    run_gateway(upstreams, scenario, orders_url='http://127.0.0.1:9')
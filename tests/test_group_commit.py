@@ -0,0 +1,93 @@
+# tests/test_group_commit.py
+import threading
+
+import pytest
+
+from common.group_commit import GroupCommitWriter, WriteTimeout
+from common.order_store import OrderStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = OrderStore(str(tmp_path / 'orders.log'))
+    yield store
+    store.close()
+
+
+def test_concurrent_submits_are_all_durable(store):
+    writer = GroupCommitWriter(store, max_batch=64, max_delay=0.005)
+    results = []
+
+    def submit(i):
+        results.append(writer.submit([('alice', {"order_id": str(i)})])[0])
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    assert sorted(results) == list(range(1, 51))
+    assert len(store.get_user_orders('alice')) == 50
+    assert writer.stats()['orders_written'] == 50
+
+
+def test_invalid_entry_fails_its_batch_only(store):
+    writer = GroupCommitWriter(store, max_delay=0)
+    with pytest.raises(ValueError):
+        writer.submit([('alice', {"total": 1})])
+    assert writer.submit([('alice', {"order_id": "1"})]) == [1]
+    writer.close()
+
+
+def test_submit_after_close_is_refused(store):
+    writer = GroupCommitWriter(store)
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.submit([('alice', {"order_id": "1"})])
+
+
+class SlowStore:
+    """Store dont l'écriture reste bloquée jusqu'à `release`."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.written = []
+
+    def append_many(self, entries, sync=False):
+        self.started.set()
+        self.release.wait()
+        self.written.extend(entries)
+        return list(range(1, len(entries) + 1))
+
+
+def test_submit_times_out_while_batch_is_written():
+    store = SlowStore()
+    writer = GroupCommitWriter(store, max_delay=0, commit_timeout=0.05)
+    with pytest.raises(WriteTimeout) as excinfo:
+        writer.submit([('alice', {"order_id": "1"})])
+    assert excinfo.value.may_be_written
+    store.release.set()
+    writer.close()
+    assert writer.stats()['timeouts'] == 1
+
+
+def test_timed_out_entry_still_queued_is_never_written():
+    store = SlowStore()
+    writer = GroupCommitWriter(store, max_delay=0, commit_timeout=0.05)
+    first = threading.Thread(target=lambda: pytest.raises(WriteTimeout, writer.submit,
+                                                          [('alice', {"order_id": "1"})]))
+    first.start()
+    assert store.started.wait(1)
+
+    # Le premier lot bloque l'écrivain : le second reste en file puis expire
+    with pytest.raises(WriteTimeout) as excinfo:
+        writer.submit([('alice', {"order_id": "2"})])
+    assert not excinfo.value.may_be_written
+
+    store.release.set()
+    first.join()
+    writer.close()
+    assert [order['order_id'] for _, order in store.written] == ['1']
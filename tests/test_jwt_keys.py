@@ -0,0 +1,108 @@
+# tests/test_jwt_keys.py
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+import pytest
+
+jwt = pytest.importorskip('jwt')
+pytest.importorskip('cryptography')
+
+from common.jwt_keys import JWKSVerifier, KeyRing, KeysUnavailable, generate_key, key_ids, prune_keys
+
+
+def sign(ring, user='alice', lifetime=60):
+    kid, algorithm, private_key = ring.signing_key()
+    payload = {'user': user, 'exp': int(time.time()) + lifetime, 'iat': int(time.time())}
+    return jwt.encode(payload, private_key, algorithm=algorithm, headers={'kid': kid})
+
+
+def forge(header, payload, secret):
+    """Token signé en HMAC-SHA256 quel que soit l'algorithme annoncé dans l'en-tête."""
+    encode = lambda raw: base64.urlsafe_b64encode(raw).rstrip(b'=')
+    signing_input = encode(json.dumps(header).encode()) + b'.' + encode(json.dumps(payload).encode())
+    return (signing_input + b'.' + encode(hmac.new(secret, signing_input, hashlib.sha256).digest())).decode()
+
+
+class CountingFetch:
+    def __init__(self, ring):
+        self.ring = ring
+        self.calls = 0
+        self.down = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError('auth down')
+        return self.ring.jwks()
+
+
+@pytest.mark.parametrize('algorithm', ['EdDSA', 'RS256'])
+def test_first_key_is_created_once_and_published(tmp_path, algorithm):
+    ring = KeyRing(str(tmp_path), algorithm)
+    KeyRing(str(tmp_path), algorithm)                       # deuxième worker : réutilise la clé
+    assert len(key_ids(str(tmp_path))) == 1
+    [jwk] = ring.jwks()['keys']
+    assert jwk['alg'] == algorithm and jwk['kid'] == key_ids(str(tmp_path))[0] and 'd' not in jwk
+
+    verifier = JWKSVerifier(fetch=CountingFetch(ring))
+    assert verifier.check(sign(ring)) == {"status": "valid", "user": "alice", "exp": pytest.approx(time.time() + 60, abs=2)}
+    assert verifier.check(sign(ring, lifetime=-10))['status'] == 'expired'
+
+
+def test_rotation_without_downtime(tmp_path):
+    ring = KeyRing(str(tmp_path), 'EdDSA', check_interval=0, activation_delay=60)
+    [first] = key_ids(str(tmp_path))
+    os.utime(tmp_path / f'{first}.pem', (time.time() - 120,) * 2)   # clé déjà active
+    fetch = CountingFetch(ring)
+    verifier = JWKSVerifier(fetch=fetch, min_refresh_interval=0)
+    old_token = sign(ring)
+    assert verifier.check(old_token)['status'] == 'valid'
+
+    # Nouvelle clé publiée, mais pas encore utilisée pour signer
+    generate_key(str(tmp_path), 'EdDSA')
+    assert len(ring.jwks()['keys']) == 2
+    assert jwt.get_unverified_header(sign(ring))['kid'] == jwt.get_unverified_header(old_token)['kid']
+    ring.activation_delay = 0
+    new_token = sign(ring)
+    assert jwt.get_unverified_header(new_token)['kid'] != jwt.get_unverified_header(old_token)['kid']
+    # kid inconnu : le JWKS est rechargé tout de suite, l'ancienne clé reste publiée
+    assert verifier.check(new_token)['status'] == 'valid'
+    assert verifier.check(old_token)['status'] == 'valid'
+    assert fetch.calls == 2
+
+    # Clé retirée : plus publiée, la décision revient à l'Auth Service
+    generate_key(str(tmp_path), 'EdDSA')
+    prune_keys(str(tmp_path), keep=2)
+    verifier.refresh()
+    assert verifier.check(old_token) is None
+
+
+def test_forged_and_symmetric_tokens(tmp_path):
+    ring = KeyRing(str(tmp_path), 'EdDSA')
+    verifier = JWKSVerifier(fetch=CountingFetch(ring))
+    kid = ring.signing_key()[0]
+    hs256 = jwt.encode({'user': 'alice'}, 'secret', algorithm='HS256')
+    assert verifier.check(hs256) is None                    # laissé à l'Auth Service
+    # Même kid, mais signé en HS256 : refusé (l'algorithme est celui de la clé)
+    forged = forge({'kid': kid, 'alg': 'EdDSA'}, {'user': 'mallory'}, ring.jwks()['keys'][0]['x'].encode())
+    assert verifier.check(forged)['status'] == 'invalid'
+    assert verifier.check('pas-un-jwt')['status'] == 'invalid'
+
+
+def test_cached_keys_survive_jwks_outage(tmp_path):
+    ring = KeyRing(str(tmp_path), 'EdDSA')
+    fetch = CountingFetch(ring)
+    verifier = JWKSVerifier(fetch=fetch, refresh_interval=0, min_refresh_interval=0)
+    token = sign(ring)
+    assert verifier.check(token)['status'] == 'valid'
+    fetch.down = True
+    assert verifier.check(token)['status'] == 'valid'
+
+    cold = JWKSVerifier(fetch=fetch)
+    with pytest.raises(KeysUnavailable):
+        cold.check(token, fetch=False)
+    assert cold.check(token) is None and cold.stats()['refresh_errors'] == 1
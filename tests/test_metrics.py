@@ -0,0 +1,45 @@
+# tests/test_metrics.py
+import pytest
+
+from common.metrics import Registry
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', "Latence.", ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, route='/a')
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+    assert 'latency_seconds_sum{route="/a"} 3.65' in lines
+
+
+def test_counter_labels_and_escaping():
+    registry = Registry()
+    counter = registry.counter('requests_total', "Requêtes.", ('route', 'status'))
+    counter.inc(route='/x"y', status=200)
+    counter.inc(2, route='/x"y', status=200)
+    assert 'requests_total{route="/x\\"y",status="200"} 3' in registry.render().splitlines()
+    with pytest.raises(ValueError):
+        counter.inc(route='/x')
+
+
+def test_same_name_returns_same_metric():
+    registry = Registry()
+    assert registry.gauge('in_flight', "En cours.") is registry.gauge('in_flight', "En cours.")
+    with pytest.raises(ValueError):
+        registry.counter('in_flight', "En cours.")
+
+
+def test_stats_sources_are_flattened():
+    registry = Registry()
+    registry.register_stats('cache', lambda: {'hits': 3, 'ratio': 0.5, 'enabled': True,
+                                              'upstreams': {'auth-1': {'errors': 1}}, 'url': 'ignorée'})
+    registry.register_stats('broken', lambda: 1 / 0)
+    lines = registry.render().splitlines()
+    for expected in ('cache_hits 3', 'cache_ratio 0.5', 'cache_enabled 1', 'cache_upstreams_auth_1_errors 1'):
+        assert expected in lines
+    assert not any('url' in line or 'broken' in line for line in lines)
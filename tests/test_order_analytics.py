@@ -0,0 +1,96 @@
+# tests/test_order_analytics.py
+import json
+
+import pytest
+
+from common import order_analytics
+from common.order_analytics import OrderAnalytics, differences, open_analytics, rebuild
+from common.order_store import OrderStore
+
+
+def order(order_id, day='2024-01-01', lines=(('cookies', 2, 1.5),), status=None):
+    items = [{"article_id": article, "quantity": quantity, "total_price": total}
+             for article, quantity, total in lines]
+    result = {"order_id": order_id, "date": f"{day} 12:00:00",
+              "total": round(sum(total for _, _, total in lines), 2), "items": items}
+    if status:
+        result["status"] = status
+    return result
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'orders.log'), str(tmp_path / 'orders_stats.json')
+
+
+def test_aggregates_follow_writes(paths):
+    log_path, snapshot_path = paths
+    store = OrderStore(log_path)
+    analytics = open_analytics(store, snapshot_path)
+    store.append('alice', order('1', lines=[('cookies', 2, 1.5), ('laine', 1, 0.1), ('cookies', 1, 0.75)]))
+    store.append_many([('bob', order('2', day='2024-01-02')), ('alice', order('3', status='pending'))])
+
+    assert analytics.user_stats('alice') == {"orders": 1, "items": 4, "revenue_cents": 235}
+    assert analytics.article_stats('cookies') == {"orders": 2, "items": 5, "revenue_cents": 375}
+    assert analytics.day_stats('2024-01-02') == {"orders": 1, "items": 2, "revenue_cents": 150}
+    summary = analytics.summary()
+    assert summary["seq"] == 3 and summary["users"] == 2
+    assert summary["totals"] == {"orders": 2, "items": 6, "revenue_cents": 385}
+
+    # La version payée de la commande en attente est comptée une fois
+    store.append('alice', order('3', status='paid'))
+    assert analytics.user_stats('alice')["orders"] == 2
+    assert analytics.summary() is not summary
+    store.close()
+
+
+def test_snapshot_then_replay_of_the_tail(paths):
+    log_path, snapshot_path = paths
+    store = OrderStore(log_path)
+    analytics = open_analytics(store, snapshot_path)
+    store.append('alice', order('1'))
+    analytics.close(snapshot_path)
+    store.append('bob', order('2'))          # écrite après le snapshot
+    store.close()
+    assert json.load(open(snapshot_path))["seq"] == 1
+
+    store = OrderStore(log_path)
+    reopened = open_analytics(store, snapshot_path)
+    assert reopened.summary()["totals"]["orders"] == 2
+    assert differences(rebuild(log_path), reopened) == []
+    store.close()
+
+
+def test_snapshot_ahead_of_the_log_is_recomputed(paths):
+    log_path, snapshot_path = paths
+    OrderAnalytics(seq=50, totals={"orders": 9, "items": 9, "revenue_cents": 9}).save(snapshot_path)
+    store = OrderStore(log_path)
+    store.append('alice', order('1'))
+    analytics = open_analytics(store, snapshot_path)
+    assert analytics.summary()["totals"]["orders"] == 1
+    store.close()
+
+
+def test_verify_command_detects_drift(paths, capsys):
+    log_path, snapshot_path = paths
+    store = OrderStore(log_path)
+    analytics = open_analytics(store, snapshot_path)
+    store.append('alice', order('1'))
+    analytics.save(snapshot_path)
+    store.append('alice', order('2'))        # après le snapshot : ignorée par la vérification
+    store.close()
+
+    order_analytics.main(['--log', log_path, '--snapshot', snapshot_path])
+    assert 'conforme' in capsys.readouterr().out
+
+    data = json.load(open(snapshot_path))
+    data["users"]["alice"]["revenue_cents"] += 1
+    with open(snapshot_path, 'w') as f:
+        json.dump(data, f)
+    with pytest.raises(SystemExit) as exc:
+        order_analytics.main(['--log', log_path, '--snapshot', snapshot_path])
+    assert exc.value.code == 1
+    assert 'users alice' in capsys.readouterr().out
+
+    order_analytics.main(['--log', log_path, '--snapshot', snapshot_path, '--write'])
+    assert OrderAnalytics.load(snapshot_path).user_stats('alice')["orders"] == 2
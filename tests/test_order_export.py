@@ -0,0 +1,81 @@
+# tests/test_order_export.py
+import csv
+import io
+import json
+
+import pytest
+
+from common.order_export import export_chunks, resume_point
+from common.order_store import OrderStore
+
+
+def order(order_id, date='2024-01-01 12:00:00', total=10.0, items=()):
+    return {"order_id": order_id, "date": date, "total": total, "items": list(items)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = OrderStore(str(tmp_path / 'orders.log'))
+    yield store
+    store.close()
+
+
+def seqs(scanned):
+    return [record['seq'] for _, record in scanned]
+
+
+def test_scan_by_seq_user_and_current_version(store):
+    for i in range(1, 201):
+        store.append('alice' if i % 2 else 'bob', order(str(i)))
+    store.append('alice', order('1', total=20.0))          # seq 201 remplace la seq 1
+
+    assert seqs(store.scan()) == list(range(2, 202))
+    assert seqs(store.scan(after_seq=150, until_seq=160)) == list(range(151, 161))
+    assert seqs(store.scan(after_seq=190, user='bob')) == [192, 194, 196, 198, 200]
+    # Version remplacée après la fin de la plage : c'était la version courante de cette plage
+    assert seqs(store.scan(until_seq=3)) == [1, 2, 3]
+
+
+def test_offset_search_skips_to_after_seq(store):
+    store.append_many([('alice', order(str(i))) for i in range(1, 5001)])
+    with open(store.log_path, 'rb') as f:
+        offset = store._offset_after(f, store.stats()['log_bytes'], 4000, linear_below=1024)
+        assert 0 < offset
+        f.seek(offset)
+        assert json.loads(f.readline())['seq'] <= 4001
+    assert seqs(store.scan(after_seq=4990)) == list(range(4991, 5001))
+
+
+def test_ndjson_keeps_log_lines_and_filters_dates(store):
+    store.append('alice', order('1', date='2024-01-01 10:00:00'))
+    store.append('alice', order('2', date='2024-01-02 10:00:00'))
+    store.append('bob', order('3', date='2024-01-03 10:00:00'))
+    body = b''.join(export_chunks(store.scan(), 'ndjson', date_from='2024-01-02', date_to='2024-01-02'))
+    assert [json.loads(line)['order']['order_id'] for line in body.splitlines()] == ['2']
+
+    chunks = list(export_chunks(store.scan(), 'ndjson', chunk_size=1))
+    assert len(chunks) == 3
+
+
+def test_csv_has_one_row_per_item(store):
+    items = [{"article_id": "cookies", "article": "Cookies", "quantity": 2, "unit_price": 1.5, "total_price": 3.0},
+             {"article_id": "laine", "article": "Laine", "quantity": 1, "unit_price": 7.0, "total_price": 7.0}]
+    store.append('alice', order('1', items=items))
+    rows = list(csv.DictReader(io.StringIO(b''.join(export_chunks(store.scan(), 'csv')).decode())))
+    assert [(row['seq'], row['article_id'], row['quantity']) for row in rows] == [('1', 'cookies', '2'), ('1', 'laine', '1')]
+    assert b''.join(export_chunks(store.scan(), 'csv', header=False)).startswith(b'1,alice,')
+
+
+def test_resume_point_drops_incomplete_tail(tmp_path):
+    path = str(tmp_path / 'export.ndjson')
+    with open(path, 'wb') as f:
+        f.write(b'{"seq":1,"user":"a","order":{}}\n{"seq":2,"user":"a","order":{}}\n{"seq":3,"us')
+    assert resume_point(path) == 2
+    assert open(path, 'rb').read().endswith(b'{}}\n')
+
+    csv_path = str(tmp_path / 'export.csv')
+    with open(csv_path, 'wb') as f:
+        f.write(b'seq,user\n1,a,x\n2,a,x\n2,a,y\n')       # la commande 2 a pu être coupée
+    assert resume_point(csv_path, 'csv') == 1
+    assert open(csv_path, 'rb').read() == b'seq,user\n1,a,x\n'
+    assert resume_point(str(tmp_path / 'absent.csv'), 'csv') == 0
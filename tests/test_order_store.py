@@ -0,0 +1,186 @@
+# tests/test_order_store.py
+import json
+
+import pytest
+
+from common.order_store import OrderStore, StoreLocked
+
+
+def order(order_id, total=10.0):
+    return {"order_id": order_id, "date": "2024-01-01 12:00:00", "total": total, "items": []}
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'orders.log')
+
+
+def test_reopen_rebuilds_index(log_path):
+    store = OrderStore(log_path)
+    store.append('alice', order('1'))
+    store.append('bob', order('2'))
+    store.append('alice', order('1', total=20.0))  # nouvelle version
+    store.close()
+
+    store = OrderStore(log_path)
+    assert store.get_user_orders('alice') == [order('1', total=20.0)]
+    assert store.get_user_orders('bob') == [order('2')]
+    assert store.stats()['last_seq'] == 3
+    assert store.append('bob', order('3')) == 4
+    store.close()
+
+
+def test_torn_tail_is_truncated(log_path):
+    store = OrderStore(log_path)
+    store.append('alice', order('1'))
+    store.close()
+    with open(log_path, 'ab') as f:
+        f.write(b'{"seq":2,"user":"alice","ord')
+
+    store = OrderStore(log_path)
+    assert store.get_user_orders('alice') == [order('1')]
+    assert store.append('alice', order('2')) == 2
+    store.close()
+
+    store = OrderStore(log_path)
+    assert [o['order_id'] for o in store.get_user_orders('alice')] == ['1', '2']
+    store.close()
+
+
+def test_non_object_lines_are_skipped(log_path):
+    with open(log_path, 'wb') as f:
+        f.write(b'123\n')
+        f.write(b'{"seq":1,"user":"alice","order":[]}\n')
+        f.write(b'{"seq":2,"user":"alice","order":{"order_id":"1"}}\n')
+
+    store = OrderStore(log_path)
+    assert store.get_user_orders('alice') == [{"order_id": "1"}]
+    assert store.stats()['garbage_bytes'] > 0
+    store.close()
+
+
+def test_same_order_id_for_two_users(log_path):
+    store = OrderStore(log_path)
+    assert store.import_legacy({'alice': [order('1')], 'bob': [order('1', total=5.0)]}) == 2
+    assert store.get_user_orders('alice') == [order('1')]
+    assert store.get_user_orders('bob') == [order('1', total=5.0)]
+    assert store.get_order('bob', '1') == order('1', total=5.0)
+    store.close()
+
+    store = OrderStore(log_path)
+    assert store.get_user_orders('alice') == [order('1')]
+    assert store.get_user_orders('bob') == [order('1', total=5.0)]
+    store.close()
+
+
+def test_legacy_import_dedupes_and_skips_invalid(log_path):
+    store = OrderStore(log_path)
+    legacy = {'alice': [order('1'), order('1', total=99.0), {"total": 3}, order('2')]}
+    assert store.import_legacy(legacy) == 2
+    # Un second import n'ajoute rien
+    assert store.import_legacy(legacy) == 0
+    assert store.get_user_orders('alice') == [order('1'), order('2')]
+    store.close()
+
+
+def test_invalid_batch_leaves_store_unchanged(log_path):
+    store = OrderStore(log_path)
+    store.append('alice', order('1'))
+    before = store.stats()
+
+    with pytest.raises(ValueError):
+        store.append_many([('alice', order('2')), ('alice', {"total": 1})])
+    assert store.stats() == before
+
+    store.append('alice', order('3'))
+    store.close()
+    store = OrderStore(log_path)
+    assert [o['order_id'] for o in store.get_user_orders('alice')] == ['1', '3']
+    store.close()
+
+
+def test_compaction_keeps_latest_versions(log_path):
+    store = OrderStore(log_path, compact_min_bytes=1, compact_garbage_ratio=0.1)
+    for version in range(5):
+        store.append('alice', order('1', total=float(version)))
+        store.append('bob', order('1', total=float(version) + 100))
+    assert store.needs_compaction()
+
+    store.compact()
+    stats = store.stats()
+    assert stats['garbage_bytes'] == 0
+    assert stats['compactions'] == 1
+    assert store.get_user_orders('alice') == [order('1', total=4.0)]
+    assert store.get_user_orders('bob') == [order('1', total=104.0)]
+
+    store.append('alice', order('2'))
+    store.close()
+    with open(log_path, 'rb') as f:
+        assert len(f.read().splitlines()) == 3
+
+    store = OrderStore(log_path)
+    assert [o['total'] for o in store.get_user_orders('alice')] == [4.0, 10.0]
+    store.close()
+
+
+def test_second_process_cannot_open_log(log_path):
+    pytest.importorskip('fcntl')
+    # flock est lié à la description de fichier : une seconde ouverture est refusée
+    store = OrderStore(log_path)
+    with pytest.raises(StoreLocked):
+        OrderStore(log_path)
+    store.close()
+    OrderStore(log_path).close()
+
+
+def test_records_are_plain_ndjson(log_path):
+    store = OrderStore(log_path)
+    store.append('alice', order('1'))
+    store.close()
+    with open(log_path, encoding='utf-8') as f:
+        assert json.loads(f.readline()) == {"seq": 1, "user": "alice", "order": order('1')}
+
+
+def dated(order_id, date):
+    return {"order_id": order_id, "date": date, "total": 1.0, "items": []}
+
+
+def test_history_pages_newest_first(log_path):
+    store = OrderStore(log_path)
+    # Enregistrées dans le désordre (ancien orders.json) : l'index suit les dates
+    for i in (3, 1, 4, 2, 5):
+        store.append('alice', dated(str(i), f"2024-01-0{i} 10:00:00"))
+    store.append('bob', dated('9', "2024-01-09 10:00:00"))
+
+    page, next_key = store.history('alice', 2)
+    assert [o['order_id'] for o in page] == ['5', '4']
+    page, next_key = store.history('alice', 2, before=next_key)
+    assert [o['order_id'] for o in page] == ['3', '2']
+    page, next_key = store.history('alice', 2, before=next_key)
+    assert [o['order_id'] for o in page] == ['1']
+    assert next_key is None
+
+
+def test_history_date_filters(log_path):
+    store = OrderStore(log_path)
+    for i in range(1, 6):
+        store.append('alice', dated(str(i), f"2024-01-0{i} 10:00:00"))
+
+    page, next_key = store.history('alice', 10, date_from='2024-01-02', date_to='2024-01-04')
+    assert [o['order_id'] for o in page] == ['4', '3', '2']
+    assert next_key is None
+    page, _ = store.history('alice', 10, date_to='2024-01-02 09:00:00')
+    assert [o['order_id'] for o in page] == ['1']
+
+
+def test_user_version_changes_on_write(log_path):
+    store = OrderStore(log_path)
+    assert store.user_version('alice') == 0
+    store.append('alice', dated('1', "2024-01-01 10:00:00"))
+    version = store.user_version('alice')
+    store.append('bob', dated('2', "2024-01-01 10:00:00"))
+    assert store.user_version('alice') == version
+    store.append('alice', dated('1', "2024-01-02 10:00:00"))  # date modifiée
+    assert store.user_version('alice') > version
+    assert [o['date'] for o in store.get_user_orders('alice')] == ["2024-01-02 10:00:00"]
+    store.close()
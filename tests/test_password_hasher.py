@@ -0,0 +1,59 @@
+# tests/test_password_hasher.py
+import os
+import time
+
+import pytest
+
+pytest.importorskip('bcrypt')
+
+from common.password_hasher import HasherSaturated, PasswordHasherPool
+
+
+# Exécutées dans les processus du pool : doivent rester au niveau module
+def _crash():
+    os._exit(1)
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.fixture
+def pool():
+    pool = PasswordHasherPool(workers=1, max_pending=0, rounds=4, timeout=5.0)
+    pool.start()
+    yield pool
+    pool.close()
+
+
+def test_hash_and_verify(pool):
+    password_hash = pool.hash('secret')
+    assert pool.verify('secret', password_hash)
+    assert not pool.verify('wrong', password_hash)
+    assert not pool.verify('secret', 'pas-un-hash')
+    assert pool.needs_rehash(password_hash) is False
+
+
+def test_broken_pool_is_replaced(pool):
+    with pytest.raises(HasherSaturated):
+        pool._run(_crash)
+    assert pool.stats()['restarts'] == 1
+    assert pool.stats()['in_flight'] == 0
+    # Le pool suivant est recréé à la demande
+    assert pool.verify('secret', pool.hash('secret'))
+
+
+def test_timed_out_work_keeps_its_slot(pool):
+    pool.timeout = 0.05
+    with pytest.raises(HasherSaturated):
+        pool._run(_sleep, 0.5)
+    # Le processus calcule encore : la seule place reste occupée
+    with pytest.raises(HasherSaturated):
+        pool._run(_sleep, 0)
+    assert pool.stats()['rejected'] == 1
+
+    time.sleep(0.6)
+    pool.timeout = 5.0
+    assert pool._run(_sleep, 0) == 0
+    assert pool.stats()['in_flight'] == 0
@@ -0,0 +1,199 @@
+# tests/test_payments.py
+import threading
+import time
+
+import pytest
+
+from common.group_commit import GroupCommitWriter, WriteQueueFull
+from common.order_store import OrderStore
+from common.payments import PaymentProcessor, PaymentProvider, PaymentUnavailable, open_payments
+
+
+def order(order_id, status='pending', total=3.0):
+    return {"order_id": order_id, "date": "2024-01-01 12:00:00", "total": total, "items": [], "status": status}
+
+
+class ScriptedProvider:
+    """Réponses du prestataire dans l'ordre : True (accepté), False (refusé) ou une exception ;
+    `gate` : chaque appel attend qu'elle soit ouverte."""
+
+    def __init__(self, *outcomes, gate=None):
+        self.outcomes = list(outcomes)
+        self.gate = gate
+        self.keys = []
+
+    def charge(self, key, amount):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.keys.append(key)
+        outcome = self.outcomes.pop(0) if self.outcomes else True
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def stats(self):
+        return {"calls": len(self.keys)}
+
+
+class FlakyWriter:
+    """GroupCommitWriter dont les `failures` premiers dépôts échouent (file pleine)."""
+
+    def __init__(self, writer, failures):
+        self.writer = writer
+        self.failures = failures
+
+    def submit(self, entries, timeout=None):
+        if self.failures:
+            self.failures -= 1
+            raise WriteQueueFull()
+        return self.writer.submit(entries, timeout)
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'orders.log')
+
+
+def settle(processor, user, order_id, timeout=5):
+    order = processor.wait_for_status(user, order_id, timeout)
+    assert order['status'] != 'pending'
+    return order
+
+
+def test_provider_decides_once_per_key():
+    provider = PaymentProvider(latency=0, jitter=0, decline_rate=0.5, error_rate=0, seed=1)
+    decisions = [provider.charge(f"alice/{i}", 10) for i in range(50)]
+    assert 0 < sum(decisions) < 50
+    # Même clé : même décision, pas de second débit
+    assert [provider.charge(f"alice/{i}", 10) for i in range(50)] == decisions
+    stats = provider.stats()
+    assert stats["calls"] == 100 and stats["charges"] + stats["declines"] == 50
+
+    down = PaymentProvider(latency=0, jitter=0, error_rate=1)
+    with pytest.raises(PaymentUnavailable):
+        down.charge("alice/1", 10)
+    assert down.stats()["charges"] == 0
+
+
+def test_pending_orders_are_paid_or_declined(log_path, tmp_path):
+    store = OrderStore(log_path)
+    writer = GroupCommitWriter(store)
+    processor = open_payments(store, writer, str(tmp_path / 'checkpoint.json'),
+                              provider=ScriptedProvider(True, False), workers=1)
+    writer.submit([('alice', order('1')), ('alice', order('2'))])
+
+    paid, declined = settle(processor, 'alice', '1'), settle(processor, 'alice', '2')
+    assert paid['status'] == 'paid' and paid['payment']['attempts'] == 1
+    assert declined['status'] == 'failed' and declined['payment']['message'] == "Paiement refusé."
+    assert processor.stats()['pending'] == 0 and processor.stats()['outcomes']['paid'] == 1
+    processor.close(str(tmp_path / 'checkpoint.json'))
+    writer.close()
+    store.close()
+
+
+def test_unavailable_provider_is_retried_with_backoff(log_path, tmp_path):
+    store = OrderStore(log_path)
+    writer = GroupCommitWriter(store)
+    provider = ScriptedProvider(PaymentUnavailable(), PaymentUnavailable(), True,
+                                PaymentUnavailable(), PaymentUnavailable(), PaymentUnavailable())
+    processor = open_payments(store, writer, str(tmp_path / 'checkpoint.json'), provider=provider, workers=1,
+                              max_attempts=3, retry_base=0.01, retry_max=0.02)
+    writer.submit([('alice', order('1'))])
+    assert settle(processor, 'alice', '1')['payment']['attempts'] == 3
+    writer.submit([('alice', order('2'))])
+    abandoned = settle(processor, 'alice', '2')
+    assert abandoned['status'] == 'failed' and abandoned['payment']['attempts'] == 3
+    assert processor.stats()['retries']['provider'] == 4
+    # Même clé d'idempotence à chaque essai
+    assert provider.keys[:3] == ['alice/1'] * 3
+
+    # Délai exponentiel borné, tiré dans [plafond / 2, plafond]
+    for attempt, ceiling in ((1, 0.01), (2, 0.02), (8, 0.02)):
+        assert ceiling / 2 <= processor.retry_delay(attempt) <= ceiling
+    processor.close(str(tmp_path / 'checkpoint.json'))
+    writer.close()
+    store.close()
+
+
+def test_result_write_failure_is_retried(log_path, tmp_path):
+    store = OrderStore(log_path)
+    writer = GroupCommitWriter(store)
+    processor = open_payments(store, FlakyWriter(writer, failures=2), str(tmp_path / 'checkpoint.json'),
+                              provider=PaymentProvider(latency=0, jitter=0, decline_rate=0, error_rate=0),
+                              workers=1, retry_base=0.01, retry_max=0.02)
+    writer.submit([('alice', order('1'))])
+    assert settle(processor, 'alice', '1')['status'] == 'paid'
+    # Trois présentations au prestataire, un seul débit
+    assert processor.stats()['retries']['write'] == 2
+    assert processor.provider.stats()['calls'] == 3 and processor.provider.stats()['charges'] == 1
+    processor.close(str(tmp_path / 'checkpoint.json'))
+    writer.close()
+    store.close()
+
+
+def test_pending_orders_survive_a_restart(log_path, tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    store = OrderStore(log_path)
+    store.append_many([('alice', order('1', status='paid')), ('alice', order('2')), ('bob', order('3'))],
+                      sync=True)
+    # Arrêt pendant le paiement de la commande 2 : la 3 n'a pas été payée
+    writer = GroupCommitWriter(store)
+    gate = threading.Event()
+    processor = open_payments(store, writer, checkpoint, provider=ScriptedProvider(gate=gate), workers=1)
+    assert processor.checkpoint() == 1
+    processor.close(checkpoint, timeout=0.05)
+    writer.close()
+    store.close()
+    gate.set()
+
+    store = OrderStore(log_path)
+    writer = GroupCommitWriter(store)
+    provider = ScriptedProvider()
+    processor = open_payments(store, writer, checkpoint, provider=provider, workers=2)
+    assert settle(processor, 'alice', '2')['status'] == 'paid' and settle(processor, 'bob', '3')['status'] == 'paid'
+    assert sorted(provider.keys) == ['alice/2', 'bob/3']
+    processor.close(checkpoint)
+    assert PaymentProcessor.load_checkpoint(checkpoint) == store.stats()['last_seq']
+    writer.close()
+    store.close()
+
+
+def test_long_poll_wakes_up_when_payment_ends(log_path, tmp_path):
+    store = OrderStore(log_path)
+    writer = GroupCommitWriter(store)
+    gate = threading.Event()
+    processor = open_payments(store, writer, str(tmp_path / 'checkpoint.json'),
+                              provider=ScriptedProvider(gate=gate), workers=1)
+    writer.submit([('alice', order('1'))])
+
+    started = time.monotonic()
+    assert processor.wait_for_status('alice', '1', 0.05)['status'] == 'pending'
+    assert time.monotonic() - started >= 0.05
+    assert processor.wait_for_status('alice', 'inconnue', 1) is None
+
+    threading.Timer(0.05, gate.set).start()
+    started = time.monotonic()
+    assert processor.wait_for_status('alice', '1', 5)['status'] == 'paid'
+    assert time.monotonic() - started < 2
+    assert processor.stats()['waiters'] == 0
+    processor.close(str(tmp_path / 'checkpoint.json'))
+    writer.close()
+    store.close()
+
+
+def test_admission_is_bounded(log_path, tmp_path):
+    store = OrderStore(log_path)
+    writer = GroupCommitWriter(store)
+    gate = threading.Event()
+    processor = open_payments(store, writer, str(tmp_path / 'checkpoint.json'),
+                              provider=ScriptedProvider(gate=gate), workers=1, max_pending=2)
+    assert processor.admit(2) and not processor.admit(3)
+    writer.submit([('alice', order('1')), ('alice', order('2'))])
+    assert not processor.admit(1)
+    gate.set()
+    settle(processor, 'alice', '1')
+    settle(processor, 'alice', '2')
+    assert processor.admit(2)
+    processor.close(str(tmp_path / 'checkpoint.json'))
+    writer.close()
+    store.close()
@@ -0,0 +1,79 @@
+# tests/test_rate_limiter.py
+import pytest
+
+from common.http_headers import client_ip
+from common.rate_limiter import RateLimitClient, RateLimiter, RateLimitServer, Rule, TokenBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_refills_and_reports_wait():
+    clock = Clock()
+    buckets = TokenBuckets(clock=clock)
+    checks = [('user:alice', 2.0, 3.0)]
+    assert [buckets.take(checks)[0] for _ in range(4)] == [True, True, True, False]
+    assert buckets.take(checks)[1] == pytest.approx(0.5)
+    clock.now += 0.5
+    assert buckets.take(checks)[0]
+
+
+def test_all_or_nothing():
+    buckets = TokenBuckets(clock=Clock())
+    assert buckets.take([('ip:a', 1.0, 1.0)])[0]
+    # L'IP est épuisée : le seau de l'utilisateur n'est pas entamé
+    assert buckets.take([('user:bob', 1.0, 1.0), ('ip:a', 1.0, 1.0)]) == (False, pytest.approx(1.0), 1)
+    assert buckets.take([('user:bob', 1.0, 1.0)])[0]
+
+
+def test_full_buckets_expire_and_keys_are_bounded():
+    clock = Clock()
+    buckets = TokenBuckets(max_keys=3, clock=clock)
+    for i in range(5):
+        buckets.take([(f'user:{i}', 1.0, 2.0)])
+    assert buckets.stats()['keys'] == 3 and buckets.stats()['evicted'] == 2
+    clock.now += 1.0                    # seaux de nouveau pleins : supprimés au passage
+    buckets.take([('user:new', 1.0, 2.0)])
+    assert buckets.stats()['keys'] == 1 and buckets.stats()['expired'] == 3
+
+
+def test_workers_share_buckets_through_the_server(tmp_path):
+    server = RateLimitServer(str(tmp_path / 'rl.sock')).start()
+    try:
+        first, second = RateLimitClient(server.path, timeout=1.0), RateLimitClient(server.path, timeout=1.0)
+        checks = [('user:alice', 0.001, 2.0)]
+        assert [first.take(checks)[0], second.take(checks)[0], first.take(checks)[0]] == [True, True, False]
+        assert first.fallbacks == second.fallbacks == 0
+    finally:
+        server.close()
+
+
+def test_client_falls_back_without_server(tmp_path):
+    client = RateLimitClient(str(tmp_path / 'absent.sock'), timeout=0.01)
+    assert client.take([('user:alice', 1.0, 1.0)])[0]
+    assert not client.take([('user:alice', 1.0, 1.0)])[0]
+    assert client.stats()['fallbacks'] == 2
+
+
+def test_rate_limiter_reports_scope_and_retry_after():
+    limiter = RateLimiter([Rule('user', 0.5, 1), Rule('ip', 100, 100), Rule('off', 0, 0)],
+                          TokenBuckets(clock=Clock()))
+    assert limiter.check(user='alice', ip='10.0.0.1') == (True, 0, None)
+    assert limiter.check(user='alice', ip='10.0.0.1') == (False, 2, 'user')
+    assert limiter.check(user='bob', ip='10.0.0.1')[0]
+    assert limiter.check() == (True, 0, None)
+
+
+def test_client_ip_trusts_only_known_proxies():
+    trusted = {'127.0.0.1'}
+    assert client_ip('10.0.0.5', '1.2.3.4', trusted) == '10.0.0.5'
+    assert client_ip('127.0.0.1', '1.2.3.4', trusted) == '1.2.3.4'
+    assert client_ip('127.0.0.1', '6.6.6.6, 1.2.3.4, 127.0.0.1', trusted) == '1.2.3.4'
+    assert client_ip('127.0.0.1', None, trusted) == '127.0.0.1'
+    # Aucun proxy configuré (par défaut) : l'en-tête est ignoré, même en local
+    assert client_ip('127.0.0.1', '1.2.3.4', frozenset()) == '127.0.0.1'
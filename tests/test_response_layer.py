@@ -0,0 +1,64 @@
+# tests/test_response_layer.py
+import gzip
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from app.response_layer import install_response_layer
+
+PAGE = '<html>' + 'articles ' * 200 + '</html>'
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+    app.layer = install_response_layer(app, enabled=True, compression=True)
+
+    @app.route('/page')
+    def page():
+        return PAGE
+
+    @app.route('/small')
+    def small():
+        return '<p>ok</p>'
+
+    return app.test_client()
+
+
+def test_gzip_negotiated_and_reused(client):
+    response = client.get('/page', headers={'Accept-Encoding': 'gzip;q=0.8, br;q=0'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data).decode() == PAGE
+    client.get('/page', headers={'Accept-Encoding': 'gzip'})
+    assert client.application.layer.compressed.stats()['hits'] == 1
+
+
+def test_identity_when_not_accepted_or_too_small(client):
+    assert 'Content-Encoding' not in client.get('/page', headers={'Accept-Encoding': 'identity'}).headers
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_etag_revalidation(client):
+    first = client.get('/page')
+    etag = first.headers['ETag']
+    assert etag.startswith('W/') and first.headers['Cache-Control'] == 'private, no-cache'
+    again = client.get('/page', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+    assert again.status_code == 304 and again.data == b''
+    assert client.get('/page', headers={'If-None-Match': 'W/"autre"'}).status_code == 200
+
+
+def test_fragment_rendered_once_per_key(client):
+    env = client.application.jinja_env
+    calls = []
+    template = env.from_string('{% fragment "liste", version %}{{ render() }}{% endfragment %}-{{ user }}')
+
+    def render():
+        calls.append(1)
+        return 'rendu'
+
+    assert template.render(version=1, user='a', render=render) == 'rendu-a'
+    assert template.render(version=1, user='b', render=render) == 'rendu-b'
+    assert template.render(version=2, user='b', render=render) == 'rendu-b'
+    assert len(calls) == 2
@@ -0,0 +1,80 @@
+# tests/test_revocations.py
+import time
+
+from common import revocations
+from common.rate_limiter import RateLimitClient, RateLimitServer
+from common.revocations import RevocationLog, RevocationSync
+from common.token_cache import TokenCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_log_numbers_and_forgets_expired_revocations():
+    clock = FakeClock()
+    log = RevocationLog(clock=clock)
+    assert log.add('a', 1010) == 1 and log.add('b', 1100) == 2
+    assert log.since(0) == (2, [['a', 1010], ['b', 1100]])
+    assert log.since(1) == (2, [['b', 1100]])
+    assert log.since(0, limit=1) == (1, [['a', 1010]])
+    clock.now = 1050
+    assert log.add('c', 1040) == 2      # déjà expirée : ignorée
+    assert log.since(0) == (2, [['b', 1100]])
+    assert log.stats() == {"revoked": 1, "seq": 2}
+
+
+def test_logout_on_one_worker_reaches_the_others(tmp_path):
+    server = RateLimitServer(str(tmp_path / 'rl.sock'), revocations=RevocationLog()).start()
+    try:
+        first, second = TokenCache(), TokenCache()
+        first_sync = RevocationSync(server.path, first, timeout=1.0)
+        second_sync = RevocationSync(server.path, second, timeout=1.0)
+        exp = time.time() + 60
+        for cache in (first, second):
+            cache.put_valid('jeton', 'alice', exp)
+
+        first.revoke('jeton')
+        assert second.get('jeton').user == 'alice'     # fenêtre résiduelle : jusqu'au prochain relevé
+        assert second_sync.poll()
+        assert second.get('jeton').user is None
+        assert (first_sync.published, second_sync.received, second_sync.errors) == (1, 1, 0)
+
+        # Les seaux de limitation de débit restent servis par la même socket
+        assert RateLimitClient(server.path, timeout=1.0).take([('user:alice', 1.0, 1.0)])[0]
+    finally:
+        server.close()
+
+
+def test_worker_catches_up_in_several_replies(tmp_path, monkeypatch):
+    monkeypatch.setattr(revocations, 'MAX_ENTRIES_PER_REPLY', 2)
+    log = RevocationLog()
+    server = RateLimitServer(str(tmp_path / 'rl.sock'), revocations=log).start()
+    try:
+        for key in 'abcde':
+            log.add(key, time.time() + 60)
+        cache = TokenCache()
+        sync = RevocationSync(server.path, cache, timeout=1.0)
+        assert sync.poll()
+        assert (sync.seq, sync.received, cache.stats()['revoked']) == (5, 5, 5)
+    finally:
+        server.close()
+
+
+def test_unpublished_revocation_is_sent_again(tmp_path):
+    cache = TokenCache()
+    sync = RevocationSync(str(tmp_path / 'rl.sock'), cache, timeout=0.05)
+    cache.revoke('jeton', until=time.time() + 60)
+    assert not sync.poll() and sync.stats()['unpublished'] == 1   # superviseur absent
+
+    log = RevocationLog()
+    server = RateLimitServer(sync.path, revocations=log).start()
+    try:
+        assert sync.poll()
+        assert sync.published == 1 and log.stats()['revoked'] == 1
+    finally:
+        server.close()
@@ -0,0 +1,71 @@
+# tests/test_sqlite_pool.py
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from common.sqlite_pool import SQLitePool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'users.db'), max_connections=2, busy_timeout=0.5)
+    yield pool
+    pool.close_all()
+
+
+def test_connections_are_reused_in_wal_mode(pool):
+    with pool.connection() as conn:
+        first = conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        conn.execute("CREATE TABLE users (name TEXT)")
+        conn.commit()
+    with pool.connection() as conn:
+        assert conn is first
+        assert conn.execute("SELECT count(*) FROM users").fetchone()[0] == 0
+    assert pool.stats() == {"open": 1, "idle": 1, "max": 2}
+
+
+def test_uncommitted_work_is_rolled_back_on_return(pool):
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE users (name TEXT)")
+        conn.commit()
+        conn.execute("INSERT INTO users VALUES ('alice')")
+        assert conn.in_transaction
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT count(*) FROM users").fetchone()[0] == 0
+
+
+def test_reads_are_not_blocked_by_a_writer(pool):
+    with pool.connection() as writer:
+        writer.execute("CREATE TABLE users (name TEXT)")
+        writer.commit()
+        writer.execute("INSERT INTO users VALUES ('alice')")
+        # Écriture en cours, non validée : un lecteur voit l'état précédent sans attendre (WAL)
+        with pool.connection() as reader:
+            assert reader is not writer
+            assert reader.execute("SELECT count(*) FROM users").fetchone()[0] == 0
+        writer.commit()
+
+
+def test_checkout_waits_for_a_free_connection(pool):
+    first, second = pool.acquire(), pool.acquire()
+    threading.Timer(0.05, pool.release, args=(second,)).start()
+    started = time.monotonic()
+    assert pool.acquire() is second
+    assert time.monotonic() - started >= 0.04
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()       # max_connections atteint, aucune libérée avant busy_timeout
+    pool.release(first)
+    pool.release(second)
+    assert pool.stats()['open'] == 2
+
+
+def test_closed_pool_refuses_new_connections(pool):
+    conn = pool.acquire()
+    pool.close_all()
+    pool.release(conn)
+    with pytest.raises(sqlite3.ProgrammingError):
+        pool.acquire()
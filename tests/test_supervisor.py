@@ -0,0 +1,94 @@
+# tests/test_supervisor.py
+import json
+import os
+import signal
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import supervisor
+from supervisor import ConfigError, Supervisor, load_config
+
+HELLO_APP = '''
+import os
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode()]
+'''
+
+
+def write_config(tmp_path, services, **settings):
+    path = tmp_path / 'supervisor.json'
+    path.write_text(json.dumps(dict(settings, services=services)), encoding='utf-8')
+    return str(path)
+
+
+def test_single_writer_is_clamped_and_defaults_applied(tmp_path):
+    config = load_config(write_config(tmp_path, {
+        'orders': {'module': 'orders_service', 'app': 'orders_app', 'port': 5001, 'workers': 4, 'single_writer': True},
+        'front': {'module': 'app', 'app': 'app', 'port': 5000},
+    }, drain_timeout=3))
+    assert config['services']['orders']['workers'] == 1
+    assert config['services']['front']['workers'] == 1
+    assert config['services']['front']['health_path'] == supervisor.DEFAULTS['health_path']
+    assert config['drain_timeout'] == 3
+
+
+@pytest.mark.parametrize('services', [{}, {'x': {'module': 'm', 'app': 'a'}}, {'x': {'module': 'm', 'app': 'a', 'port': 1, 'workers': 0}}])
+def test_invalid_config(tmp_path, services):
+    with pytest.raises(ConfigError):
+        load_config(write_config(tmp_path, services))
+
+
+def get(port):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5) as response:
+        return int(response.read())
+
+
+def test_workers_share_the_port_and_are_replaced(tmp_path, monkeypatch):
+    pytest.importorskip('werkzeug')
+    (tmp_path / 'hello_app.py').write_text(HELLO_APP, encoding='utf-8')
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path) + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    listen = supervisor.listen_socket('127.0.0.1', 0, 16)
+    port = listen.getsockname()[1]
+    listen.close()
+    config = load_config(write_config(tmp_path, {
+        'hello': {'module': 'hello_app', 'app': 'app', 'port': port, 'workers': 2, 'health_path': '/'},
+    }, health_interval=0.1, min_uptime=0, drain_timeout=5))
+
+    sup = Supervisor(config)
+    runner = threading.Thread(target=sup.run)
+    monkeypatch.setattr(signal, 'signal', lambda *args: None)   # hors du thread principal
+    runner.start()
+    try:
+        deadline = time.monotonic() + 30
+        while 'hello' not in sup.groups or len(sup.groups['hello'].workers) < 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        group = sup.groups['hello']
+        while not all(group.wait_ready(worker) for worker in group.workers):
+            assert time.monotonic() < deadline
+        pids = {worker.pid for worker in group.workers}
+        assert get(port) in pids
+
+        crashed = group.workers[0]
+        os.kill(crashed.pid, signal.SIGKILL)
+        while group.workers[0] is crashed or not group.wait_ready(group.workers[0]):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+        before = {worker.pid for worker in group.workers}
+        sup.request_reload()                                # comme SIGHUP
+        while before & {worker.pid for worker in group.workers} or sup._reload.is_set():
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        workers = list(group.workers)
+        assert get(port) in {worker.pid for worker in workers}
+    finally:
+        sup.request_stop()
+        runner.join(30)
+    assert not runner.is_alive()
+    assert not any(worker.alive() for worker in workers)
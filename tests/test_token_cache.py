@@ -0,0 +1,70 @@
+# tests/test_token_cache.py
+import base64
+import json
+import time
+
+from common.token_cache import TokenCache, token_key, unverified_exp
+
+
+def test_lru_eviction_and_stats():
+    cache = TokenCache(max_size=2)
+    cache.put_valid('a', 'alice', time.time() + 60)
+    cache.put_valid('b', 'bob', time.time() + 60)
+    assert cache.get('a').user == 'alice'   # 'a' devient le plus récent
+    cache.put_valid('c', 'carol', time.time() + 60)
+    assert cache.get('b') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 1, 1)
+
+
+def test_pop_does_not_count_as_lookup():
+    cache = TokenCache()
+    cache.put_valid('a', 'alice', time.time() + 60)
+    assert cache.pop('a').user == 'alice'
+    assert cache.pop('a') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (0, 0, 0)
+
+
+def test_invalidate_user_and_negative_ttl():
+    cache = TokenCache(negative_ttl=0.01)
+    cache.put_valid('a', 'alice', time.time() + 60)
+    cache.put_valid('b', 'alice', time.time() + 60)
+    cache.put_invalid('x', "Token expiré.")
+    cache.invalidate_user('alice')
+    assert cache.get('a') is None and cache.get('b') is None
+    assert cache.get('x').message == "Token expiré."
+    time.sleep(0.02)
+    assert cache.get('x') is None
+
+
+def test_revoked_token_stays_rejected_until_exp():
+    cache = TokenCache()
+    published = []
+    cache.on_revoke = lambda key, until: published.append((key, until))
+    exp = time.time() + 60
+    cache.put_valid('a', 'alice', exp)
+    assert cache.revoke('a').user == 'alice'
+    # Revalidé par l'Auth Service (JWT sans état) : toujours refusé
+    cache.put_valid('a', 'alice', exp)
+    assert cache.get('a').user is None and cache.get('a').expires_at == exp
+    assert published == [(token_key('a'), exp)]
+
+    # Révocation publiée par un autre worker
+    cache.put_valid('b', 'bob', exp)
+    cache.revoke_key(token_key('b'), exp)
+    assert cache.get('b').user is None
+    cache.revoke_key(token_key('c'), time.time() - 1)   # déjà expirée : ignorée
+    assert cache.stats()['revoked'] == 2
+
+
+def test_revocation_lasts_until_the_jwt_exp():
+    cache = TokenCache(max_revocation_ttl=600)
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + 30}).encode()).rstrip(b'=').decode()
+    token = f"entete.{payload}.signature"
+    assert unverified_exp(token) > time.time() + 25
+    assert unverified_exp('pas-un-jwt') is None
+    assert cache.revoke(token) is None      # absent du cache : durée lue dans le token
+    assert cache.get(token).expires_at == unverified_exp(token)
+    cache.revoke('opaque', until=time.time() + 3600)
+    assert cache.get('opaque').expires_at <= time.time() + 600
@@ -0,0 +1,86 @@
+# tests/test_token_refresh.py
+import base64
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('flask')   # le paquet app importe Flask
+
+from app.token_refresh import TokenRefresher, token_claims
+
+
+def make_token(lifetime, remaining):
+    now = time.time()
+    payload = json.dumps({'user': 'u', 'iat': now + remaining - lifetime, 'exp': now + remaining}).encode()
+    return 'e30.' + base64.urlsafe_b64encode(payload).decode().rstrip('=') + '.sig'
+
+
+class FakeAuth:
+    def __init__(self, result=lambda: make_token(600, 600), delay=0.0):
+        self.calls = 0
+        self.result = result
+        self.delay = delay
+
+    def __call__(self, refresh_token):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.result()
+
+
+def test_claims_are_read_without_signature():
+    assert token_claims(make_token(600, 300))['user'] == 'u'
+    assert token_claims('pas-un-jwt') == {}
+    assert token_claims(None) == {}
+
+
+def test_fresh_token_is_used_as_is():
+    auth = FakeAuth()
+    refresher = TokenRefresher(auth)
+    token = make_token(600, 500)
+    assert refresher.access_token(token, 'r') is token
+    assert auth.calls == 0
+
+
+def test_refresh_ahead_runs_in_background_and_is_handed_over():
+    auth = FakeAuth()
+    refresher = TokenRefresher(auth)
+    token = make_token(600, 60)                        # dernier 20 % de sa durée de vie
+    assert refresher.access_token(token, 'r') is token
+    deadline = time.monotonic() + 5
+    while refresher.stats()['cached'] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    newer = refresher.access_token(token, 'r')
+    assert newer != token and token_claims(newer)['exp'] > token_claims(token)['exp']
+    assert auth.calls == 1 and refresher.stats()['background'] == 1
+
+
+def test_expiring_token_is_refreshed_once_for_concurrent_requests():
+    auth = FakeAuth(delay=0.2)
+    refresher = TokenRefresher(auth)
+    token = make_token(600, 1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(refresher.access_token(token, 'r', timeout=5)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert auth.calls == 1
+    assert len(set(results)) == 1 and results[0] != token
+    assert refresher.stats()['coalesced'] == 7
+
+
+def test_rejected_refresh_asks_for_login_and_errors_propagate():
+    refresher = TokenRefresher(FakeAuth(result=lambda: None))
+    assert refresher.access_token(make_token(600, 1), 'r') is None
+
+    def down():
+        raise ConnectionError('auth down')
+
+    failing = TokenRefresher(FakeAuth(result=down))
+    with pytest.raises(ConnectionError):
+        failing.access_token(make_token(600, 1), 'r2')
+    assert failing.stats()['failures'] == 1 and failing.stats()['cached'] == 0
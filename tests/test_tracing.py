@@ -0,0 +1,61 @@
+# tests/test_tracing.py
+import json
+
+from common import tracing
+from common.trace_report import load_records, report
+
+
+def test_request_id_is_kept_only_when_safe():
+    assert tracing.accept_request_id('abc-123_X.y') == 'abc-123_X.y'
+    assert tracing.accept_request_id('bad id\r\n') != 'bad id\r\n'
+    assert len(tracing.accept_request_id(None)) == 32
+
+
+def test_sampling_depends_only_on_request_id():
+    assert tracing.is_sampled('r1', rate=1.0)
+    assert not tracing.is_sampled('r1', rate=0.0)
+    assert tracing.is_sampled('r42', rate=0.5) == tracing.is_sampled('r42', rate=0.5)
+
+
+def test_spans_headers_and_server_timing():
+    trace, token = tracing.start_trace('req-1', 'gateway', 'POST', '/api/orders')
+    try:
+        assert tracing.outgoing_headers({'A': 'b'}) == {'A': 'b', tracing.REQUEST_ID_HEADER: 'req-1'}
+        tracing.record_span('upstream.orders', trace.started, 0.004)
+        tracing.record_span('upstream.orders', trace.started, 0.001)
+        tracing.record_span('gateway.validate_token', trace.started, 0.002)
+        tracing.merge_server_timing('orders;dur=3.50, orders.commit_wait;dur=2.00')
+    finally:
+        tracing.end_trace(token)
+    assert tracing.current_trace() is None
+    assert tracing.outgoing_headers() == {}
+
+    entries = trace.server_timing().split(', ')
+    assert entries[0].startswith('gateway;dur=')
+    assert entries[1:] == ['gateway.upstream.orders;dur=5.00', 'gateway.validate_token;dur=2.00',
+                           'orders;dur=3.50', 'orders.commit_wait;dur=2.00']
+
+
+def test_report_joins_hops_by_request_id(tmp_path):
+    path = tmp_path / 'traces.ndjson'
+    hops = [
+        {"request_id": "r1", "service": "gateway", "method": "POST", "route": "/api/orders", "status": 201,
+         "start": 10.0, "duration_ms": 50.0, "spans": [{"name": "upstream.orders", "start_ms": 1, "duration_ms": 45.0}]},
+        {"request_id": "r1", "service": "orders", "method": "POST", "route": "/orders", "status": 201,
+         "start": 10.001, "duration_ms": 44.0, "spans": []},
+        {"request_id": "r2", "service": "gateway", "method": "POST", "route": "/api/orders", "status": 201,
+         "start": 11.0, "duration_ms": 5.0, "spans": []},
+    ]
+    for record in hops:
+        tracing.write_record(record, path=str(path))
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('ligne tronquée {\n')
+
+    result = report(load_records(str(path)), top=5)
+    assert result['requests'] == 2
+    slowest = result['slowest'][0]
+    assert slowest['request_id'] == 'r1'
+    assert slowest['path'] == 'gateway POST /api/orders → orders POST /orders'
+    assert [hop['self_ms'] for hop in slowest['hops']] == [5.0, 44.0]
+    assert result['paths'][0]['dominant_hop'] == 'orders POST /orders'
+    json.dumps(result)
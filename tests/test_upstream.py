@@ -0,0 +1,99 @@
+# tests/test_upstream.py
+import threading
+import time
+
+import pytest
+
+requests = pytest.importorskip('requests')
+pytest.importorskip('pybreaker')
+
+from common import deadline
+from common.upstream import UpstreamClient
+
+
+@pytest.fixture
+def client(stub_server):
+    stub_server.routes = {'/fast': (200, {}, {"ok": True}, 0), '/slow': (200, {}, {"ok": True}, 0.3)}
+    client = UpstreamClient('test', stub_server.url, pool_size=2)
+    yield client
+    client.close()
+
+
+def occupy(client, count):
+    """Lance `count` appels /slow et attend qu'ils tiennent chacun une connexion."""
+    threads = [threading.Thread(target=client.get, args=('/slow',)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    while client.stats()['in_use'] < count:
+        time.sleep(0.001)
+    return threads
+
+
+def test_keep_alive_connections_are_reused(client, stub_server):
+    for _ in range(5):
+        assert client.get('/fast').json() == {"ok": True}
+    assert stub_server.connections == 1
+    assert client.idle_connections() == 1
+    stats = client.stats()
+    assert (stats['requests'], stats['in_use'], stats['waits'], stats['idle']) == (5, 0, 0, 1)
+
+
+def test_saturated_pool_waits_for_a_free_connection(client, stub_server):
+    threads = occupy(client, 2)
+    started = time.monotonic()
+    assert client.get('/fast').status_code == 200
+    # Servi dès qu'une connexion s'est libérée, sans en ouvrir une troisième
+    assert time.monotonic() - started >= 0.2
+    for thread in threads:
+        thread.join()
+    assert client.stats()['waits'] == 1
+    assert stub_server.connections == 2 and client.idle_connections() == 2
+
+
+def test_pool_wait_is_bounded_by_the_deadline(client, stub_server):
+    threads = occupy(client, 2)
+    token = deadline.start(0.05)
+    started = time.monotonic()
+    try:
+        with pytest.raises(deadline.DeadlineExceeded):
+            client.get('/fast')
+    finally:
+        deadline.end(token)
+    assert time.monotonic() - started < 0.2
+    for thread in threads:
+        thread.join()
+    assert client.stats()['waits'] == 1 and client.stats()['errors'] == 1
+    # Rien n'a été envoyé pour l'appel abandonné
+    assert [path for _, path, _ in stub_server.hits] == ['/slow', '/slow']
+
+
+def test_remaining_time_is_propagated(client, stub_server):
+    token = deadline.start(0.1)
+    try:
+        client.get('/fast')
+        started = time.monotonic()
+        # Timeout de lecture raccourci au temps restant (10 s par défaut)
+        with pytest.raises(requests.exceptions.Timeout):
+            client.get('/slow')
+        assert time.monotonic() - started < 0.25
+    finally:
+        deadline.end(token)
+    sent = int(stub_server.hits[0][2][deadline.DEADLINE_HEADER])
+    assert 0 < sent <= 100
+
+    token = deadline.start(0)
+    try:
+        with pytest.raises(deadline.DeadlineExceeded):
+            client.get('/fast')
+    finally:
+        deadline.end(token)
+    assert len(stub_server.hits) == 2
+
+
+def test_read_timeout_from_settings(stub_server):
+    stub_server.routes = {'/slow': (200, {}, {}, 0.3)}
+    client = UpstreamClient('test-timeout', stub_server.url, read_timeout=0.05)
+    with pytest.raises(requests.exceptions.Timeout):
+        client.get('/slow')
+    assert client.stats()['errors'] == 1 and client.stats()['in_use'] == 0
+    client.close()
@@ -0,0 +1,72 @@
+# tests/test_validation_batcher.py
+import threading
+
+import pytest
+
+from common.validation_batcher import ValidationBatcher
+
+
+def run_concurrently(fn, args):
+    results = {}
+
+    def call(arg):
+        try:
+            results[arg] = fn(arg)
+        except Exception as e:
+            results[arg] = e
+
+    threads = [threading.Thread(target=call, args=(arg,)) for arg in args]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_tokens_are_grouped_and_deduplicated():
+    calls = []
+
+    def send_batch(tokens):
+        calls.append(list(tokens))
+        return [{"status": "valid", "user": token} for token in tokens]
+
+    batcher = ValidationBatcher(send_batch, window=0.05)
+    start = threading.Barrier(4)
+
+    def validate(name):
+        start.wait()
+        return batcher.validate(name.split('#')[0])
+
+    results = run_concurrently(validate, ['a#1', 'a#2', 'b#1', 'c#1'])
+    assert {name: result['user'] for name, result in results.items()} == \
+        {'a#1': 'a', 'a#2': 'a', 'b#1': 'b', 'c#1': 'c'}
+    assert sum(len(tokens) for tokens in calls) == 3
+    assert batcher.stats()['coalesced'] == 1
+
+
+def test_batch_error_is_raised_to_every_waiter():
+    def send_batch(tokens):
+        raise ConnectionError("auth indisponible")
+
+    batcher = ValidationBatcher(send_batch, window=0.01)
+    results = run_concurrently(batcher.validate, ['a', 'b'])
+    assert all(isinstance(result, ConnectionError) for result in results.values())
+
+
+def test_incomplete_reply_is_an_error():
+    batcher = ValidationBatcher(lambda tokens: [], window=0)
+    with pytest.raises(ValueError):
+        batcher.validate('a')
+
+
+def test_timeout():
+    release = threading.Event()
+
+    def send_batch(tokens):
+        release.wait()
+        return [{"status": "valid", "user": "a"}]
+
+    batcher = ValidationBatcher(send_batch, window=0, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        batcher.validate('a')
+    release.set()